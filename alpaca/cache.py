@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+# Returned by TTLCache.get when the key is not cached, results may be None
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Least recently used cache whose entries expire `ttl` seconds after they were stored.
+
+    Attributes:
+        maxsize (int): Number of entries kept, the least recently used ones are evicted first.
+        ttl (float): Seconds an entry is served for.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups of missing or expired entries.
+        generation (int): Incremented by every invalidation, a value computed across one may be outdated.
+
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Returns the cached value of the key, MISSING when it is not cached or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, predicate: Callable = None) -> None:
+        """
+        Removes the entries whose key matches the predicate, all of them when there is none
+        """
+        with self.lock:
+            self.generation += 1
+            if predicate is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if predicate(key)]:
+                del self.entries[key]
@@ -1,11 +1,78 @@
+import asyncio
 import datetime
+import functools
+import itertools
 import json
+import math
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterator
 
-import pytz
 import requests
+from requests.adapters import HTTPAdapter
 
-from alpaca.entities import Account, Bar, Trade, EntityFactory
-from src.settings import APCA_API_KEY_ID, APCA_API_SECRET_KEY, APCA_API_BASE_URL
+from alpaca.cache import MISSING, TTLCache
+from alpaca.columnar import BarArchive
+from alpaca.entities import Account, Bar, BarBatch, Trade, Quote, EntityFactory
+from alpaca.ratelimit import (
+    AsyncRequestCoalescer,
+    RateLimiter,
+    RequestCoalescer,
+    request_priority,
+)
+from alpaca.store import BarStore, parse_timeframe
+from src.settings import (
+    APCA_API_KEY_ID,
+    APCA_API_SECRET_KEY,
+    APCA_API_BASE_URL,
+    APCA_API_DATA_URL,
+    API_RATE_LIMIT,
+    API_RATE_BURST,
+    API_RATE_RESERVE,
+    API_CACHE_SIZE,
+    API_CACHE_TTL,
+)
+
+if TYPE_CHECKING:
+    # aiohttp is only imported by the async client, when its session is created
+    import aiohttp
+
+
+def default_limiter() -> RateLimiter:
+    return RateLimiter(API_RATE_LIMIT / 60, API_RATE_BURST, API_RATE_RESERVE)
+
+
+@functools.lru_cache(maxsize=None)
+def market_timezone():
+    import pytz
+
+    return pytz.timezone("America/New_York")
+
+
+def coalescing_key(method: str, url: str, params: dict = None) -> str:
+    return f"{method} {url} {json.dumps(params or {}, sort_keys=True, default=str)}"
+
+
+class APIError(Exception):
+    """
+    Error response of the API.
+
+    Attributes:
+        status_code (int): The HTTP status of the response.
+        retry_after (float): Seconds to wait before retrying, when the API tells (429 responses).
+
+    """
+
+    def __init__(self, status_code: int, message: str, retry_after: float = None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code == 429 or self.status_code >= 500
 
 
 class AlpacaAPI:
@@ -14,27 +81,70 @@ class AlpacaAPI:
     def __init__(
         self,
         base_url: str = APCA_API_BASE_URL,
+        data_url: str = APCA_API_DATA_URL,
         key_id: str = APCA_API_KEY_ID,
         secret_key: str = APCA_API_SECRET_KEY,
+        store: BarStore = None,
+        pool_size: int = 4,
+        limiter: RateLimiter = None,
+        cache: TTLCache = None,
     ):
         self.base_url = base_url
-        self.data_url = "https://data.alpaca.markets/"
+        self.data_url = data_url.rstrip("/")
         self.stream_url = f"{self.base_url.replace('http', 'ws')}/stream/"
 
         self._key_id = key_id
         self._secret_key = secret_key
 
+        self.store = store
+        # Every request takes a token of the limiter, identical GETs in flight share one request
+        self.limiter = limiter if limiter is not None else default_limiter()
+        self.coalescer = RequestCoalescer()
+        # Bars and positions requested again within a few seconds are served from memory
+        self.cache = (
+            cache if cache is not None else TTLCache(API_CACHE_SIZE, API_CACHE_TTL)
+        )
+
         self.session = requests.Session()
+        # Bounded connection pool shared by the page prefetching and the concurrent chunk downloads
+        self.pool_size = pool_size
+        self.session.mount(
+            "https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="AlpacaAPI"
+        )
 
         self.session.headers.update(
             {"APCA-API-KEY-ID": self._key_id, "APCA-API-SECRET-KEY": self._secret_key}
         )
-        self.account = Account(**self.get_account())
-
-        self.tz = pytz.timezone("America/New_York")
+        # The account is fetched on first use, creating the client makes no request
+        self._account_future = None
+        self._account_lock = threading.Lock()
 
         self.crypto_symbols = ("BTCUSD", "BCHUSD", "ETHUSD", "LTCUSD")
 
+    @property
+    def tz(self):
+        return market_timezone()
+
+    def prefetch_account(self) -> Future:
+        """
+        Starts fetching the account in the background (e.g. while the stream connects), `account` waits for it. A
+        failed fetch is retried by the next call.
+        """
+        with self._account_lock:
+            future = self._account_future
+            if future is None or (future.done() and future.exception() is not None):
+                future = self._account_future = self.executor.submit(
+                    lambda: Account(**self.get_account())
+                )
+            return future
+
+    @property
+    def account(self) -> Account:
+        return self.prefetch_account().result()
+
     @property
     def end(self):
         return datetime.datetime.utcnow().astimezone(self.tz)
@@ -43,6 +153,59 @@ class AlpacaAPI:
     def start(self):
         return self.end - datetime.timedelta(hours=2)
 
+    @property
+    def remaining_budget(self) -> int:
+        """
+        Number of requests that can be made right away without exceeding the rate limit
+        """
+        return self.limiter.remaining
+
+    def _send(self, method: str, url: str, params: dict = None, json: dict = None):
+        self.limiter.acquire(request_priority(method, url, self.data_url))
+        if method == "GET":
+            response = self.session.get(url=url, params=params)
+        else:
+            response = self.session.post(url=url, json=json)
+        self.limiter.update(getattr(response, "headers", None))
+        return response.json()
+
+    def _request(self, method: str, url: str, params: dict = None, json: dict = None):
+        if method != "GET":
+            return self._send(method, url, params, json)
+        return self.coalescer.run(
+            coalescing_key(method, url, params), self._send, method, url, params
+        )
+
+    def _memoize(self, key: tuple, function, *args):
+        """
+        Returns the cached result of the call identified by the key, otherwise calls the function once for all the
+        concurrent callers and caches the result
+        """
+        value = self.cache.get(key)
+        if value is MISSING:
+            value = self.coalescer.run(key, self._call_and_cache, key, function, *args)
+        # Callers may modify the list they get, not the cached one
+        return list(value) if isinstance(value, list) else value
+
+    def _call_and_cache(self, key: tuple, function, *args):
+        generation = self.cache.generation
+        value = function(*args)
+        # A result fetched before an invalidation may already be outdated
+        if generation == self.cache.generation:
+            self.cache.set(key, value)
+        return value
+
+    def invalidate_cache(self, kind: str = None) -> None:
+        """
+        Drops the memoized results, e.g. the positions once an order was placed
+        Args:
+            kind: "bars" or "positions", None for both
+
+        Returns:
+            None
+        """
+        self.cache.invalidate(None if kind is None else lambda key: key[0] == kind)
+
     def _get_data_by_type(
         self,
         _type: str,
@@ -51,44 +214,150 @@ class AlpacaAPI:
         version: str = "v2",
         kind: str = "stocks",
     ):
-        response = self.session.get(
-            url=f"{self.data_url}/{version}/{kind}/{symbol}/{_type}", params=params
-        ).json()
+        response = self._request(
+            "GET", f"{self.data_url}/{version}/{kind}/{symbol}/{_type}", params
+        )
         try:
             return response[_type]
         except KeyError:
             # For snapshots, the response is a single object
             return response
 
+    def _get_page_by_type(
+        self,
+        _type: str,
+        symbol: str,
+        params: dict,
+        version: str = "v2",
+        kind: str = "stocks",
+    ) -> tuple[list, str]:
+        response = self._request(
+            "GET", f"{self.data_url}/{version}/{kind}/{symbol}/{_type}", params
+        )
+        # Empty pages are returned as null
+        return response.get(_type) or [], response.get("next_page_token")
+
+    def _iter_pages_by_type(
+        self,
+        _type: str,
+        symbol: str,
+        params: dict,
+        version: str = "v2",
+        kind: str = "stocks",
+        prefetch: bool = True,
+    ) -> Iterator[list]:
+        """
+        Yields the pages of a data endpoint following the next_page_token
+        Args:
+            _type: The type of data (bars, trades, quotes)
+            symbol: The symbol to retrieve data for
+            params: The query parameters
+            version: The API version
+            kind: stocks or crypto
+            prefetch: Whether to request the next page while the current one is consumed
+
+        Returns:
+            An iterator over the pages
+        """
+        if not prefetch:
+            while True:
+                page, page_token = self._get_page_by_type(
+                    _type, symbol, params, version, kind
+                )
+                yield page
+                if not page_token:
+                    return
+                params = {**params, "page_token": page_token}
+
+        future = self.executor.submit(
+            self._get_page_by_type, _type, symbol, params, version, kind
+        )
+        while future is not None:
+            page, page_token = future.result()
+            if page_token:
+                params = {**params, "page_token": page_token}
+                future = self.executor.submit(
+                    self._get_page_by_type, _type, symbol, params, version, kind
+                )
+            else:
+                future = None
+            yield page
+
+    def _iter_data_by_type(
+        self,
+        _type: str,
+        symbol: str,
+        params: dict,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        chunk_size: datetime.timedelta = None,
+        version: str = "v2",
+        kind: str = "stocks",
+    ) -> Iterator[list]:
+        """
+        Yields the entries of a data endpoint between start and end, in order, one page (or chunk) at a time.
+
+        When a chunk size is given, the time range is split into chunks that are downloaded concurrently (at most
+        `pool_size` at once), otherwise the pages are followed one after the other while prefetching the next one.
+        """
+        if chunk_size is None:
+            params = {**params, "start": start.isoformat(), "end": end.isoformat()}
+            yield from self._iter_pages_by_type(_type, symbol, params, version, kind)
+            return
+
+        def fetch_chunk(chunk_params: dict) -> list:
+            return list(
+                itertools.chain.from_iterable(
+                    self._iter_pages_by_type(
+                        _type, symbol, chunk_params, version, kind, prefetch=False
+                    )
+                )
+            )
+
+        pending = deque()
+        for chunk_start, chunk_end in split_time_range(start, end, chunk_size):
+            chunk_params = {
+                **params,
+                "start": chunk_start.isoformat(),
+                "end": chunk_end.isoformat(),
+                "page_token": None,
+            }
+            pending.append(self.executor.submit(fetch_chunk, chunk_params))
+            if len(pending) >= self.pool_size:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
     def _get_last_data_by_type(
         self, _type: str, symbol: str, version: str = "v2", kind: str = "stocks"
     ):
-        return self.session.get(
-            url=f"{self.data_url}/{version}/{kind}/{symbol}/{_type}/latest"
-        ).json()
+        return self._request(
+            "GET", f"{self.data_url}/{version}/{kind}/{symbol}/{_type}/latest"
+        )
 
     def get_account(self, version: str = "v2"):
-        return self.session.get(url=f"{self.base_url}/{version}/account").json()
+        return self._request("GET", f"{self.base_url}/{version}/account")
 
     def get_order(self, order_id: str, version: str = "v2"):
-        orders = self.session.get(
-            url=f"{self.base_url}/{version}/orders/{order_id}"
-        ).json()
+        orders = self._request("GET", f"{self.base_url}/{version}/orders/{order_id}")
         return self.EntityFactory(orders).create_entity("orders")
 
     def get_orders(self, version: str = "v2"):
-        orders = self.session.get(url=f"{self.base_url}/{version}/orders").json()
+        orders = self._request("GET", f"{self.base_url}/{version}/orders")
         return [self.EntityFactory(order).create_entity("orders") for order in orders]
 
     def get_positions(self, symbol: str = None, version: str = "v2"):
+        return self._memoize(
+            ("positions", symbol, version), self._get_positions, symbol, version
+        )
+
+    def _get_positions(self, symbol: str = None, version: str = "v2"):
         if not symbol:
-            positions = self.session.get(
-                url=f"{self.base_url}/{version}/positions"
-            ).json()
+            positions = self._request("GET", f"{self.base_url}/{version}/positions")
         else:
-            positions = self.session.get(
-                url=f"{self.base_url}/{version}/positions/{symbol}"
-            ).json()
+            positions = self._request(
+                "GET", f"{self.base_url}/{version}/positions/{symbol}"
+            )
 
         if isinstance(positions, list):
             return [
@@ -109,32 +378,208 @@ class AlpacaAPI:
         page_token: str = None,
         crypto: bool = False,
         exchanges: str = None,
+        chunk_size: datetime.timedelta = None,
+    ) -> list[Bar]:
+        # The default window moves on every call, aligned on the bars it matches the calls made during the same bar
+        start, end = align_time_range(start or self.start, end or self.end, timeframe)
+        key = (
+            "bars",
+            symbol,
+            timeframe,
+            start,
+            end,
+            limit,
+            adjustment,
+            page_token,
+            crypto,
+            tuple(exchanges) if isinstance(exchanges, list) else exchanges,
+            chunk_size,
+        )
+        return self._memoize(
+            key,
+            self._get_bars,
+            symbol,
+            timeframe,
+            start,
+            end,
+            limit,
+            adjustment,
+            page_token,
+            crypto,
+            exchanges,
+            chunk_size,
+        )
+
+    def _get_bars(
+        self,
+        symbol: str,
+        timeframe: str,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        limit: int,
+        adjustment: str,
+        page_token: str,
+        crypto: bool,
+        exchanges: str,
+        chunk_size: datetime.timedelta,
     ) -> list[Bar]:
+        if self.store is None or page_token or adjustment != "raw":
+            return list(
+                self.iter_bars(
+                    symbol,
+                    timeframe,
+                    start,
+                    end,
+                    limit,
+                    adjustment,
+                    page_token,
+                    crypto,
+                    exchanges,
+                    chunk_size,
+                )
+            )
+
+        # Only the exchanges of crypto bars are known, stock bars are stored without one
+        store_exchanges = exchanges if crypto else None
+        for missing_start, missing_end in self.store.missing(
+            symbol, timeframe, store_exchanges, start, end
+        ):
+            bars = list(
+                self.iter_bars(
+                    symbol,
+                    timeframe,
+                    missing_start,
+                    missing_end,
+                    limit,
+                    adjustment,
+                    crypto=crypto,
+                    exchanges=exchanges,
+                    chunk_size=chunk_size,
+                )
+            )
+            self.store.extend(bars, timeframe)
+            # The most recent bar may still be open, so it is not marked as complete
+            settled = datetime.datetime.now(datetime.timezone.utc) - parse_timeframe(
+                timeframe
+            )
+            self.store.add_coverage(
+                symbol,
+                timeframe,
+                store_exchanges,
+                missing_start,
+                min(missing_end, settled),
+            )
+        return self.store.query(symbol, timeframe, store_exchanges, start, end)
+
+    def iter_bars(
+        self,
+        symbol: str,
+        timeframe: str = "1Min",
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        limit: int = 1000,
+        adjustment: str = "raw",
+        page_token: str = None,
+        crypto: bool = False,
+        exchanges: str = None,
+        chunk_size: datetime.timedelta = None,
+    ) -> Iterator[Bar]:
+        """
+        Streams the bars between start and end, following the page tokens
+        Args:
+            symbol: The symbol to retrieve bars for
+            timeframe: The timeframe of the bars
+            start: The start of the range, defaults to two hours ago
+            end: The end of the range, defaults to now
+            limit: The page size
+            adjustment: The corporate actions adjustment (stocks only)
+            page_token: The page to start from (ignored when chunk_size is given)
+            crypto: Whether to retrieve crypto bars
+            exchanges: The crypto exchanges to retrieve bars for
+            chunk_size: Split the range in chunks of this size, downloaded concurrently
+
+        Returns:
+            An iterator over the bars
+        """
         if not end:
             end = self.end
         if not start:
             start = self.start
 
-        params = {
-            "timeframe": timeframe,
-            "start": start.isoformat(),
-            "end": end.isoformat(),
-            "limit": limit,
-            "page_token": page_token,
-        }
+        params, version, kind = self._bars_params(
+            timeframe, limit, adjustment, page_token, crypto, exchanges
+        )
+        for page in self._iter_data_by_type(
+            "bars", symbol, params, start, end, chunk_size, version, kind
+        ):
+            for bar in page:
+                bar["symbol"] = symbol
+            yield from self.EntityFactory.create_entities(page, "bars")
 
-        if not crypto:
-            params["adjustment"] = adjustment
-            bars = self._get_data_by_type("bars", symbol, params)
-        else:
-            params["exchanges"] = exchanges
-            bars = self._get_data_by_type(
-                "bars", symbol, params, version="v1beta1", kind="crypto"
+    def get_bar_batch(
+        self,
+        symbol: str,
+        timeframe: str = "1Min",
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        limit: int = 1000,
+        adjustment: str = "raw",
+        crypto: bool = False,
+        exchanges: str = None,
+        chunk_size: datetime.timedelta = None,
+    ) -> BarBatch:
+        """
+        Retrieves the bars between start and end as a columnar BarBatch (see iter_bars for the arguments).
+
+        The API records are parsed straight into the batch columns, without creating a Bar per row, unless a bar
+        store is configured, in which case the bars are served through get_bars.
+        """
+        if self.store is not None and adjustment == "raw":
+            bars = self.get_bars(
+                symbol,
+                timeframe,
+                start,
+                end,
+                limit,
+                adjustment,
+                crypto=crypto,
+                exchanges=exchanges,
+                chunk_size=chunk_size,
             )
+            return BarBatch.from_bars(bars, symbol)
 
-        for bar in bars:
-            bar["symbol"] = symbol
-        return [self.EntityFactory(bar).create_entity("bars") for bar in bars]
+        if not end:
+            end = self.end
+        if not start:
+            start = self.start
+
+        params, version, kind = self._bars_params(
+            timeframe, limit, adjustment, None, crypto, exchanges
+        )
+        records = list(
+            itertools.chain.from_iterable(
+                self._iter_data_by_type(
+                    "bars", symbol, params, start, end, chunk_size, version, kind
+                )
+            )
+        )
+        return BarBatch.from_records(records, symbol)
+
+    @staticmethod
+    def _bars_params(
+        timeframe: str,
+        limit: int,
+        adjustment: str,
+        page_token: str,
+        crypto: bool,
+        exchanges: str,
+    ) -> tuple[dict, str, str]:
+        params = {"timeframe": timeframe, "limit": limit, "page_token": page_token}
+        if not crypto:
+            params["adjustment"] = adjustment
+            return params, "v2", "stocks"
+        params["exchanges"] = exchanges
+        return params, "v1beta1", "crypto"
 
     def get_trades(
         self,
@@ -143,23 +588,34 @@ class AlpacaAPI:
         end: str = None,
         limit: int = 1000,
         page_token: str = None,
+        chunk_size: datetime.timedelta = None,
     ) -> list[Trade]:
+        return list(self.iter_trades(symbol, start, end, limit, page_token, chunk_size))
+
+    def iter_trades(
+        self,
+        symbol: str,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        limit: int = 1000,
+        page_token: str = None,
+        chunk_size: datetime.timedelta = None,
+    ) -> Iterator[Trade]:
+        """
+        Streams the trades between start and end, following the page tokens (see iter_bars)
+        """
         if not end:
             end = self.end
         if not start:
             start = self.start
 
-        params = {
-            "start": start.isoformat(),
-            "end": end.isoformat(),
-            "limit": limit,
-            "page_token": page_token,
-        }
-        trades = self._get_data_by_type("trades", symbol, params)
-        for trade in trades:
-            trade["symbol"] = symbol
-
-        return [self.EntityFactory(trade).create_entity("trades") for trade in trades]
+        params = {"limit": limit, "page_token": page_token}
+        for page in self._iter_data_by_type(
+            "trades", symbol, params, start, end, chunk_size
+        ):
+            for trade in page:
+                trade["symbol"] = symbol
+            yield from self.EntityFactory.create_entities(page, "trades")
 
     def get_quotes(
         self,
@@ -168,26 +624,35 @@ class AlpacaAPI:
         end: str = None,
         limit: int = 1000,
         page_token: str = None,
-    ):
+        chunk_size: datetime.timedelta = None,
+    ) -> list[Quote]:
+        return list(self.iter_quotes(symbol, start, end, limit, page_token, chunk_size))
+
+    def iter_quotes(
+        self,
+        symbol: str,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        limit: int = 1000,
+        page_token: str = None,
+        chunk_size: datetime.timedelta = None,
+    ) -> Iterator[Quote]:
+        """
+        Streams the quotes between start and end, following the page tokens (see iter_bars)
+        """
         if not end:
             end = self.end
         if not start:
             start = self.start
 
-        params = {
-            "start": start.isoformat(),
-            "end": end.isoformat(),
-            "limit": limit,
-            "page_token": page_token,
-        }
-
-        quotes = self._get_data_by_type("quotes", symbol, params)
-        for quote in quotes:
-            quote["as_"] = quote["as"]
-            quote.pop("as")
-            quote["symbol"] = symbol
-
-        return [self.EntityFactory(quote).create_entity("quotes") for quote in quotes]
+        params = {"limit": limit, "page_token": page_token}
+        for page in self._iter_data_by_type(
+            "quotes", symbol, params, start, end, chunk_size
+        ):
+            for quote in page:
+                quote["as_"] = quote.pop("as")
+                quote["symbol"] = symbol
+            yield from self.EntityFactory.create_entities(page, "quotes")
 
     def get_last_bar(self, symbol: str):
         bar = self._get_last_data_by_type("bars", symbol)["bar"]
@@ -228,51 +693,523 @@ class AlpacaAPI:
         notional: float = None,
         version: str = "v2",
     ):
+        params = order_params(
+            symbol,
+            qty,
+            side,
+            type,
+            time_in_force,
+            limit_price,
+            stop_price,
+            client_order_id,
+            extended_hours,
+            order_class,
+            take_profit,
+            stop_loss,
+            trail_price,
+            trail_percent,
+            notional,
+        )
+
+        order = self._request("POST", f"{self.base_url}/{version}/orders", json=params)
+        self.invalidate_cache("positions")
+
+        return self.EntityFactory(order).create_entity("orders")
+
+
+class AsyncAlpacaAPI:
+    """
+    asyncio counterpart of AlpacaAPI, exposing the same methods as coroutines.
+
+    Requests go through a single aiohttp session with a keep-alive connection pool, so independent calls can be
+    awaited concurrently (e.g. with asyncio.gather). The session lives on the event loop of the given Stream once it
+    is running, otherwise on a private loop started in a background thread. Synchronous code (like the Dispatcher
+    thread) can use `run` and `gather` to execute coroutines on that loop and wait for the result.
+    """
+
+    EntityFactory = EntityFactory
+
+    def __init__(
+        self,
+        base_url: str = APCA_API_BASE_URL,
+        data_url: str = APCA_API_DATA_URL,
+        key_id: str = APCA_API_KEY_ID,
+        secret_key: str = APCA_API_SECRET_KEY,
+        pool_size: int = 10,
+        stream=None,
+        limiter: RateLimiter = None,
+        cache: TTLCache = None,
+    ):
+        self.base_url = base_url
+        self.data_url = data_url.rstrip("/")
+
+        self._key_id = key_id
+        self._secret_key = secret_key
+
+        self.pool_size = pool_size
+        self.stream = stream
+        # Share the limiter of the AlpacaAPI, both clients spend the same budget
+        self.limiter = limiter if limiter is not None else default_limiter()
+        # The memoized results of the AlpacaAPI, if shared: orders placed here invalidate its positions
+        self.cache = cache
+        self.coalescer = AsyncRequestCoalescer()
+        self.session = None
+        self.account = None
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def tz(self):
+        return market_timezone()
+
+    @property
+    def end(self):
+        return datetime.datetime.utcnow().astimezone(self.tz)
+
+    @property
+    def start(self):
+        return self.end - datetime.timedelta(hours=2)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                stream_loop = getattr(self.stream, "_loop", None)
+                if stream_loop is not None and stream_loop.is_running():
+                    self._loop = stream_loop
+                else:
+                    self._loop = asyncio.new_event_loop()
+                    threading.Thread(
+                        name="AsyncAlpacaAPI",
+                        target=self._loop.run_forever,
+                        daemon=True,
+                    ).start()
+            return self._loop
+
+    def run(self, coroutine, timeout: float = None):
+        """
+        Runs a coroutine on the client loop and waits for its result, to be called from another thread
+        Args:
+            coroutine: The coroutine to run
+            timeout: Seconds to wait for the result
+
+        Returns:
+            The result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def gather(self, *coroutines, timeout: float = None) -> list:
+        """
+        Runs coroutines concurrently on the client loop and waits for all their results (see run)
+        """
+
+        async def _gather():
+            return await asyncio.gather(*coroutines)
+
+        return self.run(_gather(), timeout)
+
+    async def _session(self) -> "aiohttp.ClientSession":
+        if self.session is None or self.session.closed:
+            import aiohttp
+
+            self.session = aiohttp.ClientSession(
+                headers={
+                    "APCA-API-KEY-ID": self._key_id,
+                    "APCA-API-SECRET-KEY": self._secret_key,
+                },
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size, keepalive_timeout=30
+                ),
+            )
+        return self.session
+
+    @staticmethod
+    def _params(params: dict) -> dict:
+        # aiohttp only accepts strings and numbers as query parameters
+        cleaned = {}
+        for key, value in params.items():
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple)):
+                value = ",".join(value)
+            elif isinstance(value, bool):
+                value = str(value).lower()
+            elif isinstance(value, datetime.datetime):
+                value = value.isoformat()
+            cleaned[key] = value
+        return cleaned
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        params: dict = None,
+        json=None,
+        raise_for_status: bool = False,
+    ):
+        if method != "GET":
+            return await self._send(method, url, params, json, raise_for_status)
+        return await self.coalescer.run(
+            coalescing_key(method, url, params),
+            self._send,
+            method,
+            url,
+            params,
+            json,
+            raise_for_status,
+        )
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        params: dict = None,
+        json=None,
+        raise_for_status: bool = False,
+    ):
+        await self.limiter.acquire_async(request_priority(method, url, self.data_url))
+        session = await self._session()
+        async with session.request(
+            method, url, params=self._params(params or {}), json=json
+        ) as response:
+            self.limiter.update(response.headers)
+            if raise_for_status and response.status >= 400:
+                retry_after = response.headers.get("Retry-After")
+                raise APIError(
+                    response.status,
+                    await response.text(),
+                    float(retry_after) if retry_after else None,
+                )
+            return await response.json(content_type=None)
+
+    async def _get_data_by_type(
+        self,
+        _type: str,
+        symbol: str,
+        params: dict,
+        version: str = "v2",
+        kind: str = "stocks",
+    ) -> list:
+        entries = []
+        while True:
+            response = await self._request(
+                "GET", f"{self.data_url}/{version}/{kind}/{symbol}/{_type}", params
+            )
+            if _type not in response:
+                # For snapshots, the response is a single object
+                return response
+            entries.extend(response[_type] or [])
+            if not response.get("next_page_token"):
+                return entries
+            params = {**params, "page_token": response["next_page_token"]}
+
+    async def _get_last_data_by_type(
+        self, _type: str, symbol: str, version: str = "v2", kind: str = "stocks"
+    ):
+        return await self._request(
+            "GET", f"{self.data_url}/{version}/{kind}/{symbol}/{_type}/latest"
+        )
+
+    async def get_account(self, version: str = "v2"):
+        account = await self._request("GET", f"{self.base_url}/{version}/account")
+        self.account = Account(**account)
+        return account
+
+    async def get_order(self, order_id: str, version: str = "v2"):
+        order = await self._request(
+            "GET", f"{self.base_url}/{version}/orders/{order_id}"
+        )
+        return self.EntityFactory(order).create_entity("orders")
+
+    async def get_orders(self, version: str = "v2"):
+        orders = await self._request("GET", f"{self.base_url}/{version}/orders")
+        return [self.EntityFactory(order).create_entity("orders") for order in orders]
+
+    async def get_order_by_client_id(self, client_order_id: str, version: str = "v2"):
+        order = await self._request(
+            "GET",
+            f"{self.base_url}/{version}/orders:by_client_order_id",
+            {"client_order_id": client_order_id},
+            raise_for_status=True,
+        )
+        return self.EntityFactory(order).create_entity("orders")
+
+    async def get_positions(self, symbol: str = None, version: str = "v2"):
+        if not symbol:
+            url = f"{self.base_url}/{version}/positions"
+        else:
+            url = f"{self.base_url}/{version}/positions/{symbol}"
+        positions = await self._request("GET", url)
+
+        if isinstance(positions, list):
+            return [
+                self.EntityFactory(position).create_entity("positions")
+                for position in positions
+            ]
+        else:
+            return self.EntityFactory(positions).create_entity("positions")
+
+    async def get_bars(
+        self,
+        symbol: str,
+        timeframe: str = "1Min",
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        limit: int = 1000,
+        adjustment: str = "raw",
+        page_token: str = None,
+        crypto: bool = False,
+        exchanges: str = None,
+    ) -> list[Bar]:
         params = {
-            "symbol": symbol,
-            "side": side,
-            "type": type,
-            "time_in_force": time_in_force,
+            "timeframe": timeframe,
+            "start": start or self.start,
+            "end": end or self.end,
+            "limit": limit,
+            "page_token": page_token,
+        }
+
+        if not crypto:
+            params["adjustment"] = adjustment
+            bars = await self._get_data_by_type("bars", symbol, params)
+        else:
+            params["exchanges"] = exchanges
+            bars = await self._get_data_by_type(
+                "bars", symbol, params, version="v1beta1", kind="crypto"
+            )
+
+        for bar in bars:
+            bar["symbol"] = symbol
+        return self.EntityFactory.create_entities(bars, "bars")
+
+    async def get_trades(
+        self,
+        symbol: str,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        limit: int = 1000,
+        page_token: str = None,
+    ) -> list[Trade]:
+        params = {
+            "start": start or self.start,
+            "end": end or self.end,
+            "limit": limit,
+            "page_token": page_token,
+        }
+        trades = await self._get_data_by_type("trades", symbol, params)
+        for trade in trades:
+            trade["symbol"] = symbol
+
+        return self.EntityFactory.create_entities(trades, "trades")
+
+    async def get_quotes(
+        self,
+        symbol: str,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        limit: int = 1000,
+        page_token: str = None,
+    ) -> list[Quote]:
+        params = {
+            "start": start or self.start,
+            "end": end or self.end,
+            "limit": limit,
+            "page_token": page_token,
         }
-        if qty is not None:
-            params["qty"] = qty
-        if notional is not None:
-            params["notional"] = notional
-        if limit_price is not None:
-            params["limit_price"] = float(limit_price)
-        if stop_price is not None:
-            params["stop_price"] = float(stop_price)
-        if client_order_id is not None:
-            params["client_order_id"] = client_order_id
-        if extended_hours is not None:
-            params["extended_hours"] = extended_hours
-        if order_class is not None:
-            params["order_class"] = order_class
-        if take_profit is not None:
-            if "limit_price" in take_profit:
-                take_profit["limit_price"] = float(take_profit["limit_price"])
-            params["take_profit"] = take_profit
-        if stop_loss is not None:
-            if "limit_price" in stop_loss:
-                stop_loss["limit_price"] = float(stop_loss["limit_price"])
-            if "stop_price" in stop_loss:
-                stop_loss["stop_price"] = float(stop_loss["stop_price"])
-            params["stop_loss"] = stop_loss
-        if trail_price is not None:
-            params["trail_price"] = trail_price
-        if trail_percent is not None:
-            params["trail_percent"] = trail_percent
-
-        order = self.session.post(
-            url=f"{self.base_url}/{version}/orders", json=params
-        ).json()
+        quotes = await self._get_data_by_type("quotes", symbol, params)
+        for quote in quotes:
+            quote["as_"] = quote.pop("as")
+            quote["symbol"] = symbol
+
+        return self.EntityFactory.create_entities(quotes, "quotes")
 
+    async def get_last_bar(self, symbol: str):
+        bar = (await self._get_last_data_by_type("bars", symbol))["bar"]
+        bar["symbol"] = symbol
+        return self.EntityFactory(bar).create_entity("bars")
+
+    async def get_last_trade(self, symbol: str):
+        trade = (await self._get_last_data_by_type("trades", symbol))["trade"]
+        trade["symbol"] = symbol
+        return self.EntityFactory(trade).create_entity("trades")
+
+    async def get_last_quote(self, symbol: str):
+        quote = (await self._get_last_data_by_type("quotes", symbol))["quote"]
+        quote["as_"] = quote.pop("as")
+        quote["symbol"] = symbol
+        return self.EntityFactory(quote).create_entity("quotes")
+
+    async def get_snapshot(self, symbol: str):
+        return await self._get_data_by_type("snapshot", symbol, {})
+
+    async def place_order(
+        self,
+        symbol: str,
+        qty: float = None,
+        side: str = "buy",
+        type: str = "market",
+        time_in_force: str = "day",
+        limit_price: str = None,
+        stop_price: str = None,
+        client_order_id: str = None,
+        extended_hours: bool = None,
+        order_class: str = None,
+        take_profit: dict = None,
+        stop_loss: dict = None,
+        trail_price: str = None,
+        trail_percent: str = None,
+        notional: float = None,
+        version: str = "v2",
+    ):
+        params = order_params(
+            symbol,
+            qty,
+            side,
+            type,
+            time_in_force,
+            limit_price,
+            stop_price,
+            client_order_id,
+            extended_hours,
+            order_class,
+            take_profit,
+            stop_loss,
+            trail_price,
+            trail_percent,
+            notional,
+        )
+        # Errors are raised (see APIError) so that the caller can tell which ones are worth a retry
+        order = await self._request(
+            "POST",
+            f"{self.base_url}/{version}/orders",
+            json=params,
+            raise_for_status=True,
+        )
+        if self.cache is not None:
+            self.cache.invalidate(lambda key: key[0] == "positions")
         return self.EntityFactory(order).create_entity("orders")
 
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+
+
+def order_params(
+    symbol: str,
+    qty: float = None,
+    side: str = "buy",
+    type: str = "market",
+    time_in_force: str = "day",
+    limit_price: str = None,
+    stop_price: str = None,
+    client_order_id: str = None,
+    extended_hours: bool = None,
+    order_class: str = None,
+    take_profit: dict = None,
+    stop_loss: dict = None,
+    trail_price: str = None,
+    trail_percent: str = None,
+    notional: float = None,
+) -> dict:
+    """
+    Builds the body of an order request, leaving out the parameters that are not set
+    """
+    params = {
+        "symbol": symbol,
+        "side": side,
+        "type": type,
+        "time_in_force": time_in_force,
+    }
+    if qty is not None:
+        params["qty"] = qty
+    if notional is not None:
+        params["notional"] = notional
+    if limit_price is not None:
+        params["limit_price"] = float(limit_price)
+    if stop_price is not None:
+        params["stop_price"] = float(stop_price)
+    if client_order_id is not None:
+        params["client_order_id"] = client_order_id
+    if extended_hours is not None:
+        params["extended_hours"] = extended_hours
+    if order_class is not None:
+        params["order_class"] = order_class
+    if take_profit is not None:
+        if "limit_price" in take_profit:
+            take_profit["limit_price"] = float(take_profit["limit_price"])
+        params["take_profit"] = take_profit
+    if stop_loss is not None:
+        if "limit_price" in stop_loss:
+            stop_loss["limit_price"] = float(stop_loss["limit_price"])
+        if "stop_price" in stop_loss:
+            stop_loss["stop_price"] = float(stop_loss["stop_price"])
+        params["stop_loss"] = stop_loss
+    if trail_price is not None:
+        params["trail_price"] = trail_price
+    if trail_percent is not None:
+        params["trail_percent"] = trail_percent
+    return params
+
+
+def align_time_range(
+    start: datetime.datetime, end: datetime.datetime, timeframe: str
+) -> tuple[datetime.datetime, datetime.datetime]:
+    """
+    Rounds [start, end] inwards to the bar boundaries of the timeframe, which selects the same bars (bars are
+    timestamped at their start and both bounds are inclusive). Daily and longer bars follow the exchange calendar
+    rather than UTC, their ranges are returned unchanged.
+    Args:
+        start: The start of the range
+        end: The end of the range
+        timeframe: The timeframe of the bars
+
+    Returns:
+        The aligned (start, end)
+    """
+    try:
+        step = parse_timeframe(timeframe).total_seconds()
+    except ValueError:
+        return start, end
+    if (
+        step >= 86400
+        or not isinstance(start, datetime.datetime)
+        or not isinstance(end, datetime.datetime)
+        or start.tzinfo is None
+        or end.tzinfo is None
+    ):
+        return start, end
+    start = datetime.datetime.fromtimestamp(
+        math.ceil(start.timestamp() / step) * step, start.tzinfo
+    )
+    end = datetime.datetime.fromtimestamp(
+        math.floor(end.timestamp() / step) * step, end.tzinfo
+    )
+    return start, end
+
+
+def split_time_range(
+    start: datetime.datetime, end: datetime.datetime, chunk_size: datetime.timedelta
+) -> Iterator[tuple[datetime.datetime, datetime.datetime]]:
+    """
+    Splits [start, end] into consecutive chunks that do not overlap (the API treats both bounds as inclusive)
+    Args:
+        start: The start of the range
+        end: The end of the range
+        chunk_size: The size of a chunk
+
+    Returns:
+        An iterator over the (start, end) chunks
+    """
+    chunk_start = start
+    while chunk_start + chunk_size < end:
+        next_start = chunk_start + chunk_size
+        yield chunk_start, next_start - datetime.timedelta(microseconds=1)
+        chunk_start = next_start
+    yield chunk_start, end
+
 
 if __name__ == "__main__":
     api = AlpacaAPI(key_id=APCA_API_KEY_ID, secret_key=APCA_API_SECRET_KEY)
-    bars = api.get_bars("BTCUSD", "1Min", exchanges=None, crypto=True)
-    bars = [bar.to_dict() for bar in bars]
-    json.dump(bars, open("../data/bars.json", "w"))
-
+    batch = api.get_bar_batch("BTCUSD", "1Min", exchanges=None, crypto=True)
+    # Columnar files, read back with BarArchive("../data/bars").read("BTCUSD")
+    BarArchive("../data/bars").write(batch)
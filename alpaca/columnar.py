@@ -0,0 +1,219 @@
+import datetime
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from alpaca.entities import BarBatch
+from alpaca.timestamps import to_nanoseconds, to_nanoseconds_array
+from src.settings import APP_NAME
+
+logger = logging.getLogger(APP_NAME)
+
+# Fixed width record of a bar, little endian so that the files can be copied between machines. The exchange is kept
+# as unicode, which BarBatch can view without decoding it
+bar_dtype = np.dtype(
+    [
+        ("timestamp", "<i8"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<f8"),
+        ("num_trades", "<i8"),
+        ("vwap", "<f8"),
+        ("exchange", "<U8"),
+    ]
+)
+NANOSECONDS_PER_DAY = 86_400 * 10**9
+
+
+def to_records(batch: BarBatch) -> np.ndarray:
+    records = np.empty(len(batch), dtype=bar_dtype)
+    for field in bar_dtype.names:
+        records[field] = getattr(batch, field)
+    return records
+
+
+def from_records(records: np.ndarray, symbol: str) -> BarBatch:
+    """
+    Wraps records in a BarBatch, the numeric columns are views of the records (of the memory map when they were read
+    from a file)
+    """
+    return BarBatch(
+        symbol,
+        *(records[field] for field in bar_dtype.names),
+    )
+
+
+class BarArchive:
+    """
+    Columnar bar files, one file of fixed width records (see bar_dtype) per symbol and UTC day.
+
+    The files are .npy files: `read` memory maps them and returns BarBatch columns viewing the mapped records, so
+    loading a range costs a binary search per day rather than parsing a row per bar. Records are sorted by timestamp
+    then exchange; writing bars to a day that already has a file merges them, a bar replacing the one with the same
+    timestamp and exchange.
+
+    Layout: <path>/<symbol>/<YYYY-MM-DD>.npy
+
+    Attributes:
+        path (Path): The root directory.
+
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def symbol_path(self, symbol: str) -> Path:
+        return self.path / symbol.replace("/", "-")
+
+    def day_path(self, symbol: str, day: datetime.date) -> Path:
+        return self.symbol_path(symbol) / f"{day.isoformat()}.npy"
+
+    def symbols(self) -> list[str]:
+        if not self.path.exists():
+            return []
+        return sorted(path.name for path in self.path.iterdir() if path.is_dir())
+
+    def days(self, symbol: str) -> list[datetime.date]:
+        path = self.symbol_path(symbol)
+        if not path.exists():
+            return []
+        return sorted(
+            datetime.date.fromisoformat(file.stem) for file in path.glob("*.npy")
+        )
+
+    def records(self, symbol: str, day: datetime.date) -> np.ndarray:
+        """
+        Memory maps the records of a day, an empty array when there is no file
+        """
+        path = self.day_path(symbol, day)
+        if not path.exists():
+            return np.empty(0, dtype=bar_dtype)
+        return np.load(path, mmap_mode="r")
+
+    def write(self, batch: BarBatch) -> int:
+        """
+        Writes the bars of a batch, merged with the bars already stored for the same days
+        Args:
+            batch: The bars of a single symbol
+
+        Returns:
+            The number of days written
+        """
+        records = to_records(batch)
+        days = records["timestamp"] // NANOSECONDS_PER_DAY
+        self.symbol_path(batch.symbol).mkdir(parents=True, exist_ok=True)
+        for day_number in np.unique(days):
+            day = datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day_number))
+            # The new bars come first so that they win over the stored ones when deduplicating
+            merged = np.concatenate(
+                [records[days == day_number], self.records(batch.symbol, day)]
+            )
+            # lexsort is stable, the first of equal bars is the new one
+            merged = merged[np.lexsort((merged["exchange"], merged["timestamp"]))]
+            timestamps, exchanges = merged["timestamp"], merged["exchange"]
+            keep = np.ones(len(merged), dtype=bool)
+            keep[1:] = (timestamps[1:] != timestamps[:-1]) | (
+                exchanges[1:] != exchanges[:-1]
+            )
+            merged = merged[keep]
+
+            path = self.day_path(batch.symbol, day)
+            temporary = path.with_name(f"{path.name}.tmp")
+            with open(temporary, "wb") as file:
+                np.save(file, merged)
+            # Readers never see a partially written file
+            os.replace(temporary, path)
+        return len(np.unique(days))
+
+    def read(
+        self,
+        symbol: str,
+        start: Union[datetime.datetime, str, int] = None,
+        end: Union[datetime.datetime, str, int] = None,
+        exchange: str = None,
+    ) -> BarBatch:
+        """
+        Reads the bars of a symbol between start and end (both inclusive)
+        Args:
+            symbol: The symbol to read
+            start: The start of the range, defaults to the first stored bar
+            end: The end of the range, defaults to the last stored bar
+            exchange: Keep only the bars of this exchange
+
+        Returns:
+            The bars, sorted by timestamp
+        """
+        start = None if start is None else to_nanoseconds(start)
+        end = None if end is None else to_nanoseconds(end)
+        chunks = []
+        for day in self.days(symbol):
+            day_start = (day - datetime.date(1970, 1, 1)).days * NANOSECONDS_PER_DAY
+            if (start is not None and day_start + NANOSECONDS_PER_DAY <= start) or (
+                end is not None and day_start > end
+            ):
+                continue
+            records = self.records(symbol, day)
+            timestamps = records["timestamp"]
+            lower = 0 if start is None else np.searchsorted(timestamps, start, "left")
+            upper = (
+                len(records)
+                if end is None
+                else np.searchsorted(timestamps, end, "right")
+            )
+            records = records[lower:upper]
+            if exchange is not None:
+                records = records[records["exchange"] == exchange]
+            chunks.append(records)
+
+        if not chunks:
+            return from_records(np.empty(0, dtype=bar_dtype), symbol)
+        # A single day is returned as views of the memory map, several days are concatenated
+        return from_records(
+            chunks[0] if len(chunks) == 1 else np.concatenate(chunks), symbol
+        )
+
+
+def convert_json(json_path: Union[str, Path], archive: BarArchive) -> int:
+    """
+    Converts bars dumped with Bar.to_dict (like data/bars.json) to the columnar format
+    Args:
+        json_path: The JSON file
+        archive: The archive to write to
+
+    Returns:
+        The number of bars converted
+    """
+    records = json.load(open(json_path))
+    symbols = {}
+    for record in records:
+        symbols.setdefault(record["symbol"], []).append(record)
+
+    for symbol, bars in symbols.items():
+        archive.write(
+            BarBatch(
+                symbol=symbol,
+                timestamp=to_nanoseconds_array([bar["timestamp"] for bar in bars]),
+                open=[bar["open"] for bar in bars],
+                high=[bar["high"] for bar in bars],
+                low=[bar["low"] for bar in bars],
+                close=[bar["close"] for bar in bars],
+                volume=[bar["volume"] for bar in bars],
+                num_trades=[bar["num_trades"] for bar in bars],
+                vwap=[bar["vwap"] for bar in bars],
+                exchange=[bar.get("exchange") or "" for bar in bars],
+            )
+        )
+    logger.info(f"Converted {len(records)} bars of {len(symbols)} symbols")
+    return len(records)
+
+
+if __name__ == "__main__":
+    # python -m alpaca.columnar data/bars.json data/bars
+    convert_json(sys.argv[1], BarArchive(sys.argv[2]))
@@ -1,27 +1,57 @@
 from __future__ import annotations
 
-import datetime
 import json
 import logging
 from dataclasses import dataclass
+from typing import TYPE_CHECKING, Union
 
 import msgpack
-import pandas as pd
-
+import numpy as np
+
+from alpaca.timestamps import (
+    from_nanoseconds,
+    from_nanoseconds_array,
+    is_pandas_timestamp,
+    parse_rfc3339,
+    parse_rfc3339_array,
+    to_nanoseconds_array,
+)
 from src.settings import APP_NAME
 
+if TYPE_CHECKING:
+    # pandas takes longer to import than the rest of the package, it is only loaded by the DataFrame paths
+    import pandas as pd
+
 logger = logging.getLogger(APP_NAME)
 
 
 class BaseEntity:
+    """
+    Base class of the market data entities.
+
+    Entities declare their attributes in `__slots__` so that no per-instance `__dict__` is allocated, the entity
+    type is a class attribute. The `trace` slot holds the latency trace of the entity (see src.tracing), it is not
+    set unless tracing is enabled.
+    """
+
+    __slots__ = ("trace",)
+    type = None
+
     def __str__(self):
-        return json.dumps(self.__dict__, indent=4, sort_keys=True, default=str)
+        return json.dumps(self.to_dict(), indent=4, sort_keys=True, default=str)
 
     def to_dict(self):
-        return self.__dict__
+        data = {"type": self.type}
+        for attribute in self.__slots__:
+            data[attribute] = getattr(self, attribute)
+        return data
 
     @classmethod
-    def to_df(cls, data: list[Bar, Trade, Quote]):
+    def to_df(cls, data: Union[list[Bar, Trade, Quote], BarBatch]):
+        if isinstance(data, BarBatch):
+            return data.to_df()
+        import pandas as pd
+
         return pd.DataFrame([entry.to_dict() for entry in data])
 
 
@@ -130,9 +160,24 @@ class Bar(BaseEntity):
         volume (float): Volume.
         num_trades (int): Number of trades.
         vwap (float): Volume Weighted Average Price.
+        exchange (str): Exchange of the bar (crypto only).
 
     """
 
+    __slots__ = (
+        "symbol",
+        "timestamp",
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "num_trades",
+        "vwap",
+        "exchange",
+    )
+    type = "bar"
+
     def __init__(
         self,
         symbol: str,
@@ -146,7 +191,6 @@ class Bar(BaseEntity):
         vw: float,
         x: str = "",
     ):
-        self.type = "bar"
         self.symbol = symbol
         self.timestamp = t
         self.open = o
@@ -158,8 +202,6 @@ class Bar(BaseEntity):
         self.vwap = vw
         self.exchange = x
 
-        super().__init__()
-
 
 class Trade(BaseEntity):
     """
@@ -177,10 +219,21 @@ class Trade(BaseEntity):
 
     """
 
+    __slots__ = (
+        "symbol",
+        "timestamp",
+        "exchange",
+        "price",
+        "size",
+        "conditions",
+        "id",
+        "tape",
+    )
+    type = "trade"
+
     def __init__(
         self, symbol: str, t: str, x: str, p: float, s: int, c: list, i: int, z: str
     ):
-        self.type = "trade"
         self.symbol = symbol
         self.timestamp = t
         self.exchange = x
@@ -189,9 +242,6 @@ class Trade(BaseEntity):
         self.conditions = c
         self.id = i
         self.tape = z
-        self.exchange = x
-
-        super().__init__()
 
 
 class Quote(BaseEntity):
@@ -208,10 +258,26 @@ class Quote(BaseEntity):
         bid_price (float): Bid price.
         bid_size (int): Bid size.
         conditions (list): Conditions of the quote.
+        tape (str): Quote tape.
         exchange (str): Exchange where the quote happened.
 
     """
 
+    __slots__ = (
+        "symbol",
+        "timestamp",
+        "ask_exchange",
+        "ask_price",
+        "ask_size",
+        "bid_exchange",
+        "bid_price",
+        "bid_size",
+        "conditions",
+        "tape",
+        "exchange",
+    )
+    type = "quote"
+
     def __init__(
         self,
         symbol: str,
@@ -226,7 +292,6 @@ class Quote(BaseEntity):
         x: str = "",
         c: list = None,
     ):
-        self.type = "quote"
         self.symbol = symbol
         self.timestamp = t
         self.ask_exchange = ax
@@ -239,26 +304,217 @@ class Quote(BaseEntity):
         self.tape = z
         self.exchange = x
 
-        super().__init__()
 
+class BarBatch:
+    """
+    Columnar container of bars, with one NumPy array per field.
 
-class EntityFactory:
-    def __init__(self, entity: dict):
-        self.data = self.cast_attributes(entity)
-        self.casters = {
-            "bars": Bar,
-            "trades": Trade,
-            "quotes": Quote,
-            "orders": Order,
-            "positions": Position,
-        }
+    Timestamps are stored as int64 nanoseconds since epoch (UTC). Bars can be parsed straight from the API records
+    without creating a Bar per row, and `to_df` wraps the arrays in a DataFrame without copying them.
+
+    Attributes:
+        symbol (str): Symbol of the asset.
+        timestamp (np.ndarray): Timestamps in nanoseconds (int64).
+        open (np.ndarray): Open prices.
+        high (np.ndarray): High prices.
+        low (np.ndarray): Low prices.
+        close (np.ndarray): Close prices.
+        volume (np.ndarray): Volumes.
+        num_trades (np.ndarray): Number of trades (int64).
+        vwap (np.ndarray): Volume Weighted Average Prices.
+        exchange (np.ndarray): Exchanges (crypto only).
+
+    """
+
+    __slots__ = (
+        "symbol",
+        "timestamp",
+        "open",
+        "high",
+        "low",
+        "close",
+        "volume",
+        "num_trades",
+        "vwap",
+        "exchange",
+    )
+    columns = {
+        "timestamp": ("t", np.int64),
+        "open": ("o", np.float64),
+        "high": ("h", np.float64),
+        "low": ("l", np.float64),
+        "close": ("c", np.float64),
+        "volume": ("v", np.float64),
+        "num_trades": ("n", np.int64),
+        "vwap": ("vw", np.float64),
+    }
+
+    def __init__(
+        self,
+        symbol: str,
+        timestamp: np.ndarray,
+        open: np.ndarray,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        volume: np.ndarray,
+        num_trades: np.ndarray,
+        vwap: np.ndarray,
+        exchange: np.ndarray = None,
+    ):
+        self.symbol = symbol
+        self.timestamp = np.asarray(timestamp, dtype=np.int64)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        self.num_trades = np.asarray(num_trades, dtype=np.int64)
+        self.vwap = np.asarray(vwap, dtype=np.float64)
+        if exchange is None:
+            exchange = np.full(len(self.timestamp), "")
+        self.exchange = np.asarray(exchange, dtype=str)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index) -> Union[Bar, BarBatch]:
+        if isinstance(index, (int, np.integer)):
+            return Bar(
+                symbol=self.symbol,
+                t=from_nanoseconds(self.timestamp[index]),
+                o=float(self.open[index]),
+                h=float(self.high[index]),
+                l=float(self.low[index]),
+                c=float(self.close[index]),
+                v=float(self.volume[index]),
+                n=int(self.num_trades[index]),
+                vw=float(self.vwap[index]),
+                x=str(self.exchange[index]),
+            )
+        return BarBatch(
+            self.symbol, *(getattr(self, field)[index] for field in self.__slots__[1:])
+        )
 
     @property
-    def datetime_formats(self):
-        return "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%dT%H:%M:%S.%f%z"
+    def nbytes(self) -> int:
+        return sum(getattr(self, field).nbytes for field in self.__slots__[1:])
+
+    @classmethod
+    def from_records(cls, records: list[dict], symbol: str) -> BarBatch:
+        """
+        Builds a batch from the bars returned by the API (or the stream)
+        Args:
+            records: The bars, with the wire keys (t, o, h, l, c, v, n, vw, x)
+            symbol: The symbol of the bars
+
+        Returns:
+            The batch
+        """
+        columns = {
+            field: [record[key] for record in records]
+            for field, (key, _) in cls.columns.items()
+            if field != "timestamp"
+        }
+        return cls(
+            symbol=symbol,
+            timestamp=to_nanoseconds_array([record["t"] for record in records]),
+            exchange=[record.get("x", "") for record in records],
+            **columns,
+        )
+
+    @classmethod
+    def from_bars(cls, bars: list[Bar], symbol: str = None) -> BarBatch:
+        if symbol is None:
+            symbol = bars[0].symbol if bars else ""
+        return cls(
+            symbol=symbol,
+            timestamp=to_nanoseconds_array([bar.timestamp for bar in bars]),
+            open=[bar.open for bar in bars],
+            high=[bar.high for bar in bars],
+            low=[bar.low for bar in bars],
+            close=[bar.close for bar in bars],
+            volume=[bar.volume for bar in bars],
+            num_trades=[bar.num_trades for bar in bars],
+            vwap=[bar.vwap for bar in bars],
+            exchange=[bar.exchange for bar in bars],
+        )
+
+    @classmethod
+    def concat(cls, batches: list[BarBatch]) -> BarBatch:
+        return cls(
+            batches[0].symbol if batches else "",
+            *(
+                np.concatenate([getattr(batch, field) for batch in batches])
+                for field in cls.__slots__[1:]
+            ),
+        )
+
+    def to_df(self) -> pd.DataFrame:
+        """
+        Wraps the columns in a DataFrame without copying them, timestamps are naive UTC datetimes
+        """
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                "symbol": np.full(len(self), self.symbol, dtype=object),
+                "timestamp": self.timestamp.view("datetime64[ns]"),
+                "open": self.open,
+                "high": self.high,
+                "low": self.low,
+                "close": self.close,
+                "volume": self.volume,
+                "num_trades": self.num_trades,
+                "vwap": self.vwap,
+                "exchange": self.exchange,
+            },
+            copy=False,
+        )
+
+
+class EntityFactory:
+    """
+    Builds entities from the API (or stream) records.
+
+    The timestamp fields of each entity type are declared in `timestamp_fields` and parsed with the RFC-3339 fast
+    path, every other field is passed through as is. `create_entities` parses the timestamps of a whole page at once.
+    """
+
+    casters = {
+        "bars": Bar,
+        "trades": Trade,
+        "quotes": Quote,
+        "orders": Order,
+        "positions": Position,
+    }
+    timestamp_fields = {
+        "bars": ("t",),
+        "trades": ("t",),
+        "quotes": ("t",),
+        "orders": (
+            "created_at",
+            "updated_at",
+            "submitted_at",
+            "filled_at",
+            "expired_at",
+            "canceled_at",
+            "failed_at",
+            "replaced_at",
+        ),
+        "positions": (),
+    }
+
+    def __init__(self, entity: dict):
+        self.data = entity
 
     def create_entity(self, type: str):
         if type in self.casters:
+            self.data = self.cast_attributes(self.data, type)
             try:
                 return self.casters[type](**self.data)
             except TypeError:
@@ -267,17 +523,51 @@ class EntityFactory:
         else:
             raise ValueError(f"Entity type {type} not supported")
 
-    def cast_attributes(self, data):
-        for key, value in data.items():
-            if isinstance(value, str) and ("time" in key or "at" in key):
-                for _format in self.datetime_formats:
-                    try:
-                        data[key] = datetime.datetime.strptime(value, _format)
-                        break
-                    except ValueError:
-                        pass
-            if isinstance(value, pd.Timestamp):
+    @classmethod
+    def create_entities(cls, records: list[dict], type: str) -> list:
+        """
+        Builds the entities of a list of records, parsing their timestamps in bulk
+        Args:
+            records: The records to convert
+            type: The entity type (bars, trades, quotes, orders, positions)
+
+        Returns:
+            The entities, None for the records that could not be converted
+        """
+        if type not in cls.casters:
+            raise ValueError(f"Entity type {type} not supported")
+
+        for field in cls.timestamp_fields[type]:
+            values = [record.get(field) for record in records]
+            indexes = [
+                index for index, value in enumerate(values) if isinstance(value, str)
+            ]
+            if not indexes:
+                continue
+            parsed = from_nanoseconds_array(
+                parse_rfc3339_array([values[index] for index in indexes])
+            )
+            for index, value in zip(indexes, parsed):
+                records[index][field] = value
+
+        entities = []
+        for record in records:
+            try:
+                entities.append(cls.casters[type](**cls.cast_attributes(record, type)))
+            except TypeError:
+                logger.warning(record)
+                entities.append(None)
+        return entities
+
+    @classmethod
+    def cast_attributes(cls, data: dict, type: str = None) -> dict:
+        fields = cls.timestamp_fields.get(type, ())
+        for key in fields:
+            value = data.get(key)
+            if isinstance(value, str):
+                data[key] = parse_rfc3339(value)
+            elif is_pandas_timestamp(value):
                 data[key] = value.to_pydatetime()
-            if isinstance(value, msgpack.ext.Timestamp):
+            elif isinstance(value, msgpack.ext.Timestamp):
                 data[key] = value.to_datetime()
         return data
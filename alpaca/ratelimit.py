@@ -0,0 +1,211 @@
+import asyncio
+import copy
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+# Request priorities, lower is more important
+ORDERS = 0
+ACCOUNT = 1
+DATA = 2
+
+
+def request_priority(method: str, url: str, data_url: str) -> int:
+    """
+    Priority of a request: order submissions first, then account, positions and orders queries, then market data
+    """
+    if url.startswith(data_url.rstrip("/")):
+        return DATA
+    if method != "GET" and "/orders" in url:
+        return ORDERS
+    return ACCOUNT
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the requests of a client, refilled at `rate` tokens per second up to `capacity`.
+
+    Each request takes a token. Lower priority requests leave part of the bucket untouched: market data requests can
+    only take a token while more than `reserve` are left and account queries while more than half of it is left, so
+    a history backfill slows down before it can delay an order. When the API reports the remaining budget (rate
+    limit headers), the bucket is lowered to it.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, i.e. the largest burst.
+        reserve (float): Tokens kept for orders.
+
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        reserve: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("The rate must be positive and the capacity at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = min(reserve, capacity - 1)
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated_at = clock()
+        self.waits = 0
+        self.condition = threading.Condition()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def _floor(self, priority: int) -> float:
+        if priority <= ORDERS:
+            return 0.0
+        if priority == ACCOUNT:
+            return self.reserve / 2
+        return self.reserve
+
+    @property
+    def remaining(self) -> int:
+        """
+        Number of requests that can be made right away
+        """
+        with self.condition:
+            self._refill()
+            return int(self.tokens)
+
+    def try_acquire(self, priority: int = DATA) -> float:
+        """
+        Takes a token when one is available for the priority
+        Args:
+            priority: The priority of the request
+
+        Returns:
+            0 when a token was taken, otherwise the seconds to wait before trying again
+        """
+        with self.condition:
+            self._refill()
+            floor = self._floor(priority)
+            if self.tokens - 1 >= floor:
+                self.tokens -= 1
+                return 0.0
+            self.waits += 1
+            return (floor + 1 - self.tokens) / self.rate
+
+    def acquire(self, priority: int = DATA, timeout: float = None) -> bool:
+        """
+        Waits for a token (see try_acquire)
+        Args:
+            priority: The priority of the request
+            timeout: Seconds to wait at most, None to wait as long as needed
+
+        Returns:
+            Whether a token was taken
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            wait = self.try_acquire(priority)
+            if not wait:
+                return True
+            if deadline is not None:
+                wait = min(wait, deadline - self.clock())
+                if wait <= 0:
+                    return False
+            time.sleep(wait)
+
+    async def acquire_async(self, priority: int = DATA) -> None:
+        """
+        Waits for a token without blocking the event loop
+        """
+        while True:
+            wait = self.try_acquire(priority)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def update(self, headers) -> None:
+        """
+        Aligns the bucket with the budget reported by the API
+        Args:
+            headers: The headers of a response
+
+        Returns:
+            None
+        """
+        remaining = headers.get("X-RateLimit-Remaining") if headers else None
+        if remaining is None:
+            return
+        with self.condition:
+            self._refill()
+            self.tokens = min(self.tokens, float(remaining))
+
+
+class RequestCoalescer:
+    """
+    Shares the result of identical requests made while the first one is in flight, across threads.
+
+    The callers waiting on a request get a copy of its result, so that they can modify it like their own.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def run(self, key, function: Callable, *args, **kwargs):
+        """
+        Calls the function, unless a call with the same key is in flight, in which case its result is returned
+        """
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is not None:
+                entry[1] += 1
+                self.coalesced += 1
+            else:
+                self.pending[key] = [Future(), 0]
+
+        if entry is not None:
+            return copy.deepcopy(entry[0].result())
+
+        future = self.pending[key][0]
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            _, waiters = self.pending.pop(key)
+        future.set_result(result)
+        # The waiters copy the original, the caller gets its own copy when there are any
+        return copy.deepcopy(result) if waiters else result
+
+
+class AsyncRequestCoalescer:
+    """
+    Shares the result of identical requests made while the first one is in flight, on one event loop (see
+    RequestCoalescer).
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.coalesced = 0
+
+    async def run(self, key, coroutine_function: Callable, *args, **kwargs):
+        task = self.pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_function(*args, **kwargs))
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+            # A cancelled caller does not cancel the request shared with the others
+            return await asyncio.shield(task)
+
+        # The loop runs one coroutine step at a time, so the copy cannot interleave with changes of the caller
+        self.coalesced += 1
+        return copy.deepcopy(await asyncio.shield(task))
@@ -0,0 +1,442 @@
+from __future__ import annotations
+
+import bisect
+import datetime
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Iterable, Union
+
+import msgpack
+
+from alpaca.entities import Bar
+from alpaca.timestamps import from_nanoseconds, to_nanoseconds
+from src.settings import APP_NAME
+
+logger = logging.getLogger(APP_NAME)
+
+ALL_EXCHANGES = "*"
+
+timeframe_units = {
+    "Min": datetime.timedelta(minutes=1),
+    "T": datetime.timedelta(minutes=1),
+    "Hour": datetime.timedelta(hours=1),
+    "H": datetime.timedelta(hours=1),
+    "Day": datetime.timedelta(days=1),
+    "D": datetime.timedelta(days=1),
+    "Week": datetime.timedelta(weeks=1),
+    "W": datetime.timedelta(weeks=1),
+}
+
+
+def parse_timeframe(timeframe: str) -> datetime.timedelta:
+    """
+    Converts an Alpaca timeframe (e.g. "1Min", "15Min", "1Hour", "1Day") to a timedelta
+    Args:
+        timeframe: The timeframe to convert
+
+    Returns:
+        The duration of a single bar
+    """
+    match = re.fullmatch(r"(\d+)([A-Za-z]+)", timeframe)
+    if not match or match.group(2) not in timeframe_units:
+        raise ValueError(f"Timeframe {timeframe} not supported")
+    return int(match.group(1)) * timeframe_units[match.group(2)]
+
+
+def normalize_exchanges(exchanges: Union[str, list, None]) -> list[str]:
+    if not exchanges:
+        return [ALL_EXCHANGES]
+    if isinstance(exchanges, str):
+        exchanges = exchanges.split(",")
+    return [exchange.strip() for exchange in exchanges]
+
+
+def bar_record(timestamp: int, bar: Bar) -> list:
+    """
+    Log record of a bar, the symbol and the timeframe are those of the log
+    """
+    return [
+        "b",
+        bar.exchange,
+        timestamp,
+        bar.open,
+        bar.high,
+        bar.low,
+        bar.close,
+        bar.volume,
+        bar.num_trades,
+        bar.vwap,
+    ]
+
+
+class BarSeries:
+    """
+    Bars of a single (symbol, timeframe, exchange) kept sorted by timestamp.
+    """
+
+    def __init__(self):
+        self.timestamps = []
+        self.bars = []
+
+    def insert(self, timestamp: int, bar: Bar) -> None:
+        if not self.timestamps or timestamp > self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.bars.append(bar)
+            return
+
+        index = bisect.bisect_left(self.timestamps, timestamp)
+        if index < len(self.timestamps) and self.timestamps[index] == timestamp:
+            # A bar for the same minute was already stored, the latest one wins
+            self.bars[index] = bar
+        else:
+            self.timestamps.insert(index, timestamp)
+            self.bars.insert(index, bar)
+
+    def between(self, start: int, end: int) -> list[tuple[int, Bar]]:
+        left = bisect.bisect_left(self.timestamps, start)
+        right = bisect.bisect_right(self.timestamps, end)
+        return list(zip(self.timestamps[left:right], self.bars[left:right]))
+
+
+class Coverage:
+    """
+    Sorted, non overlapping [start, end] ranges (in nanoseconds) of bar timestamps that are known to be complete.
+
+    Ranges closer than one bar interval are merged, since no bar can exist between them.
+    """
+
+    def __init__(self, interval: int):
+        self.interval = interval
+        self.ranges = []
+
+    def add(self, start: int, end: int) -> None:
+        if end < start:
+            return
+        ranges = []
+        for range_start, range_end in self.ranges:
+            if range_end + self.interval < start or end + self.interval < range_start:
+                ranges.append((range_start, range_end))
+            else:
+                start, end = min(start, range_start), max(end, range_end)
+        ranges.append((start, end))
+        self.ranges = sorted(ranges)
+
+    def extend(self, timestamp: int) -> bool:
+        """
+        Extends the range that ends right before the timestamp, used for streamed bars
+        """
+        for index, (range_start, range_end) in enumerate(self.ranges):
+            if range_end < timestamp <= range_end + self.interval:
+                self.ranges[index] = (range_start, timestamp)
+                return True
+        return False
+
+    def missing(self, start: int, end: int) -> list[tuple[int, int]]:
+        missing = []
+        cursor, covered = start, False
+        for range_start, range_end in self.ranges:
+            if range_end < cursor:
+                continue
+            if range_start > end:
+                break
+            if range_start > cursor:
+                missing.append((cursor, range_start))
+            cursor, covered = max(cursor, range_end), True
+
+        if cursor < end and (not covered or end - cursor >= self.interval):
+            missing.append((cursor, end))
+        elif not covered:
+            missing.append((start, end))
+        return missing
+
+
+class BarStore:
+    """
+    Append-only local store of bars, keyed by (symbol, timeframe, exchange).
+
+    Next to the bars the store records which time ranges were completely fetched from the API, so that
+    `AlpacaAPI.get_bars` only has to download the missing ranges. When a directory is given, bars and ranges are
+    appended to one msgpack log per (symbol, timeframe) and replayed the first time that pair is accessed, otherwise
+    the store lives in memory only. A log holding superseded records (bars stored again, ranges since merged) is
+    rewritten with the live ones when it is replayed, so that it does not grow without bound.
+
+    Attributes:
+        path (Path): Directory of the logs, None for an in-memory store.
+
+    """
+
+    def __init__(self, path: Union[str, Path] = None):
+        self.path = Path(path) if path else None
+        self.series = {}
+        self.coverage = {}
+        self.loaded = set()
+        self.files = {}
+        self.lock = threading.RLock()
+
+        if self.path:
+            self.path.mkdir(parents=True, exist_ok=True)
+
+    def log_path(self, symbol: str, timeframe: str) -> Path:
+        return self.path / f"{symbol.replace('/', '-')}.{timeframe}.msgpack"
+
+    def load(self, symbol: str, timeframe: str) -> None:
+        if (symbol, timeframe) in self.loaded:
+            return
+        self.loaded.add((symbol, timeframe))
+        if not self.path or not self.log_path(symbol, timeframe).exists():
+            return
+
+        records = 0
+        with open(self.log_path(symbol, timeframe), "rb") as file:
+            for record in msgpack.Unpacker(file, raw=False):
+                records += 1
+                if record[0] == "b":
+                    _, exchange, t, o, h, l, c, v, n, vw = record
+                    bar = Bar(
+                        symbol, from_nanoseconds(t), o, h, l, c, v, n, vw, exchange
+                    )
+                    self._series(symbol, timeframe, exchange).insert(t, bar)
+                elif record[0] == "c":
+                    _, exchange, start, end = record
+                    self._coverage(symbol, timeframe, exchange).add(start, end)
+        logger.debug(f"Loaded {symbol} {timeframe} bars from {self.path}")
+        if records > len(self.records(symbol, timeframe)):
+            self.compact(symbol, timeframe)
+
+    def records(self, symbol: str, timeframe: str) -> list:
+        """
+        Returns the log records of the bars and the ranges currently stored for the symbol and timeframe
+        """
+        records = []
+        for (series_symbol, series_timeframe, exchange), series in self.series.items():
+            if series_symbol == symbol and series_timeframe == timeframe:
+                records.extend(
+                    bar_record(t, bar) for t, bar in zip(series.timestamps, series.bars)
+                )
+        for (
+            coverage_symbol,
+            coverage_timeframe,
+            exchange,
+        ), coverage in self.coverage.items():
+            if coverage_symbol == symbol and coverage_timeframe == timeframe:
+                records.extend(
+                    ["c", exchange, start, end] for start, end in coverage.ranges
+                )
+        return records
+
+    def compact(self, symbol: str, timeframe: str) -> None:
+        """
+        Rewrites the log of the symbol and timeframe with the records currently stored only
+        """
+        with self.lock:
+            file = self.files.pop((symbol, timeframe), None)
+            if file is not None:
+                file.close()
+            path = self.log_path(symbol, timeframe)
+            compacted = path.with_name(f"{path.name}.compact")
+            with open(compacted, "wb") as file:
+                packer = msgpack.Packer()
+                for record in self.records(symbol, timeframe):
+                    file.write(packer.pack(record))
+            # Atomic, a crash leaves either log complete
+            compacted.replace(path)
+        logger.debug(f"Compacted {path}")
+
+    def write(self, symbol: str, timeframe: str, records: list) -> None:
+        if not self.path or not records:
+            return
+        key = (symbol, timeframe)
+        if key not in self.files:
+            self.files[key] = open(self.log_path(symbol, timeframe), "ab")
+        file = self.files[key]
+        file.write(b"".join(msgpack.packb(record) for record in records))
+        file.flush()
+
+    def _series(self, symbol: str, timeframe: str, exchange: str) -> BarSeries:
+        return self.series.setdefault((symbol, timeframe, exchange), BarSeries())
+
+    def _coverage(self, symbol: str, timeframe: str, exchange: str) -> Coverage:
+        key = (symbol, timeframe, exchange)
+        if key not in self.coverage:
+            interval = int(parse_timeframe(timeframe).total_seconds() * 1e9)
+            self.coverage[key] = Coverage(interval)
+        return self.coverage[key]
+
+    def extend(self, bars: Iterable[Bar], timeframe: str) -> None:
+        """
+        Adds bars to the store
+        Args:
+            bars: The bars to add
+            timeframe: The timeframe of the bars
+
+        Returns:
+            None
+        """
+        records = {}
+        with self.lock:
+            for bar in bars:
+                if bar is None:
+                    continue
+                self.load(bar.symbol, timeframe)
+                t = to_nanoseconds(bar.timestamp)
+                self._series(bar.symbol, timeframe, bar.exchange).insert(t, bar)
+                records.setdefault(bar.symbol, []).append(bar_record(t, bar))
+            for symbol, symbol_records in records.items():
+                self.write(symbol, timeframe, symbol_records)
+
+    def append(self, bar: Bar, timeframe: str) -> None:
+        """
+        Adds a streamed bar and extends the complete ranges that end right before it
+        Args:
+            bar: The bar to add
+            timeframe: The timeframe of the bar
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.extend([bar], timeframe)
+            t = to_nanoseconds(bar.timestamp)
+            records = []
+            # A bar of one exchange does not tell whether the other exchanges have one, only a consolidated bar
+            # (stocks, without an exchange) completes the minute for all of them
+            exchanges = (ALL_EXCHANGES,) if not bar.exchange else (bar.exchange,)
+            for exchange in exchanges:
+                if self._coverage(bar.symbol, timeframe, exchange).extend(t):
+                    records.append(["c", exchange, t, t])
+            self.write(bar.symbol, timeframe, records)
+
+    def add_coverage(
+        self,
+        symbol: str,
+        timeframe: str,
+        exchanges: Union[str, list, None],
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> None:
+        """
+        Marks a time range as completely fetched
+        Args:
+            symbol: The symbol of the bars
+            timeframe: The timeframe of the bars
+            exchanges: The exchanges the range was fetched for, None for all of them
+            start: The start of the range
+            end: The end of the range
+
+        Returns:
+            None
+        """
+        start, end = to_nanoseconds(start), to_nanoseconds(end)
+        with self.lock:
+            self.load(symbol, timeframe)
+            records = []
+            for exchange in normalize_exchanges(exchanges):
+                self._coverage(symbol, timeframe, exchange).add(start, end)
+                records.append(["c", exchange, start, end])
+            self.write(symbol, timeframe, records)
+
+    def missing(
+        self,
+        symbol: str,
+        timeframe: str,
+        exchanges: Union[str, list, None],
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> list[tuple[datetime.datetime, datetime.datetime]]:
+        """
+        Returns the time ranges that still have to be fetched to serve a query
+        Args:
+            symbol: The symbol of the bars
+            timeframe: The timeframe of the bars
+            exchanges: The exchanges of the bars, None for all of them
+            start: The start of the query
+            end: The end of the query
+
+        Returns:
+            A list of (start, end) ranges
+        """
+        start, end = to_nanoseconds(start), to_nanoseconds(end)
+        with self.lock:
+            self.load(symbol, timeframe)
+            missing = Coverage(
+                self._coverage(symbol, timeframe, ALL_EXCHANGES).interval
+            )
+            for exchange in normalize_exchanges(exchanges):
+                for range_start, range_end in self._coverage(
+                    symbol, timeframe, exchange
+                ).missing(start, end):
+                    missing.add(range_start, range_end)
+        return [
+            (from_nanoseconds(range_start), from_nanoseconds(range_end))
+            for range_start, range_end in missing.ranges
+        ]
+
+    def query(
+        self,
+        symbol: str,
+        timeframe: str,
+        exchanges: Union[str, list, None],
+        start: datetime.datetime,
+        end: datetime.datetime,
+    ) -> list[Bar]:
+        """
+        Returns the stored bars of a time range, sorted by timestamp
+        Args:
+            symbol: The symbol of the bars
+            timeframe: The timeframe of the bars
+            exchanges: The exchanges of the bars, None for all of them
+            start: The start of the range
+            end: The end of the range
+
+        Returns:
+            The stored bars
+        """
+        start, end = to_nanoseconds(start), to_nanoseconds(end)
+        exchanges = normalize_exchanges(exchanges)
+        with self.lock:
+            self.load(symbol, timeframe)
+            entries = []
+            for (
+                series_symbol,
+                series_timeframe,
+                exchange,
+            ), series in self.series.items():
+                if series_symbol != symbol or series_timeframe != timeframe:
+                    continue
+                if ALL_EXCHANGES in exchanges or exchange in exchanges:
+                    entries.extend(series.between(start, end))
+        entries.sort(key=lambda entry: entry[0])
+        return [bar for _, bar in entries]
+
+    def latest(
+        self, symbol: str, timeframe: str, exchanges: Union[str, list, None] = None
+    ) -> Union[Bar, None]:
+        """
+        Returns the most recent stored bar of the symbol, None when there is none
+        """
+        exchanges = normalize_exchanges(exchanges)
+        latest = None
+        with self.lock:
+            self.load(symbol, timeframe)
+            for (
+                series_symbol,
+                series_timeframe,
+                exchange,
+            ), series in self.series.items():
+                if series_symbol != symbol or series_timeframe != timeframe:
+                    continue
+                if not series.timestamps or not (
+                    ALL_EXCHANGES in exchanges or exchange in exchanges
+                ):
+                    continue
+                if latest is None or series.timestamps[-1] > latest[0]:
+                    latest = (series.timestamps[-1], series.bars[-1])
+        return latest[1] if latest is not None else None
+
+    def close(self) -> None:
+        with self.lock:
+            for file in self.files.values():
+                file.close()
+            self.files.clear()
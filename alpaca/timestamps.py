@@ -0,0 +1,176 @@
+import datetime
+import sys
+from functools import lru_cache
+
+import msgpack
+import numpy as np
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+NANOSECONDS = 10**9
+
+# Alpaca always emits UTC timestamps with a Z suffix and 0 to 9 fractional digits (e.g. 2021-12-08T10:40:00Z or
+# 2021-12-08T10:40:00.123456789Z). Those are parsed without strptime: the YYYY-MM-DDTHH:MM:SS prefix is cached
+# (bars share the same second, trades mostly do) and the fraction is read as an integer. Any other RFC-3339
+# timestamp falls back to datetime.fromisoformat.
+
+
+@lru_cache(maxsize=4096)
+def _parse_seconds(value: str) -> datetime.datetime:
+    return datetime.datetime(
+        int(value[0:4]),
+        int(value[5:7]),
+        int(value[8:10]),
+        int(value[11:13]),
+        int(value[14:16]),
+        int(value[17:19]),
+        tzinfo=datetime.timezone.utc,
+    )
+
+
+def _fraction_nanoseconds(fraction: str) -> int:
+    return int(fraction.ljust(9, "0")[:9]) if fraction else 0
+
+
+def _split(value: str) -> tuple[str, str]:
+    """
+    Splits a `Z`-suffixed timestamp into its seconds prefix and fractional digits, None when it is not one
+    """
+    if len(value) < 20 or value[-1] != "Z" or value[10] != "T":
+        return None
+    if len(value) == 20:
+        return value[:19], ""
+    if value[19] != "." or not value[20:-1].isdigit():
+        return None
+    return value[:19], value[20:-1]
+
+
+def _parse_fallback(value: str) -> tuple[datetime.datetime, int]:
+    value = value.replace("Z", "+00:00").replace("z", "+00:00")
+    fraction = 0
+    if "." in value:
+        head, tail = value.split(".", 1)
+        digits = len(tail) - len(tail.lstrip("0123456789"))
+        fraction = _fraction_nanoseconds(tail[:digits])
+        value = head + tail[digits:]
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed, fraction
+
+
+def parse_rfc3339(value: str) -> datetime.datetime:
+    """
+    Parses an RFC-3339 timestamp, fractional digits beyond microseconds are truncated
+    Args:
+        value: The timestamp to parse
+
+    Returns:
+        A timezone aware datetime
+    """
+    parts = _split(value)
+    if parts is None:
+        parsed, fraction = _parse_fallback(value)
+        return parsed.replace(microsecond=fraction // 1000)
+    seconds, fraction = parts
+    if not fraction:
+        return _parse_seconds(seconds)
+    return _parse_seconds(seconds).replace(
+        microsecond=_fraction_nanoseconds(fraction) // 1000
+    )
+
+
+def parse_rfc3339_ns(value: str) -> int:
+    """
+    Parses an RFC-3339 timestamp keeping the nanoseconds
+    Args:
+        value: The timestamp to parse
+
+    Returns:
+        Nanoseconds since epoch
+    """
+    parts = _split(value)
+    if parts is None:
+        parsed, fraction = _parse_fallback(value)
+        parsed = parsed.replace(microsecond=0)
+    else:
+        parsed, fraction = _parse_seconds(parts[0]), _fraction_nanoseconds(parts[1])
+    return (parsed - EPOCH) // datetime.timedelta(seconds=1) * NANOSECONDS + fraction
+
+
+def parse_rfc3339_array(values: list) -> np.ndarray:
+    """
+    Parses a list of RFC-3339 timestamps at once
+    Args:
+        values: The timestamps to parse
+
+    Returns:
+        The timestamps as int64 nanoseconds since epoch
+    """
+    if not values:
+        return np.empty(0, dtype=np.int64)
+    if all(value.endswith("Z") for value in values):
+        try:
+            # NumPy parses naive ISO-8601 timestamps in bulk, the suffix is stripped since all of them are UTC
+            parsed = np.array([value[:-1] for value in values], dtype="datetime64[ns]")
+            return parsed.view(np.int64)
+        except ValueError:
+            pass
+    return np.array([parse_rfc3339_ns(value) for value in values], dtype=np.int64)
+
+
+def is_pandas_timestamp(value) -> bool:
+    """
+    Whether the value is a pandas Timestamp, without importing pandas: none can exist before pandas was imported
+    """
+    pandas = sys.modules.get("pandas")
+    return pandas is not None and isinstance(value, pandas.Timestamp)
+
+
+def to_nanoseconds(value) -> int:
+    """
+    Converts the timestamps found on entities to nanoseconds since epoch (UTC)
+    Args:
+        value: A datetime, pandas Timestamp, msgpack Timestamp, RFC-3339 string or nanoseconds
+
+    Returns:
+        The timestamp in nanoseconds
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str):
+        return parse_rfc3339_ns(value)
+    if isinstance(value, msgpack.ext.Timestamp):
+        return value.to_unix_nano()
+    if is_pandas_timestamp(value):
+        if value.tzinfo is None:
+            value = value.tz_localize("UTC")
+        return value.value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return (value - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
+def to_nanoseconds_array(values: list) -> np.ndarray:
+    """
+    Converts a list of timestamps (see to_nanoseconds) to an int64 array of nanoseconds since epoch
+    """
+    if values and all(isinstance(value, str) for value in values):
+        return parse_rfc3339_array(values)
+    return np.array([to_nanoseconds(value) for value in values], dtype=np.int64)
+
+
+def from_nanoseconds(value: int) -> datetime.datetime:
+    """
+    Converts nanoseconds since epoch to a UTC datetime, truncated to microseconds
+    """
+    return EPOCH + datetime.timedelta(microseconds=int(value) // 1000)
+
+
+def from_nanoseconds_array(values: np.ndarray) -> list[datetime.datetime]:
+    """
+    Converts an array of nanoseconds since epoch to UTC datetimes
+    """
+    return [
+        EPOCH + datetime.timedelta(microseconds=value)
+        for value in (np.asarray(values, dtype=np.int64) // 1000).tolist()
+    ]
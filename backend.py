@@ -1,22 +1,256 @@
 import json
+from pathlib import Path
+from typing import Iterator, Union
 
+import numpy as np
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 
-app = FastAPI()
-data = json.load(open("data/bars.json"))
+from alpaca.columnar import BarArchive, convert_json
+from alpaca.entities import BarBatch
+from alpaca.timestamps import to_nanoseconds
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 10000
+NDJSON = "application/x-ndjson"
+
+
+class BarIndex:
+    """
+    Bars served by the mock data API, indexed when the server starts.
+
+    The bars of every symbol are kept in one BarBatch sorted by timestamp, with the rows of each exchange as a sorted
+    array of positions, so that a query is a binary search on the time range rather than a scan of every bar. Page
+    tokens are the position of the next bar in the symbol's batch.
+
+    Attributes:
+        series (dict): The bars by symbol.
+        exchange_rows (dict): The positions of the bars of each (symbol, exchange).
+
+    """
+
+    def __init__(self, batches: list[BarBatch]):
+        self.series = {}
+        self.exchange_rows = {}
+        for batch in batches:
+            order = np.lexsort((batch.exchange, batch.timestamp))
+            batch = self.series[batch.symbol] = batch[order]
+            for exchange in np.unique(batch.exchange):
+                self.exchange_rows[batch.symbol, str(exchange)] = np.flatnonzero(
+                    batch.exchange == exchange
+                )
+
+    @classmethod
+    def load(cls, path: Union[str, Path] = DATA_DIR) -> "BarIndex":
+        """
+        Loads the columnar bars (data/bars), converting data/bars.json first when they do not exist
+        """
+        archive = BarArchive(Path(path) / "bars")
+        if not archive.symbols():
+            convert_json(Path(path) / "bars.json", archive)
+        return cls([archive.read(symbol) for symbol in archive.symbols()])
+
+    def query(
+        self,
+        symbol: str,
+        start=None,
+        end=None,
+        exchanges: list[str] = None,
+        limit: int = None,
+        page_token: str = None,
+    ) -> tuple[BarBatch, Union[str, None]]:
+        """
+        Selects the bars of a symbol between start and end (both inclusive)
+        Args:
+            symbol: The symbol
+            start: The start of the range, defaults to the first bar
+            end: The end of the range, defaults to the last bar
+            exchanges: Keep only the bars of these exchanges
+            limit: Number of bars of the page, None for all of them
+            page_token: The token returned with the previous page
+
+        Returns:
+            The bars and the token of the next page (None for the last page)
+        """
+        batch = self.series.get(symbol)
+        if batch is None:
+            return BarBatch(symbol, *([] for _ in range(8))), None
+
+        lower = (
+            0
+            if start is None
+            else np.searchsorted(batch.timestamp, to_nanoseconds(start), "left")
+        )
+        upper = (
+            len(batch)
+            if end is None
+            else np.searchsorted(batch.timestamp, to_nanoseconds(end), "right")
+        )
+        if page_token:
+            lower = max(lower, int(page_token))
+
+        if exchanges:
+            selected = []
+            for exchange in exchanges:
+                positions = self.exchange_rows.get((symbol, exchange))
+                if positions is not None:
+                    bounds = positions.searchsorted([lower, upper])
+                    selected.append(positions[bounds[0] : bounds[1]])
+            rows = np.sort(np.concatenate(selected)) if selected else np.arange(0)
+        else:
+            rows = np.arange(lower, upper)
+
+        if limit is not None and len(rows) > limit:
+            return batch[rows[:limit]], str(rows[limit])
+        return batch[rows], None
+
+
+def bar_records(batch: BarBatch, legacy: bool = False) -> Iterator[dict]:
+    """
+    Yields the bars with the keys of the data API, or with the keys of Bar.to_dict (data/bars.json) when legacy
+    """
+    timestamps = np.datetime_as_string(batch.timestamp.view("datetime64[ns]"), unit="s")
+    columns = zip(
+        timestamps,
+        batch.open.tolist(),
+        batch.high.tolist(),
+        batch.low.tolist(),
+        batch.close.tolist(),
+        batch.volume.tolist(),
+        batch.num_trades.tolist(),
+        batch.vwap.tolist(),
+        batch.exchange.tolist(),
+    )
+    for t, o, h, l, c, v, n, vw, x in columns:
+        if legacy:
+            yield {
+                "type": "bar",
+                "symbol": batch.symbol,
+                "timestamp": f"{t}Z",
+                "open": o,
+                "high": h,
+                "low": l,
+                "close": c,
+                "volume": v,
+                "num_trades": n,
+                "vwap": vw,
+                "exchange": x,
+            }
+        else:
+            record = {
+                "t": f"{t}Z",
+                "o": o,
+                "h": h,
+                "l": l,
+                "c": c,
+                "v": v,
+                "n": n,
+                "vw": vw,
+            }
+            if x:
+                record["x"] = x
+            yield record
+
+
+def ndjson(records: Iterator[dict], chunk_size: int = 1000) -> Iterator[str]:
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record))
+        if len(lines) == chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def load_index() -> None:
+    # Built when the server starts rather than on import, data/bars is generated (and ignored by git)
+    app.state.index = BarIndex.load()
+
+
+app = FastAPI(on_startup=[load_index])
 
 
 @app.get("/")
-def bars(exchange: str = None):
-    if exchange is None:
-        return data
-    else:
-        new_data = []
-        for element in data:
-            if element['exchange'] == exchange:
-                new_data.append(element)
-        return new_data
+def bars(request: Request, exchange: str = None):
+    index = request.app.state.index
+    return [
+        record
+        for symbol in index.series
+        for record in bar_records(
+            index.query(symbol, exchanges=[exchange] if exchange else None)[0],
+            legacy=True,
+        )
+    ]
+
+
+def bars_page(
+    request: Request,
+    symbol: str,
+    start: str,
+    end: str,
+    limit: Union[int, None],
+    page_token: str,
+    exchanges: str = None,
+):
+    """
+    Answers like the data API: a page of bars with the token of the next one, or every bar as NDJSON (one bar per
+    line, without paging unless a limit is given) when the client accepts application/x-ndjson
+    """
+    try:
+        exchanges = exchanges.split(",") if exchanges else None
+        stream = NDJSON in request.headers.get("accept", "")
+        if limit is None and not stream:
+            limit = DEFAULT_LIMIT
+        if limit is not None and (limit < 1 or (limit > MAX_LIMIT and not stream)):
+            raise ValueError(f"Limit must be between 1 and {MAX_LIMIT}")
+        batch, next_page_token = request.app.state.index.query(
+            symbol, start, end, exchanges, limit, page_token
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if stream:
+        return StreamingResponse(
+            ndjson(bar_records(batch)),
+            media_type=NDJSON,
+            headers={"X-Next-Page-Token": next_page_token or ""},
+        )
+    return {
+        "bars": list(bar_records(batch)) or None,
+        "symbol": symbol,
+        "next_page_token": next_page_token,
+    }
+
+
+@app.get("/v2/stocks/{symbol}/bars")
+def stock_bars(
+    request: Request,
+    symbol: str,
+    start: str = None,
+    end: str = None,
+    limit: int = None,
+    page_token: str = None,
+    timeframe: str = "1Min",
+    adjustment: str = "raw",
+):
+    return bars_page(request, symbol, start, end, limit, page_token)
+
+
+@app.get("/v1beta1/crypto/{symbol}/bars")
+def crypto_bars(
+    request: Request,
+    symbol: str,
+    start: str = None,
+    end: str = None,
+    limit: int = None,
+    page_token: str = None,
+    timeframe: str = "1Min",
+    exchanges: str = None,
+):
+    return bars_page(request, symbol, start, end, limit, page_token, exchanges)
 
 
 if __name__ == "__main__":
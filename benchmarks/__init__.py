@@ -0,0 +1,5 @@
+import os
+
+# src.settings requires the Alpaca credentials to be defined, the benchmarks never reach the API
+os.environ.setdefault("APCA_API_KEY_ID", "benchmark")
+os.environ.setdefault("APCA_API_SECRET_KEY", "benchmark")
@@ -0,0 +1,6 @@
+import sys
+
+from benchmarks.runner import main
+
+# python -m benchmarks [names...] [--save] [--tolerance 0.5]
+sys.exit(main())
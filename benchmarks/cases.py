@@ -0,0 +1,250 @@
+import asyncio
+import json
+from pathlib import Path
+from queue import Queue
+from types import SimpleNamespace
+from typing import Callable
+
+import msgpack
+import pandas as pd
+
+from alpaca.entities import Bar, BarBatch, EntityFactory
+from src.base import Strategy
+from src.clients import PublisherClient, SubscriberClient
+from src.mappings import decode_bar
+from src.queues import MarketDataQueue
+from src.strategies import CrossMovingAverage
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+# Benchmark setups by name, filled by the `benchmark` decorator
+cases = {}
+
+
+def benchmark(name: str) -> Callable:
+    """
+    Decorator adding a case to the suite. The decorated function prepares the fixtures and returns the function to
+    time with the number of operations (e.g. messages) it performs per call, results are reported per operation
+    Args:
+        name: The name of the case, e.g. "<class>.<method>"
+
+    Returns:
+        The decorator
+    """
+
+    def decorator(setup: Callable[[], tuple[Callable[[], None], int]]) -> Callable:
+        if name in cases:
+            raise ValueError(f"Benchmark {name} is already registered")
+        cases[name] = setup
+        return setup
+
+    return decorator
+
+
+def load_records(path: Path = DATA_DIR / "bars.json") -> list[dict]:
+    """
+    Bars dumped with Bar.to_dict, the fixture of every case
+    """
+    return json.load(open(path))
+
+
+def api_records(records: list[dict]) -> list[dict]:
+    """
+    The bars as returned by the REST API
+    """
+    return [
+        {
+            "t": record["timestamp"],
+            "o": record["open"],
+            "h": record["high"],
+            "l": record["low"],
+            "c": record["close"],
+            "v": record["volume"],
+            "n": record["num_trades"],
+            "vw": record["vwap"],
+            "x": record["exchange"],
+            "symbol": record["symbol"],
+        }
+        for record in records
+    ]
+
+
+def stream_messages(records: list[dict]) -> list[dict]:
+    """
+    The bars as unpacked from the msgpack frames of the stream
+    """
+    messages = []
+    for record in records:
+        timestamp = pd.Timestamp(record["timestamp"])
+        messages.append(
+            {
+                "T": "b",
+                "S": record["symbol"],
+                "o": record["open"],
+                "h": record["high"],
+                "l": record["low"],
+                "c": record["close"],
+                "v": record["volume"],
+                "t": msgpack.Timestamp.from_unix_nano(timestamp.value),
+                "n": record["num_trades"],
+                "vw": record["vwap"],
+                "x": record["exchange"],
+            }
+        )
+    return messages
+
+
+def load_bars(exchange: str = None) -> list[Bar]:
+    return [
+        decode_bar(message)
+        for message in stream_messages(load_records())
+        if exchange is None or message["x"] == exchange
+    ]
+
+
+class NoopStrategy(Strategy):
+    def apply(self, entity):
+        pass
+
+
+class FakeAPI:
+    """
+    AlpacaAPI answering from the fixtures: the history is the bars up to `visible`, there is no position and orders
+    are only recorded
+    """
+
+    def __init__(self, bars: list[Bar]):
+        self.bars = bars
+        self.visible = 0
+        self.orders = []
+        self.account = SimpleNamespace(cash="10000")
+
+    def get_bars(self, symbol, timeframe="1Min", exchanges=None, crypto=False, **_):
+        return self.bars[: self.visible]
+
+    def get_positions(self, symbol=None):
+        return None
+
+    def place_order(self, **kwargs):
+        self.orders.append(kwargs)
+
+
+@benchmark("EntityFactory.create_entity")
+def entity_factory_create_entity():
+    records = api_records(load_records())
+
+    def run():
+        for record in records:
+            EntityFactory(dict(record)).create_entity("bars")
+
+    return run, len(records)
+
+
+@benchmark("EntityFactory.create_entities")
+def entity_factory_create_entities():
+    records = api_records(load_records())
+
+    def run():
+        EntityFactory.create_entities([dict(record) for record in records], "bars")
+
+    return run, len(records)
+
+
+@benchmark("Bar.to_df")
+def bar_to_df():
+    bars = load_bars()
+    return lambda: Bar.to_df(bars), len(bars)
+
+
+@benchmark("BarBatch.to_df")
+def bar_batch_to_df():
+    bars = load_bars()
+    return lambda: BarBatch.from_bars(bars).to_df(), len(bars)
+
+
+@benchmark("decode_bar")
+def decode_bar_case():
+    messages = stream_messages(load_records())
+
+    def run():
+        for message in messages:
+            decode_bar(message)
+
+    return run, len(messages)
+
+
+@benchmark("PublisherClient.bar_callback")
+def publisher_bar_callback():
+    messages = stream_messages(load_records())
+    publisher = PublisherClient(stream=None)
+    loop = asyncio.new_event_loop()
+
+    async def receive():
+        for message in messages:
+            await publisher.bar_callback(message)
+
+    def run():
+        publisher.queue = Queue()
+        loop.run_until_complete(receive())
+
+    return run, len(messages)
+
+
+@benchmark("PublisherClient.on_frame")
+def publisher_on_frame():
+    messages = stream_messages(load_records())
+    publisher = PublisherClient(stream=None)
+
+    def run():
+        publisher.queue = Queue()
+        publisher.on_frame(messages)
+
+    return run, len(messages)
+
+
+def dispatch(batch_size: int):
+    bars = load_bars()
+    queue = MarketDataQueue(policy="block")
+    subscriber = SubscriberClient(
+        api=None,
+        strategies={"BTCUSD": NoopStrategy()},
+        queue=queue,
+        workers=1,
+        batch_size=batch_size,
+        batch_wait=0.0,
+    )
+    subscriber.start()
+
+    def run():
+        for bar in bars:
+            queue.put(bar)
+        queue.join()
+
+    return run, len(bars)
+
+
+@benchmark("SubscriberClient.dispatch")
+def subscriber_dispatch():
+    return dispatch(batch_size=100)
+
+
+@benchmark("SubscriberClient.dispatch_unbatched")
+def subscriber_dispatch_unbatched():
+    return dispatch(batch_size=1)
+
+
+@benchmark("CrossMovingAverage.apply")
+def cross_moving_average_apply():
+    bars = load_bars("CBSE")
+    api = FakeAPI(bars)
+
+    def run():
+        api.visible = 60
+        strategy = CrossMovingAverage(
+            api, "BTCUSD", crypto=True, allowed_crypto_exchanges=["CBSE"]
+        )
+        for index in range(60, len(bars)):
+            api.visible = index + 1
+            strategy.apply(bars[index])
+
+    return run, len(bars) - 60
@@ -0,0 +1,204 @@
+import argparse
+import datetime
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Union
+
+from benchmarks.cases import cases
+from src.settings import APP_NAME
+
+RESULTS_PATH = Path(__file__).resolve().parent / "results.jsonl"
+
+
+def measure(
+    run: Callable[[], None], operations: int, repeat: int = 7, min_time: float = 0.05
+) -> dict:
+    """
+    Times a benchmark function
+    Args:
+        run: The function to time
+        operations: Number of operations performed by a call
+        repeat: Number of timed rounds
+        min_time: Seconds a round lasts at least, the number of calls per round is calibrated accordingly
+
+    Returns:
+        The median and the best time per operation (nanoseconds) over the rounds
+    """
+    run()  # Warms up the caches and the lazily initialized state
+    start = time.perf_counter_ns()
+    run()
+    elapsed = max(1, time.perf_counter_ns() - start)
+    number = max(1, int(min_time * 1e9 / elapsed))
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            run()
+        timings.append((time.perf_counter_ns() - start) / number / operations)
+    return {
+        "median_ns": round(statistics.median(timings), 1),
+        "min_ns": round(min(timings), 1),
+        "operations": operations,
+    }
+
+
+def run_cases(
+    names: list[str] = None, repeat: int = 7, min_time: float = 0.05
+) -> dict[str, dict]:
+    results = {}
+    for name, setup in cases.items():
+        if names and not any(pattern in name for pattern in names):
+            continue
+        run, operations = setup()
+        results[name] = measure(run, operations, repeat, min_time)
+    return results
+
+
+def load_history(path: Path = RESULTS_PATH) -> list[dict]:
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in open(path) if line.strip()]
+
+
+def environment() -> dict[str, str]:
+    """
+    The Python version and the machine the benchmarks run on, results are only comparable within the same ones
+    """
+    return {
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+    }
+
+
+def baseline(
+    history: list[dict], window: int = 5, environment: dict = None
+) -> dict[str, float]:
+    """
+    Reference time of every case: the median of its last `window` saved medians, so that a single noisy run does
+    not move it. When an environment is given, only the results saved with the same Python and machine count
+    """
+    if environment is not None:
+        history = [
+            entry
+            for entry in history
+            if all(entry.get(key) == value for key, value in environment.items())
+        ]
+    medians = {}
+    for entry in history:
+        for name, result in entry["results"].items():
+            medians.setdefault(name, []).append(result["median_ns"])
+    return {
+        name: statistics.median(values[-window:]) for name, values in medians.items()
+    }
+
+
+def compare(
+    results: dict[str, dict], reference: dict[str, float], tolerance: float = 0.5
+) -> tuple[dict[str, Union[float, None]], bool]:
+    """
+    Compares the results with the reference times
+    Args:
+        results: The results of run_cases
+        reference: The reference time of each case, see baseline
+        tolerance: Relative slowdown above which a case regressed (0.5 fails a case 50% slower than the reference)
+
+    Returns:
+        The relative change of every case (None when it has no reference), and whether any of them regressed
+    """
+    changes = {}
+    for name, result in results.items():
+        if name in reference:
+            changes[name] = result["median_ns"] / reference[name] - 1
+        else:
+            changes[name] = None
+    regressed = any(
+        change is not None and change > tolerance for change in changes.values()
+    )
+    return changes, regressed
+
+
+def save(results: dict[str, dict], path: Path = RESULTS_PATH) -> None:
+    """
+    Appends the results to the tracked history, with the commit and the machine they were measured on
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=path.parent,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    entry = {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(
+            timespec="seconds"
+        ),
+        "commit": commit,
+        **environment(),
+        "results": results,
+    }
+    with open(path, "a") as file:
+        file.write(json.dumps(entry) + "\n")
+
+
+def report(results: dict[str, dict], changes: dict, tolerance: float) -> str:
+    lines = [f"{'benchmark':<40}{'median/op':>14}{'best/op':>14}{'change':>10}"]
+    for name, result in results.items():
+        change = changes.get(name)
+        status = "" if change is None or change <= tolerance else "  REGRESSION"
+        lines.append(
+            f"{name:<40}{result['median_ns'] / 1000:>12.2f}us{result['min_ns'] / 1000:>12.2f}us"
+            f"{'n/a' if change is None else f'{change:+.1%}':>10}{status}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Times the hot paths of the data pipeline and compares them with the tracked results",
+    )
+    parser.add_argument("names", nargs="*", help="Run the cases containing these names")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed rounds per case")
+    parser.add_argument(
+        "--min-time", type=float, default=0.05, help="Seconds per round at least"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Relative slowdown failing a case (default: 0.5)",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help=f"Append the results to {RESULTS_PATH.name}"
+    )
+    parser.add_argument("--results", type=Path, default=RESULTS_PATH)
+    args = parser.parse_args(argv)
+
+    # Strategies log their orders, which would be timed as well
+    logging.getLogger(APP_NAME).setLevel(logging.WARNING)
+    results = run_cases(args.names, args.repeat, args.min_time)
+    reference = baseline(load_history(args.results), environment=environment())
+    changes, regressed = compare(results, reference, args.tolerance)
+    print(report(results, changes, args.tolerance))
+    if not reference:
+        # Timings from another machine or Python say nothing about this run
+        current = environment()
+        print(
+            f"No results saved with Python {current['python']} on {current['machine']}, nothing to compare with"
+        )
+    if args.save:
+        save(results, args.results)
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,37 +2,95 @@ import os
 
 from alpaca_trade_api import Stream
 
-from alpaca.clients import AlpacaAPI
+from alpaca.clients import AlpacaAPI, AsyncAlpacaAPI
+from alpaca.store import BarStore
 from src.clients import PublisherClient, SubscriberClient
+from src.journal import Journal
+from src.market import ConflationBuffer
+from src.metrics import MetricsExporter
+from src.orders import OrderGateway
+from src.portfolio import PortfolioCache
+from src.profiling import SamplingProfiler
 from src.settings import (
     APCA_API_KEY_ID,
     APCA_API_SECRET_KEY,
     APCA_API_BASE_URL,
     DATA_FEED,
     CRYPTO,
-    SYMBOL,
+    SYMBOLS,
     ALLOWED_CRYPTO_EXCHANGES,
+    BAR_STORE_PATH,
+    JOURNAL_PATH,
+    STRATEGIES,
+    PROFILE,
+    PROFILE_INTERVAL,
+    PROFILE_PATH,
 )
-from src.strategies import CrossMovingAverage
+from src.runner import build_runners
 
 os.environ.setdefault("APCA_API_KEY_ID", APCA_API_KEY_ID)
 os.environ.setdefault("APCA_API_SECRET_KEY", APCA_API_SECRET_KEY)
 os.environ.setdefault("APCA_API_BASE_URL", APCA_API_BASE_URL)
 
 if __name__ == "__main__":
+    # Opt-in sampling profiler, per-function timings are written when the session stops
+    profiler = SamplingProfiler(PROFILE_INTERVAL) if PROFILE else None
+    if profiler is not None:
+        profiler.start()
+
     # These are Alpaca's interfaces for streaming and REST API
     stream = Stream(data_feed=DATA_FEED, raw_data=True)
-    api = AlpacaAPI()
+    store = BarStore(BAR_STORE_PATH)
+    api = AlpacaAPI(store=store)
+    # Shares the event loop of the stream once it is running, the rate limit and the memoized results of the REST client
+    async_api = AsyncAlpacaAPI(stream=stream, limiter=api.limiter, cache=api.cache)
+    # Account and positions kept in memory, updated by the trade updates stream. They are loaded in the background
+    # while the stream connects, like the history of the strategies (see SubscriberClient.start)
+    portfolio = PortfolioCache(api)
+    portfolio.prefetch()
+    # Latest quote and trade of each symbol, read by the strategies without queueing
+    market = ConflationBuffer(ALLOWED_CRYPTO_EXCHANGES if CRYPTO else None)
+    # Orders are submitted in the background, on the loop of the async client
+    orders = OrderGateway(async_api)
 
-    strategy = CrossMovingAverage(
+    # Every strategy, grouped by symbol, is fed by a single stream connection
+    specs = STRATEGIES or [
+        {"strategy": "cross_moving_average", "symbol": symbol} for symbol in SYMBOLS
+    ]
+    strategies = build_runners(
+        specs,
         api=api,
-        symbol=SYMBOL,
         crypto=CRYPTO,
         allowed_crypto_exchanges=ALLOWED_CRYPTO_EXCHANGES,
+        async_api=async_api,
+        portfolio=portfolio,
+        market=market,
+        orders=orders,
+    )
+
+    # Raw stream messages recorded for replay (python -m src.replay), when JOURNAL_PATH is set
+    journal = Journal(JOURNAL_PATH) if JOURNAL_PATH else None
+    publisher = PublisherClient(
+        stream=stream,
+        store=store,
+        symbols=list(strategies),
+        portfolio=portfolio,
+        market=market,
+        orders=orders,
+        journal=journal,
     )
+    subscriber = SubscriberClient(api=api, strategies=strategies, crypto=CRYPTO)
 
-    publisher = PublisherClient(stream=stream)
-    subscriber = SubscriberClient(api=api, strategy=strategy, crypto=CRYPTO)
+    # Latency histograms of every stage, on /metrics and in a periodic log summary, with the counters of the queues
+    # the dispatchers read from
+    MetricsExporter(queue=subscriber).start()
 
     subscriber.start()
-    publisher.start()
+    try:
+        publisher.start()
+    finally:
+        if journal is not None:
+            journal.close()
+        if profiler is not None:
+            profiler.stop()
+            profiler.dump(PROFILE_PATH)
@@ -0,0 +1,452 @@
+import datetime
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Union
+
+import numpy as np
+
+from alpaca.entities import Bar, BarBatch, Position
+from alpaca.timestamps import from_nanoseconds, to_nanoseconds, to_nanoseconds_array
+from src.base import Strategy
+from src.settings import APP_NAME, BASE_DIR
+
+logger = logging.getLogger(APP_NAME)
+
+
+@dataclass(frozen=True)
+class Fill:
+    index: int
+    timestamp: int
+    symbol: str
+    side: str
+    qty: float
+    price: float
+
+
+@dataclass
+class SimulatedAccount:
+    cash: float
+
+
+@dataclass
+class BacktestResult:
+    """
+    Outcome of a backtest.
+
+    Attributes:
+        fills (list[Fill]): The executed orders, in order.
+        equity (np.ndarray): Cash plus market value of the positions after each bar.
+        initial_cash (float): Cash at the start of the backtest.
+
+    """
+
+    fills: list[Fill]
+    equity: np.ndarray
+    initial_cash: float
+    elapsed: float = field(default=0.0, compare=False)
+
+    @property
+    def pnl(self) -> float:
+        if not len(self.equity):
+            return 0.0
+        return float(self.equity[-1] - self.initial_cash)
+
+    @property
+    def max_drawdown(self) -> float:
+        if not len(self.equity):
+            return 0.0
+        return float(np.max(np.maximum.accumulate(self.equity) - self.equity))
+
+    @property
+    def trades(self) -> int:
+        return sum(1 for fill in self.fills if fill.side == "sell")
+
+
+def load_bars_json(
+    path: Union[str, Path] = Path(BASE_DIR) / "data" / "bars.json",
+    symbol: str = None,
+    exchange: str = None,
+) -> BarBatch:
+    """
+    Loads bars dumped with Bar.to_dict (like data/bars.json) into a BarBatch
+    Args:
+        path: The JSON file
+        symbol: Keep only the bars of this symbol, defaults to the symbol of the first bar
+        exchange: Keep only the bars of this exchange
+
+    Returns:
+        The bars, sorted by timestamp
+    """
+    records = json.load(open(path))
+    if symbol is None:
+        symbol = records[0]["symbol"] if records else ""
+    records = [
+        record
+        for record in records
+        if record["symbol"] == symbol
+        and (exchange is None or record.get("exchange") == exchange)
+    ]
+    timestamps = to_nanoseconds_array([record["timestamp"] for record in records])
+    order = np.argsort(timestamps, kind="stable")
+    return BarBatch(
+        symbol=symbol,
+        timestamp=timestamps,
+        open=[record["open"] for record in records],
+        high=[record["high"] for record in records],
+        low=[record["low"] for record in records],
+        close=[record["close"] for record in records],
+        volume=[record["volume"] for record in records],
+        num_trades=[record["num_trades"] for record in records],
+        vwap=[record["vwap"] for record in records],
+        exchange=[record.get("exchange", "") for record in records],
+    )[order]
+
+
+def simulated_position(
+    symbol: str, qty: float, entry_price: float, price: float
+) -> Position:
+    """
+    Long position of a simulated account, valued at the given price
+    """
+    unrealized_pl = qty * (price - entry_price)
+    return Position(
+        asset_id="",
+        symbol=symbol,
+        exchange="",
+        asset_class="",
+        avg_entry_price=entry_price,
+        qty=qty,
+        side="long",
+        market_value=qty * price,
+        cost_basis=qty * entry_price,
+        unrealized_pl=unrealized_pl,
+        unrealized_plpc=unrealized_pl / (qty * entry_price),
+        unrealized_intraday_pl=unrealized_pl,
+        unrealized_intraday_plpc=unrealized_pl / (qty * entry_price),
+        current_price=price,
+        lastday_price=entry_price,
+        change_today=0.0,
+    )
+
+
+class SimulatedAlpacaAPI:
+    """
+    Stand-in for AlpacaAPI that replays historical bars.
+
+    Only the bars up to the current one are visible through get_bars, orders are filled immediately at the close of
+    the current bar and positions and cash are kept in memory (long only).
+    """
+
+    def __init__(
+        self,
+        bars: BarBatch,
+        cash: float = 10000.0,
+        history: datetime.timedelta = datetime.timedelta(hours=2),
+    ):
+        self.bars = bars
+        self.history = history
+        self.account = SimulatedAccount(cash=cash)
+        self.positions = {}
+        self.prices = {}
+        self.fills = []
+        self.index = -1
+        self.store = None
+
+    @property
+    def end(self) -> datetime.datetime:
+        return from_nanoseconds(self.bars.timestamp[self.index])
+
+    @property
+    def start(self) -> datetime.datetime:
+        return self.end - self.history
+
+    @property
+    def equity(self) -> float:
+        return self.account.cash + sum(
+            qty * self.prices[symbol] for symbol, (qty, _) in self.positions.items()
+        )
+
+    def advance(self, index: int) -> Bar:
+        """
+        Moves the clock to the bar at the given index
+        """
+        self.index = index
+        bar = self.bars[index]
+        self.prices[bar.symbol] = bar.close
+        return bar
+
+    def get_account(self) -> dict:
+        return {"cash": self.account.cash}
+
+    def get_bars(
+        self,
+        symbol: str,
+        timeframe: str = "1Min",
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        exchanges: list = None,
+        crypto: bool = False,
+        **kwargs,
+    ) -> list[Bar]:
+        return list(
+            self.get_bar_batch(symbol, timeframe, start, end, exchanges, crypto)
+        )
+
+    def get_bar_batch(
+        self,
+        symbol: str,
+        timeframe: str = "1Min",
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        exchanges: list = None,
+        crypto: bool = False,
+        **kwargs,
+    ) -> BarBatch:
+        if symbol != self.bars.symbol:
+            return self.bars[:0]
+        end = min(to_nanoseconds(end or self.end), int(self.bars.timestamp[self.index]))
+        start = to_nanoseconds(start or self.start)
+        left = int(np.searchsorted(self.bars.timestamp, start, side="left"))
+        right = int(np.searchsorted(self.bars.timestamp, end, side="right"))
+        right = min(right, self.index + 1)
+
+        bars = self.bars[left:right]
+        if crypto and exchanges:
+            bars = bars[np.isin(bars.exchange, list(exchanges))]
+        return bars
+
+    def get_positions(self, symbol: str = None):
+        if symbol is None:
+            return [self.get_positions(symbol) for symbol in self.positions]
+        if symbol not in self.positions:
+            return None
+
+        qty, entry_price = self.positions[symbol]
+        return simulated_position(symbol, qty, entry_price, self.prices[symbol])
+
+    def get_orders(self) -> list:
+        return []
+
+    def place_order(
+        self, symbol: str, qty: float = None, side: str = "buy", **kwargs
+    ) -> Union[Fill, None]:
+        qty = float(qty or 0)
+        held, entry_price = self.positions.get(symbol, (0.0, 0.0))
+        if qty <= 0 or (side == "sell" and qty > held):
+            logger.debug(f"Rejected order: {symbol=}, {side=}, {qty=}")
+            return None
+
+        price = self.prices[symbol]
+        if side == "buy":
+            self.account.cash -= qty * price
+            self.positions[symbol] = (held + qty, price if not held else entry_price)
+        else:
+            self.account.cash += qty * price
+            if qty == held:
+                del self.positions[symbol]
+            else:
+                self.positions[symbol] = (held - qty, entry_price)
+
+        fill = Fill(
+            self.index,
+            int(self.bars.timestamp[self.index]),
+            symbol,
+            side,
+            qty,
+            price,
+        )
+        self.fills.append(fill)
+        return fill
+
+
+class Backtester:
+    """
+    Replays historical bars through a strategy.
+
+    `run` is event driven: every bar goes through Strategy.apply against a SimulatedAlpacaAPI, so any strategy can
+    be evaluated. `run_vectorized` is the fast path for strategies implementing Strategy.signals: the signals of the
+    whole series are computed at once and only the bars where an order can happen are visited. It follows the rules
+    of CrossMovingAverage.apply, so both modes produce the same fills:
+
+    - when flat, buy `round(cash / high * 0.8, 2)` at the close of the first bar with an entry signal
+    - when long, sell everything at the close of the first bar with an exit signal, or whose unrealized P/L
+      (rounded to cents) reaches `stop_loss` or `take_profit`
+    - after a stop loss or take profit, do not enter again before a bar without entry signal
+
+    Attributes:
+        factory (Callable): Builds the strategy for the given (simulated) API.
+        bars (BarBatch): The bars to replay, of a single symbol and exchange.
+        cash (float): Initial cash.
+
+    """
+
+    position_size = 0.8
+
+    def __init__(
+        self,
+        factory: Callable[[SimulatedAlpacaAPI], Strategy],
+        bars: BarBatch,
+        cash: float = 10000.0,
+    ):
+        self.factory = factory
+        self.bars = bars
+        self.cash = cash
+
+    def run(self) -> BacktestResult:
+        started = datetime.datetime.now()
+        api = SimulatedAlpacaAPI(self.bars, self.cash)
+        strategy = self.factory(api)
+
+        equity = np.empty(len(self.bars))
+        for index in range(len(self.bars)):
+            strategy.apply(api.advance(index))
+            equity[index] = api.equity
+
+        elapsed = (datetime.datetime.now() - started).total_seconds()
+        return BacktestResult(api.fills, equity, self.cash, elapsed)
+
+    def run_vectorized(self) -> BacktestResult:
+        started = datetime.datetime.now()
+        strategy = self.factory(SimulatedAlpacaAPI(self.bars, self.cash))
+        entries, exits = strategy.signals(self.bars)
+
+        fills = simulate(
+            self.bars,
+            entries,
+            exits,
+            self.cash,
+            stop_loss=getattr(strategy, "stop_loss", None),
+            take_profit=getattr(strategy, "take_profit", None),
+            position_size=self.position_size,
+        )
+        equity = equity_curve(self.bars.close, fills, self.cash)
+
+        elapsed = (datetime.datetime.now() - started).total_seconds()
+        return BacktestResult(fills, equity, self.cash, elapsed)
+
+
+def _next_index(indexes: np.ndarray, start: int) -> Union[int, None]:
+    position = np.searchsorted(indexes, start)
+    return int(indexes[position]) if position < len(indexes) else None
+
+
+def _find_exit(
+    close: np.ndarray,
+    exits: np.ndarray,
+    start: int,
+    qty: float,
+    entry_price: float,
+    stop_loss: float,
+    take_profit: float,
+) -> tuple[Union[int, None], bool]:
+    """
+    Finds the first bar from `start` closing the position, scanning blocks of growing size.
+
+    Returns the index of the bar (None when the position is never closed) and whether it was closed by the
+    stop loss or take profit.
+    """
+    size = 64
+    while start < len(close):
+        stop = min(start + size, len(close))
+        profit_loss = qty * (close[start:stop] - entry_price)
+        # The candidates are widened by a cent and then checked one by one with the same rounding as the strategy
+        candidates = exits[start:stop].copy()
+        if stop_loss is not None:
+            candidates |= profit_loss <= stop_loss + 0.01
+        if take_profit is not None:
+            candidates |= profit_loss >= take_profit - 0.01
+
+        for offset in np.flatnonzero(candidates):
+            index = start + int(offset)
+            if exits[index]:
+                return index, False
+            rounded = round(float(qty * (close[index] - entry_price)), 2)
+            if (stop_loss is not None and rounded <= stop_loss) or (
+                take_profit is not None and rounded >= take_profit
+            ):
+                return index, True
+        start, size = stop, size * 2
+    return None, False
+
+
+def simulate(
+    bars: BarBatch,
+    entries: np.ndarray,
+    exits: np.ndarray,
+    cash: float,
+    stop_loss: float = None,
+    take_profit: float = None,
+    position_size: float = 0.8,
+) -> list[Fill]:
+    """
+    Turns entry and exit signals into fills (see Backtester for the rules)
+    """
+    close, high = bars.close, bars.high
+    entries, exits = np.asarray(entries, dtype=bool), np.asarray(exits, dtype=bool)
+    entry_indexes, other_indexes = np.flatnonzero(entries), np.flatnonzero(~entries)
+
+    fills = []
+    index, inhibit = 0, False
+    while index < len(close):
+        if inhibit:
+            index = _next_index(other_indexes, index)
+            if index is None:
+                break
+            inhibit, index = False, index + 1
+            continue
+
+        index = _next_index(entry_indexes, index)
+        if index is None:
+            break
+        qty = round(cash / float(high[index]) * position_size, 2)
+        if qty <= 0:
+            index += 1
+            continue
+
+        entry_price = float(close[index])
+        cash -= qty * entry_price
+        fills.append(
+            Fill(
+                index, int(bars.timestamp[index]), bars.symbol, "buy", qty, entry_price
+            )
+        )
+
+        index, inhibit = _find_exit(
+            close, exits, index + 1, qty, entry_price, stop_loss, take_profit
+        )
+        if index is None:
+            break
+        exit_price = float(close[index])
+        cash += qty * exit_price
+        fills.append(
+            Fill(
+                index, int(bars.timestamp[index]), bars.symbol, "sell", qty, exit_price
+            )
+        )
+        index += 1
+    return fills
+
+
+def equity_curve(close: np.ndarray, fills: list[Fill], cash: float) -> np.ndarray:
+    """
+    Cash plus market value of the position after each bar
+    """
+    cash_after = np.empty(len(close))
+    held = np.zeros(len(close))
+
+    previous, qty = 0, 0.0
+    for fill in fills:
+        cash_after[previous : fill.index] = cash
+        held[previous : fill.index] = qty
+        if fill.side == "buy":
+            cash -= fill.qty * fill.price
+            qty += fill.qty
+        else:
+            cash += fill.qty * fill.price
+            qty -= fill.qty
+        previous = fill.index
+    cash_after[previous:] = cash
+    held[previous:] = qty
+    return cash_after + held * close
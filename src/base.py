@@ -5,3 +5,39 @@ class Strategy(abc.ABC):
     @abc.abstractmethod
     def apply(self, entity):
         pass
+
+    def warm_up(self) -> None:
+        """
+        Loads what the strategy needs before the first message (e.g. the history of its indicators). It is called
+        once by the SubscriberClient before dispatching, concurrently with the stream connection and the warm-up of
+        the other symbols. By default there is nothing to load.
+        """
+
+    def apply_batch(self, entities: list):
+        """
+        Applies the strategy to the messages received since the last call, in order.
+
+        The dispatcher already dropped the bars superseded within the batch. Strategies that can act on the latest
+        state only should override it to evaluate once per batch, by default every message is applied.
+        Args:
+            entities: The messages of a single symbol
+
+        Returns:
+            None
+        """
+        for entity in entities:
+            self.apply(entity)
+
+    def signals(self, batch):
+        """
+        Vectorized form of the strategy, used by the backtester fast path
+        Args:
+            batch: The bars as a BarBatch
+
+        Returns:
+            Two boolean arrays telling, for each bar, whether a long position should be opened (entries) and
+            whether an open one should be closed (exits)
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not implement vectorized signals"
+        )
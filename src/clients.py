@@ -1,13 +1,24 @@
 import logging
 import threading
-from queue import Queue
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Queue
 from typing import Union
 
 from alpaca_trade_api import Stream
 
 from alpaca.clients import AlpacaAPI
 from alpaca.entities import Bar, Quote
+from alpaca.store import BarStore
+from alpaca.timestamps import to_nanoseconds
 from src.base import Strategy
+from src.journal import BAR, QUOTE, TRADE, Journal
+from src.mappings import decode_bar
+from src.market import ConflationBuffer
+from src.orders import OrderGateway
+from src.portfolio import PortfolioCache
+from src.queues import MarketDataQueue
 from src.settings import (
     q,
     BAR_SIZE,
@@ -15,15 +26,48 @@ from src.settings import (
     SYMBOL,
     ALLOWED_CRYPTO_EXCHANGES,
     APP_NAME,
+    DISPATCH_WORKERS,
+    DISPATCH_BATCH_SIZE,
+    DISPATCH_BATCH_WAIT,
+)
+from src.tracing import (
+    DEQUEUE,
+    ENQUEUE,
+    RECEIVE,
+    STRATEGY_END,
+    STRATEGY_START,
+    tracer,
 )
 
 logger = logging.getLogger(APP_NAME)
 
 
+def trade_update_data(update) -> dict:
+    """
+    Unwraps a trade update as handed by alpaca_trade_api.Stream: an Entity, or with raw_data the message of the
+    stream ({"stream": "trade_updates", "data": {...}})
+    Args:
+        update: The update received by the handler
+
+    Returns:
+        The update itself, with the `event` and the `order`
+    """
+    update = getattr(update, "_raw", update)
+    if "event" not in update and "data" in update:
+        update = update["data"]
+    return update
+
+
 class PublisherClient:
     """
     PublisherClient is a class that subscribes to the Alpaca stream API and then pushes messages to the queue so that
     the Dispatcher can process them sequentially.
+
+    A single stream connection can carry many symbols: pass `symbols` to subscribe all of them at once. When a
+    PortfolioCache or an OrderGateway is given, it is kept up to date with the trade updates of the same connection. Quotes and trades
+    do not go through the queue: when a ConflationBuffer is given, it keeps the latest ones of each symbol. When a
+    Journal is given, every bar, quote and trade is appended to it as received, to be replayed later (see
+    src.replay).
     """
 
     def __init__(
@@ -33,13 +77,27 @@ class PublisherClient:
         bar_size: str = BAR_SIZE,
         crypto_symbols: list = CRYPTO_SYMBOLS,
         queue: Queue = q,
+        store: BarStore = None,
+        timeframe: str = "1Min",
+        symbols: list = None,
+        portfolio: PortfolioCache = None,
+        market: ConflationBuffer = None,
+        orders: OrderGateway = None,
+        journal: Journal = None,
     ):
         self.stream = stream
-        self.symbol = symbol
+        self.symbols = list(symbols) if symbols else [symbol]
+        self.symbol = self.symbols[0]
         self.bar_size = bar_size
-        self.crypto_symbols = crypto_symbols
+        self.crypto_symbols = [symbol.strip() for symbol in crypto_symbols]
 
         self.queue = queue
+        self.store = store
+        self.timeframe = timeframe
+        self.portfolio = portfolio
+        self.market = market
+        self.orders = orders
+        self.journal = journal
 
     def start(self):
         """
@@ -49,26 +107,31 @@ class PublisherClient:
 
         """
         logger.info(f"Starting {self.__class__.__name__}")
-        if self.symbol in self.crypto_symbols:
-            logger.info(
-                f"Subscribing data for {self.symbol} ({ALLOWED_CRYPTO_EXCHANGES})"
-            )
-            self.stream.subscribe_crypto_trades(self.trade_callback, self.symbol)
+        crypto = [symbol for symbol in self.symbols if symbol in self.crypto_symbols]
+        stocks = [symbol for symbol in self.symbols if symbol not in crypto]
+
+        if crypto:
+            logger.info(f"Subscribing data for {crypto} ({ALLOWED_CRYPTO_EXCHANGES})")
+            self.stream.subscribe_crypto_trades(self.trade_callback, *crypto)
             self.stream.subscribe_crypto_bars(
                 self.bar_callback,
-                self.symbol,
+                *crypto,
                 self.bar_size,
             )
-            self.stream.subscribe_crypto_quotes(self.quote_callback, self.symbol)
-        else:
-            self.stream.subscribe_trades(self.trade_callback, self.symbol)
+            self.stream.subscribe_crypto_quotes(self.quote_callback, *crypto)
+        if stocks:
+            logger.info(f"Subscribing data for {stocks}")
+            self.stream.subscribe_trades(self.trade_callback, *stocks)
 
             self.stream.subscribe_bars(
                 self.bar_callback,
-                self.symbol,
+                *stocks,
                 self.bar_size,
             )
-            self.stream.subscribe_quotes(self.quote_callback, self.symbol)
+            self.stream.subscribe_quotes(self.quote_callback, *stocks)
+        if self.portfolio is not None or self.orders is not None:
+            logger.info("Subscribing trade updates")
+            self.stream.subscribe_trade_updates(self.trade_update_callback)
 
         self.stream.run()  # stream.run() is blocking, so stop will be executed after stream.run() returns
         self.stop()
@@ -80,14 +143,33 @@ class PublisherClient:
             None
         """
         logger.info(f"Stopping {self.__class__.__name__}")
+        if self.journal is not None:
+            self.journal.flush()
+
+    def on_bar(self, bar: Bar) -> None:
+        tracer.stamp(bar, RECEIVE)
+        if self.store is not None:
+            self.store.append(bar, self.timeframe)
+        tracer.stamp(bar, ENQUEUE)
+        self.queue.put(bar)
+
+    def on_quote(self, quote: dict) -> None:
+        if self.market is not None:
+            self.market.update_quote(
+                quote["S"],
+                quote["bp"],
+                quote["bs"],
+                quote["ap"],
+                quote["as"],
+                quote.get("t"),
+                quote.get("x", ""),
+            )
 
-    @staticmethod
-    def clean_message(message):
-        message.pop("T")
-        message["symbol"] = message.pop("S")
-        if "as" in message.keys():
-            message["as_"] = message.pop("as")
-        return message
+    def on_trade(self, trade: dict) -> None:
+        if self.market is not None:
+            self.market.update_trade(
+                trade["S"], trade["p"], trade["s"], trade.get("t"), trade.get("x", "")
+            )
 
     async def bar_callback(self, bar: dict) -> None:
         """
@@ -98,11 +180,11 @@ class PublisherClient:
         Returns:
             None
         """
-
-        logger.debug(f"Received bar: {bar}")
-        bar = self.clean_message(bar)
-
-        self.queue.put(Bar(**bar))
+        # Lazy formatting, the message is only converted to a string when debug logging is enabled
+        logger.debug("Received bar: %s", bar)
+        if self.journal is not None:
+            self.journal.append(BAR, bar)
+        self.on_bar(decode_bar(bar))
 
     async def quote_callback(self, quote: dict) -> None:
         """
@@ -114,10 +196,10 @@ class PublisherClient:
             None
 
         """
-        logger.debug(f"Received quote: {quote}")
-        quote = self.clean_message(quote)
-
-        # self.queue.put(Quote(**quote))
+        logger.debug("Received quote: %s", quote)
+        if self.journal is not None:
+            self.journal.append(QUOTE, quote)
+        self.on_quote(quote)
 
     async def trade_callback(self, trade: dict):
         """
@@ -129,46 +211,304 @@ class PublisherClient:
             None
 
         """
-        # self.queue.put(trade)
-        pass
+        logger.debug("Received trade: %s", trade)
+        if self.journal is not None:
+            self.journal.append(TRADE, trade)
+        self.on_trade(trade)
+
+    def on_frame(self, messages: list[dict]) -> None:
+        """
+        Handles the raw messages of a websocket frame in one pass: quotes and trades update the ConflationBuffer from
+        the wire keys, bars are decoded into Bar entities and queued, other messages are skipped. Bars, quotes and
+        trades are journaled first when a Journal is given
+        Args:
+            messages: The messages, as unpacked from msgpack
+
+        Returns:
+            None
+        """
+        for message in messages:
+            kind = message.get("T")
+            if self.journal is not None and kind in (BAR, QUOTE, TRADE):
+                self.journal.append(kind, message)
+            if kind == "q":
+                self.on_quote(message)
+            elif kind == "t":
+                self.on_trade(message)
+            elif kind == "b":
+                self.on_bar(decode_bar(message))
+
+    async def trade_update_callback(self, update) -> None:
+        """
+        Callback for the stream.subscribe_trade_updates method, called when an order changes
+        Args:
+            update: The trade update, as an Entity or the raw message of the stream (see trade_update_data)
+
+        Returns:
+            None
+
+        """
+        logger.debug("Received trade update: %s", update)
+        update = trade_update_data(update)
+        if self.portfolio is not None:
+            await self.portfolio.trade_update_callback(update)
+        if self.orders is not None:
+            try:
+                self.orders.on_trade_update(update)
+            except Exception as e:
+                logger.exception(e)
 
 
 class SubscriberClient:
     """
-    Class that handles the order dispatching in synchronous way
+    Class that handles the order dispatching in synchronous way.
+
+    Each symbol has its own strategy. With more than one worker, messages are routed to a pool of "Dispatcher"
+    threads sharded by symbol: messages of the same symbol are always processed in order by the same worker, while
+    different symbols are processed in parallel, so a slow strategy only stalls the symbols of its shard.
+
+    Each shard is bounded like the queue it is fed from, with the same overflow policy: a slow shard drops or
+    conflates its own messages, or blocks the Router (and so the queue) with the block policy.
+
+    When messages pile up (e.g. after a reconnect), each dispatcher drains up to `batch_size` of them, waiting at most
+    `batch_wait` seconds for more. Bars superseded within the batch (same symbol, exchange and timestamp) are dropped
+    and the remaining ones are handed to Strategy.apply_batch, so a backlog is cleared in one evaluation per symbol.
     """
 
     def __init__(
         self,
         api: AlpacaAPI,
-        strategy: Strategy,
+        strategy: Strategy = None,
         symbol: str = SYMBOL,
         crypto: bool = False,
         queue: Queue = q,
+        strategies: dict[str, Strategy] = None,
+        workers: int = DISPATCH_WORKERS,
+        batch_size: int = DISPATCH_BATCH_SIZE,
+        batch_wait: float = DISPATCH_BATCH_WAIT,
     ):
         self.api = api
         self.strategy = strategy
+        self.strategies = strategies if strategies else {symbol: strategy}
 
         self.symbol = symbol
         self.crypto = crypto
 
         self.queue = queue
+        self.workers = max(1, workers)
+        self.shards = [self.make_shard() for _ in range(self.workers)]
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+
+    def make_shard(self) -> Queue:
+        if isinstance(self.queue, MarketDataQueue):
+            return MarketDataQueue(
+                maxsize=self.queue.maxsize,
+                policy=self.queue.policy,
+                clock=self.queue.clock,
+            )
+        return Queue(getattr(self.queue, "maxsize", 0))
 
     def start(self):
+        """
+        Starts the dispatchers in the background, once the strategies are warmed up. The messages received in the
+        meantime wait in the queue, so the warm-up runs concurrently with the stream connection.
+        Returns:
+            None
+        """
         logger.info(f"Starting {self.__class__.__name__}")
-        threading.Thread(name="Dispatcher", target=self.listen, daemon=True).start()
+        threading.Thread(name="Warmup", target=self.run, daemon=True).start()
+
+    def run(self):
+        self.warm_up()
+        self.start_dispatchers()
+
+    def warm_up(self) -> None:
+        """
+        Warms up the strategies of every symbol concurrently (see Strategy.warm_up). A strategy failing to warm up
+        is logged and dispatched anyway, it loads what it needs on its first message.
+        Returns:
+            None
+        """
+        strategies = [
+            strategy for strategy in self.strategies.values() if strategy is not None
+        ]
+        if not strategies:
+            return
+        start = time.monotonic()
+        with ThreadPoolExecutor(
+            max_workers=min(len(strategies), self.workers),
+            thread_name_prefix="Warmup",
+        ) as executor:
+            futures = [executor.submit(strategy.warm_up) for strategy in strategies]
+        for future in futures:
+            if future.exception() is not None:
+                logger.error("Warm-up failed", exc_info=future.exception())
+        logger.info(
+            f"Warmed up {len(strategies)} strategies in {time.monotonic() - start:.3f}s"
+        )
+
+    def start_dispatchers(self):
+        if self.workers == 1:
+            threading.Thread(name="Dispatcher", target=self.listen, daemon=True).start()
+            return
+
+        for index, shard in enumerate(self.shards):
+            threading.Thread(
+                name=f"Dispatcher-{index}",
+                target=self.listen,
+                args=(shard,),
+                daemon=True,
+            ).start()
+        threading.Thread(name="Router", target=self.route, daemon=True).start()
+
+    def shard(self, symbol: str) -> Queue:
+        return self.shards[zlib.crc32(symbol.encode()) % self.workers]
+
+    def snapshot(self) -> dict:
+        """
+        Returns the counters of the queues the dispatchers read from: the queue itself with a single worker, else the
+        shards summed up, the time spent in the queue before being routed added to the latencies
+        """
+        if self.workers == 1 or not isinstance(self.queue, MarketDataQueue):
+            return self.queue.snapshot()
+
+        routed = self.queue.snapshot()
+        shards = [shard.snapshot() for shard in self.shards]
+        dequeued = sum(shard["dequeued"] for shard in shards)
+        latency_total = sum(
+            shard["latency_avg"] * shard["dequeued"] for shard in shards
+        )
+        return {
+            "depth": routed["depth"] + sum(shard["depth"] for shard in shards),
+            "maxsize": routed["maxsize"],
+            "policy": routed["policy"],
+            "enqueued": routed["enqueued"],
+            "dequeued": dequeued,
+            **{
+                counter: routed[counter] + sum(shard[counter] for shard in shards)
+                for counter in ("dropped", "conflated", "blocked")
+            },
+            "max_depth": max(shard["max_depth"] for shard in shards),
+            "latency_last": routed["latency_last"]
+            + max(shard["latency_last"] for shard in shards),
+            "latency_avg": routed["latency_avg"]
+            + (latency_total / dequeued if dequeued else 0.0),
+            "latency_max": routed["latency_max"]
+            + max(shard["latency_max"] for shard in shards),
+            "shards": shards,
+        }
+
+    def get_strategy(self, symbol: str) -> Union[Strategy, None]:
+        strategy = self.strategies.get(symbol)
+        if strategy is None and len(self.strategies) == 1:
+            # A single strategy handles whatever symbol it was subscribed to
+            strategy = next(iter(self.strategies.values()))
+        return strategy
 
     def process_entity(self, entity: Union[Bar, Quote]):
         if isinstance(entity, Bar):
-            self.strategy.apply(entity)
+            strategy = self.get_strategy(entity.symbol)
+            if strategy is not None:
+                tracer.stamp(entity, STRATEGY_START)
+                try:
+                    strategy.apply(entity)
+                finally:
+                    tracer.stamp(entity, STRATEGY_END)
+            else:
+                logger.debug("No strategy for %s.", entity.symbol)
         else:
-            logger.debug(f"Message type {type(entity)} not supported.")
+            logger.debug("Message type %s not supported.", type(entity))
 
-    def listen(self):
+    @staticmethod
+    def collapse(bars: list[Bar]) -> list[Bar]:
+        """
+        Drops the bars superseded by a later bar of the same symbol, exchange and timestamp
+        Args:
+            bars: The bars, in the order they were received
+
+        Returns:
+            The latest version of each bar, in the order they were first received
+        """
+        latest = {}
+        for bar in bars:
+            latest[(bar.symbol, bar.exchange, to_nanoseconds(bar.timestamp))] = bar
+        return list(latest.values())
+
+    def process_batch(self, messages: list[Union[Bar, Quote]]):
+        bars = {}
+        for message in messages:
+            if isinstance(message, Bar):
+                bars.setdefault(message.symbol, []).append(message)
+            else:
+                logger.debug("Message type %s not supported.", type(message))
+
+        for symbol, symbol_bars in bars.items():
+            strategy = self.get_strategy(symbol)
+            if strategy is None:
+                logger.debug("No strategy for %s.", symbol)
+                continue
+            symbol_bars = self.collapse(symbol_bars)
+            tracer.stamp_all(symbol_bars, STRATEGY_START)
+            try:
+                strategy.apply_batch(symbol_bars)
+            except Exception as e:
+                logger.exception(e)
+            tracer.stamp_all(symbol_bars, STRATEGY_END)
+
+    def drain(self, queue: Queue, message) -> list:
+        """
+        Collects the messages available after the first one, up to the batch size
+        Args:
+            queue: The queue to drain
+            message: The message already taken from the queue
+
+        Returns:
+            The batch of messages
+        """
+        batch = [message]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    batch.append(queue.get(timeout=timeout))
+                else:
+                    batch.append(queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def route(self):
         while True:
             message = self.queue.get()
+            self.shard(message.symbol).put(message)
+            self.queue.task_done()
+
+    def listen(self, queue: Queue = None):
+        queue = self.queue if queue is None else queue
+        while True:
+            message = queue.get()
+            if self.batch_size == 1:
+                tracer.stamp(message, DEQUEUE)
+                logger.debug(
+                    "Received message %s [Queue size: %d]", message, queue.qsize()
+                )
+                try:
+                    self.process_entity(message)
+                except Exception as e:
+                    logger.exception(e)
+                queue.task_done()
+                continue
+
+            batch = self.drain(queue, message)
+            tracer.stamp_all(batch, DEQUEUE)
             logger.debug(
-                f"Received message {message} [Queue size: {self.queue.qsize()}]"
+                "Received %d messages [Queue size: %d]", len(batch), queue.qsize()
             )
-            self.process_entity(message)
-            self.queue.task_done()
+            try:
+                self.process_batch(batch)
+            except Exception as e:
+                logger.exception(e)
+            for _ in batch:
+                queue.task_done()
@@ -1,12 +1,17 @@
+import datetime
 import logging
-from typing import Union
+from typing import TYPE_CHECKING, Union
 
-import pandas as pd
+import msgpack
 
-from alpaca.clients import AlpacaAPI
+from alpaca.clients import AlpacaAPI, AsyncAlpacaAPI
 from alpaca.entities import Order, Bar, Position
+from alpaca.timestamps import is_pandas_timestamp, parse_rfc3339
 from src.settings import SYMBOL, APP_NAME
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 logger = logging.getLogger(APP_NAME)
 
 
@@ -17,7 +22,7 @@ def get_historical_data(
     exchanges: list = None,
     df: bool = False,
     crypto: bool = False,
-) -> Union[list[Bar], pd.DataFrame]:
+) -> Union[list[Bar], "pd.DataFrame"]:
     """
     Retrieves historical data from the API
     Args:
@@ -32,13 +37,15 @@ def get_historical_data(
 
     """
 
-    bars = api.get_bars(
+    if df:
+        # The columnar batch is wrapped in the DataFrame without creating a Bar per row
+        return api.get_bar_batch(
+            symbol=symbol, timeframe=timeframe, exchanges=exchanges, crypto=crypto
+        ).to_df()
+
+    return api.get_bars(
         symbol=symbol, timeframe=timeframe, exchanges=exchanges, crypto=crypto
     )
-    if not df:
-        return bars
-    else:
-        return Bar.to_df(bars)
 
 
 def get_position(api: AlpacaAPI, symbol: str = SYMBOL) -> Union[Position, None]:
@@ -58,6 +65,25 @@ def get_position(api: AlpacaAPI, symbol: str = SYMBOL) -> Union[Position, None]:
         return None
 
 
+async def get_position_async(
+    api: AsyncAlpacaAPI, symbol: str = SYMBOL
+) -> Union[Position, None]:
+    """
+    Retrieves the current position of the symbol with the asyncio client
+    Args:
+        api: The API to use
+        symbol: The symbol to retrieve the position for
+
+    Returns:
+        The retrieved position
+    """
+    try:
+        return await api.get_positions(symbol)
+    except Exception as e:
+        logger.debug(e)
+        return None
+
+
 def get_order(api: AlpacaAPI) -> Union[Order, None]:
     try:
         return api.get_orders()[0]
@@ -74,3 +100,24 @@ def get_target_position(
 
     target_position_size = cash / last_price * 0.8
     return round(target_position_size, 2)
+
+
+def to_datetime(value) -> datetime.datetime:
+    """
+    Normalizes the timestamps found on entities to a timezone aware datetime
+    Args:
+        value: A datetime, pandas Timestamp, msgpack Timestamp (streamed data) or RFC-3339 string
+
+    Returns:
+        The timestamp as a datetime in UTC when no timezone is given
+    """
+    if is_pandas_timestamp(value):
+        value = value.to_pydatetime()
+    elif isinstance(value, msgpack.ext.Timestamp):
+        value = value.to_datetime()
+    elif isinstance(value, str):
+        value = parse_rfc3339(value)
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
@@ -0,0 +1,658 @@
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+from alpaca.timestamps import to_nanoseconds
+
+
+class Indicator:
+    """
+    Indicator updated one value at a time.
+
+    `update` takes the new value(s) and returns the updated indicator, `value` is NaN until enough values were seen.
+    Each indicator has a batch function computing the whole series at once (e.g. for the warm-up) with the same
+    results as feeding the values one by one.
+    """
+
+    @property
+    def ready(self) -> bool:
+        return not math.isnan(self.value)
+
+    @property
+    def value(self) -> float:
+        raise NotImplementedError
+
+    def update(self, value: float) -> float:
+        raise NotImplementedError
+
+    def update_bar(self, bar) -> float:
+        """
+        Updates the indicator with the fields of a bar it is computed from (the close by default)
+        """
+        return self.update(bar.close)
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+class SimpleMovingAverage(Indicator):
+    """
+    Simple moving average over a fixed window, updated in O(1) per value.
+
+    The last `window` values are kept in a ring buffer together with their running sum, so a new value only costs
+    one addition and one subtraction. Until the window is full the value is NaN, like pandas `rolling().mean()`.
+
+    Attributes:
+        window (int): Number of values the average is computed over.
+        value (float): Current average, NaN while the window is not full.
+
+    """
+
+    # Recompute the running sum from the buffer every `resum_every` updates to keep floating point drift bounded
+    resum_every = 1000
+
+    def __init__(self, window: int):
+        if window < 1:
+            raise ValueError(f"Window must be a positive integer, got {window}")
+        self.window = window
+        self.buffer = deque(maxlen=window)
+        self.total = 0.0
+        self._updates = 0
+
+    def __len__(self):
+        return len(self.buffer)
+
+    @property
+    def ready(self) -> bool:
+        return len(self.buffer) == self.window
+
+    @property
+    def value(self) -> float:
+        if not self.ready:
+            return math.nan
+        return self.total / self.window
+
+    def update(self, value: float) -> float:
+        """
+        Pushes a new value into the window
+        Args:
+            value: The value to add
+
+        Returns:
+            The updated average
+        """
+        value = float(value)
+        if len(self.buffer) == self.window:
+            self.total -= self.buffer[0]
+        self.buffer.append(value)
+        self.total += value
+
+        self._updates += 1
+        if self._updates >= self.resum_every:
+            self.total = math.fsum(self.buffer)
+            self._updates = 0
+
+        return self.value
+
+    def reset(self) -> None:
+        self.buffer.clear()
+        self.total = 0.0
+        self._updates = 0
+
+
+def prefix_sums(values: np.ndarray) -> tuple[np.ndarray, float]:
+    """
+    Prefix sums of a series, from which the sum of any window costs O(1)
+    Args:
+        values: The series
+
+    Returns:
+        The n + 1 prefix sums (starting with 0) and the offset they were computed from
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return np.zeros(1), 0.0
+    # Prefix sums of the distance from the first value keep the sums small and the rounding errors negligible
+    offset = float(values[0])
+    return np.concatenate(([0.0], np.cumsum(values - offset))), offset
+
+
+def sma_from_prefix_sums(sums: np.ndarray, offset: float, window: int) -> np.ndarray:
+    """
+    Simple moving average of a series given its prefix sums (see prefix_sums)
+    """
+    if window < 1:
+        raise ValueError(f"Window must be a positive integer, got {window}")
+    result = np.full(len(sums) - 1, np.nan)
+    if len(result) < window:
+        return result
+    result[window - 1 :] = (sums[window:] - sums[:-window]) / window + offset
+    return result
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Simple moving average of a whole series, computed from prefix sums in O(n)
+    Args:
+        values: The series
+        window: Number of values the average is computed over
+
+    Returns:
+        The averages, NaN for the first `window - 1` values (like SimpleMovingAverage)
+    """
+    sums, offset = prefix_sums(values)
+    return sma_from_prefix_sums(sums, offset, window)
+
+
+class ExponentialMovingAverage(Indicator):
+    """
+    Exponential moving average, seeded with the simple average of the first `window` values.
+
+    Attributes:
+        window (int): Number of values of the seed, sets the smoothing factor to 2 / (window + 1) unless given.
+        alpha (float): Smoothing factor.
+        value (float): Current average, NaN until `window` values were seen.
+
+    """
+
+    def __init__(self, window: int, alpha: float = None):
+        if window < 1:
+            raise ValueError(f"Window must be a positive integer, got {window}")
+        self.window = window
+        self.alpha = 2 / (window + 1) if alpha is None else alpha
+        self.reset()
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def update(self, value: float) -> float:
+        value = float(value)
+        if self.count < self.window:
+            self.count += 1
+            self.total += value
+            if self.count == self.window:
+                self._value = self.total / self.window
+        else:
+            self._value += self.alpha * (value - self._value)
+        return self._value
+
+    def reset(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self._value = math.nan
+
+
+class RollingStandardDeviation(Indicator):
+    """
+    Standard deviation over a fixed window, updated in O(1) per value.
+
+    The sums of the values and of their squares are kept relative to the first value (like prefix_sums) to limit
+    the cancellation of the variance formula, and recomputed from the buffer every `resum_every` updates.
+
+    Attributes:
+        window (int): Number of values the deviation is computed over.
+        ddof (int): Delta degrees of freedom, 1 (sample deviation) like pandas `rolling().std()`.
+        value (float): Current deviation, NaN while the window is not full.
+
+    """
+
+    resum_every = 1000
+
+    def __init__(self, window: int, ddof: int = 1):
+        if window <= ddof:
+            raise ValueError(f"Window must be greater than {ddof}, got {window}")
+        self.window = window
+        self.ddof = ddof
+        self.buffer = deque(maxlen=window)
+        self.reset()
+
+    @property
+    def value(self) -> float:
+        if len(self.buffer) < self.window:
+            return math.nan
+        variance = (self.total_squares - self.total**2 / self.window) / (
+            self.window - self.ddof
+        )
+        return math.sqrt(max(variance, 0.0))
+
+    def update(self, value: float) -> float:
+        value = float(value)
+        if self.offset is None:
+            self.offset = value
+        if len(self.buffer) == self.window:
+            removed = self.buffer[0] - self.offset
+            self.total -= removed
+            self.total_squares -= removed * removed
+        self.buffer.append(value)
+        shifted = value - self.offset
+        self.total += shifted
+        self.total_squares += shifted * shifted
+
+        self._updates += 1
+        if self._updates >= self.resum_every:
+            self.total = math.fsum(value - self.offset for value in self.buffer)
+            self.total_squares = math.fsum(
+                (value - self.offset) ** 2 for value in self.buffer
+            )
+            self._updates = 0
+        return self.value
+
+    def reset(self) -> None:
+        self.buffer.clear()
+        self.offset = None
+        self.total = 0.0
+        self.total_squares = 0.0
+        self._updates = 0
+
+
+class BollingerBands(Indicator):
+    """
+    Bollinger Bands: the simple moving average and the bands `k` (population) standard deviations around it.
+
+    Attributes:
+        window (int): Number of values of the average and the deviation.
+        k (float): Number of deviations between the average and the bands.
+        value (float): The middle band, NaN while the window is not full.
+
+    """
+
+    def __init__(self, window: int = 20, k: float = 2.0):
+        self.k = k
+        self.window = window
+        self.average = SimpleMovingAverage(window)
+        self.deviation = RollingStandardDeviation(window, ddof=0)
+
+    @property
+    def value(self) -> float:
+        return self.average.value
+
+    @property
+    def upper(self) -> float:
+        return self.average.value + self.k * self.deviation.value
+
+    @property
+    def lower(self) -> float:
+        return self.average.value - self.k * self.deviation.value
+
+    def update(self, value: float) -> float:
+        self.deviation.update(value)
+        return self.average.update(value)
+
+    def reset(self) -> None:
+        self.average.reset()
+        self.deviation.reset()
+
+
+class RelativeStrengthIndex(Indicator):
+    """
+    Wilder's Relative Strength Index.
+
+    The average gain and loss are seeded with the simple average of the first `window` changes, then smoothed with
+    a factor of 1 / window.
+
+    Attributes:
+        window (int): Number of changes of the averages.
+        value (float): Current index between 0 and 100, NaN until `window` changes were seen.
+
+    """
+
+    def __init__(self, window: int = 14):
+        if window < 1:
+            raise ValueError(f"Window must be a positive integer, got {window}")
+        self.window = window
+        self.reset()
+
+    @property
+    def value(self) -> float:
+        if self.count < self.window:
+            return math.nan
+        if self.average_loss == 0:
+            return 100.0 if self.average_gain > 0 else 50.0
+        return 100.0 - 100.0 / (1.0 + self.average_gain / self.average_loss)
+
+    def update(self, value: float) -> float:
+        value = float(value)
+        previous, self.previous = self.previous, value
+        if previous is None:
+            return math.nan
+
+        change = value - previous
+        gain, loss = max(change, 0.0), max(-change, 0.0)
+        if self.count < self.window:
+            self.count += 1
+            self.average_gain += gain / self.window
+            self.average_loss += loss / self.window
+        else:
+            self.average_gain += (gain - self.average_gain) / self.window
+            self.average_loss += (loss - self.average_loss) / self.window
+        return self.value
+
+    def reset(self) -> None:
+        self.previous = None
+        self.count = 0
+        self.average_gain = 0.0
+        self.average_loss = 0.0
+
+
+class AverageTrueRange(Indicator):
+    """
+    Wilder's Average True Range, computed from the high, low and close of the bars.
+
+    Attributes:
+        window (int): Number of true ranges of the average.
+        value (float): Current average, NaN until `window` bars were seen.
+
+    """
+
+    def __init__(self, window: int = 14):
+        if window < 1:
+            raise ValueError(f"Window must be a positive integer, got {window}")
+        self.window = window
+        self.reset()
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def update(self, high: float, low: float, close: float) -> float:
+        """
+        Pushes a new bar into the average
+        Args:
+            high: The high of the bar
+            low: The low of the bar
+            close: The close of the bar
+
+        Returns:
+            The updated average
+        """
+        high, low, close = float(high), float(low), float(close)
+        true_range = high - low
+        if self.previous_close is not None:
+            true_range = max(
+                true_range,
+                abs(high - self.previous_close),
+                abs(low - self.previous_close),
+            )
+        self.previous_close = close
+
+        if self.count < self.window:
+            self.count += 1
+            self.total += true_range
+            if self.count == self.window:
+                self._value = self.total / self.window
+        else:
+            self._value += (true_range - self._value) / self.window
+        return self._value
+
+    def update_bar(self, bar) -> float:
+        return self.update(bar.high, bar.low, bar.close)
+
+    def reset(self) -> None:
+        self.previous_close = None
+        self.count = 0
+        self.total = 0.0
+        self._value = math.nan
+
+
+class VolumeWeightedAveragePrice(Indicator):
+    """
+    Volume Weighted Average Price of the bars, built from their own VWAP and volume.
+
+    Without a window the average covers every bar since the last reset (e.g. the session), otherwise the last
+    `window` bars.
+
+    Attributes:
+        window (int): Number of bars of the average, None for all of them.
+        value (float): Current average, NaN while there is no volume.
+
+    """
+
+    def __init__(self, window: int = None):
+        if window is not None and window < 1:
+            raise ValueError(f"Window must be a positive integer, got {window}")
+        self.window = window
+        self.buffer = deque(maxlen=window) if window else None
+        self.reset()
+
+    @property
+    def value(self) -> float:
+        if self.buffer is not None and len(self.buffer) < self.window:
+            return math.nan
+        if self.volume <= 0:
+            return math.nan
+        return self.notional / self.volume
+
+    def update(self, vwap: float, volume: float) -> float:
+        """
+        Pushes a new bar into the average
+        Args:
+            vwap: The VWAP of the bar
+            volume: The volume of the bar
+
+        Returns:
+            The updated average
+        """
+        volume = float(volume)
+        notional = float(vwap) * volume
+        if self.buffer is not None:
+            if len(self.buffer) == self.window:
+                removed_notional, removed_volume = self.buffer[0]
+                self.notional -= removed_notional
+                self.volume -= removed_volume
+            self.buffer.append((notional, volume))
+        self.notional += notional
+        self.volume += volume
+        return self.value
+
+    def update_bar(self, bar) -> float:
+        return self.update(bar.vwap, bar.volume)
+
+    def reset(self) -> None:
+        if self.buffer is not None:
+            self.buffer.clear()
+        self.notional = 0.0
+        self.volume = 0.0
+
+
+class IndicatorSet:
+    """
+    Indicators of a single symbol, shared by the strategies trading it.
+
+    `get` creates each indicator once per class and parameters, so strategies asking for the same average share the
+    instance, and `update_bar` pushes every bar into all of them once, however many strategies receive it (bars
+    older than the last one of their exchange are skipped).
+
+    Attributes:
+        last_timestamps (dict): Timestamp (ns) of the last bar of each exchange.
+        synced (bool): Whether the indicators were warmed up from the history.
+
+    """
+
+    def __init__(self):
+        self.indicators = {}
+        self.last_timestamps = {}
+        self.synced = False
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.indicators)
+
+    def get(self, indicator_class: type, *args, **kwargs) -> Indicator:
+        """
+        Returns the shared indicator of the given class and parameters, creating it when needed
+        Args:
+            indicator_class: The class of the indicator
+            *args: The positional parameters of the indicator
+            **kwargs: The keyword parameters of the indicator
+
+        Returns:
+            The indicator
+        """
+        key = (indicator_class, args, tuple(sorted(kwargs.items())))
+        with self.lock:
+            if key not in self.indicators:
+                self.indicators[key] = indicator_class(*args, **kwargs)
+                if self.last_timestamps:
+                    # A new indicator has missed the previous bars, the next bar triggers a warm-up
+                    self.synced = False
+            return self.indicators[key]
+
+    def update_bar(self, bar) -> bool:
+        """
+        Pushes the bar into every indicator, skipping bars that were already seen
+        Args:
+            bar: The bar to add
+
+        Returns:
+            Whether the bar was added
+        """
+        timestamp = to_nanoseconds(bar.timestamp)
+        with self.lock:
+            last_timestamp = self.last_timestamps.get(bar.exchange)
+            if last_timestamp is not None and timestamp <= last_timestamp:
+                return False
+            self.last_timestamps[bar.exchange] = timestamp
+            for indicator in self.indicators.values():
+                indicator.update_bar(bar)
+        return True
+
+    def reset(self) -> None:
+        with self.lock:
+            for indicator in self.indicators.values():
+                indicator.reset()
+            self.last_timestamps.clear()
+            self.synced = False
+
+
+# The recursive indicators (EMA, RSI, ATR) cannot be expressed with cumulative NumPy operations without changing the
+# results, their batch functions run the streaming update over the values as Python floats.
+
+
+def ema(values: np.ndarray, window: int, alpha: float = None) -> np.ndarray:
+    """
+    Exponential moving average of a whole series (see ExponentialMovingAverage)
+    """
+    indicator = ExponentialMovingAverage(window, alpha)
+    return np.array(
+        [
+            indicator.update(value)
+            for value in np.asarray(values, dtype=np.float64).tolist()
+        ],
+        dtype=np.float64,
+    )
+
+
+def rolling_std(values: np.ndarray, window: int, ddof: int = 1) -> np.ndarray:
+    """
+    Rolling standard deviation of a whole series, computed from prefix sums in O(n)
+    Args:
+        values: The series
+        window: Number of values the deviation is computed over
+        ddof: Delta degrees of freedom
+
+    Returns:
+        The deviations, NaN for the first `window - 1` values (like RollingStandardDeviation)
+    """
+    if window <= ddof:
+        raise ValueError(f"Window must be greater than {ddof}, got {window}")
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if len(values) < window:
+        return result
+
+    sums, offset = prefix_sums(values)
+    squares = np.concatenate(([0.0], np.cumsum((values - offset) ** 2)))
+    total = sums[window:] - sums[:-window]
+    total_squares = squares[window:] - squares[:-window]
+    variance = (total_squares - total**2 / window) / (window - ddof)
+    result[window - 1 :] = np.sqrt(np.maximum(variance, 0.0))
+    return result
+
+
+def bollinger_bands(
+    values: np.ndarray, window: int = 20, k: float = 2.0
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Bollinger Bands of a whole series (see BollingerBands)
+    Args:
+        values: The series
+        window: Number of values of the average and the deviation
+        k: Number of deviations between the average and the bands
+
+    Returns:
+        The middle (simple average), upper and lower bands
+    """
+    middle = sma(values, window)
+    deviation = rolling_std(values, window, ddof=0)
+    return middle, middle + k * deviation, middle - k * deviation
+
+
+def rsi(values: np.ndarray, window: int = 14) -> np.ndarray:
+    """
+    Relative Strength Index of a whole series (see RelativeStrengthIndex)
+    """
+    indicator = RelativeStrengthIndex(window)
+    return np.array(
+        [
+            indicator.update(value)
+            for value in np.asarray(values, dtype=np.float64).tolist()
+        ],
+        dtype=np.float64,
+    )
+
+
+def atr(
+    high: np.ndarray, low: np.ndarray, close: np.ndarray, window: int = 14
+) -> np.ndarray:
+    """
+    Average True Range of a whole series of bars (see AverageTrueRange)
+    """
+    indicator = AverageTrueRange(window)
+    return np.array(
+        [
+            indicator.update(h, l, c)
+            for h, l, c in zip(
+                np.asarray(high, dtype=np.float64).tolist(),
+                np.asarray(low, dtype=np.float64).tolist(),
+                np.asarray(close, dtype=np.float64).tolist(),
+            )
+        ],
+        dtype=np.float64,
+    )
+
+
+def vwap(vwaps: np.ndarray, volumes: np.ndarray, window: int = None) -> np.ndarray:
+    """
+    Volume Weighted Average Price of a whole series of bars, from cumulative sums in O(n)
+    Args:
+        vwaps: The VWAP of each bar
+        volumes: The volume of each bar
+        window: Number of bars of the average, None for all the bars so far
+
+    Returns:
+        The averages, NaN while there is no volume (and for the first `window - 1` bars)
+    """
+    volumes = np.asarray(volumes, dtype=np.float64)
+    notionals = np.asarray(vwaps, dtype=np.float64) * volumes
+    notional_sums = np.concatenate(([0.0], np.cumsum(notionals)))
+    volume_sums = np.concatenate(([0.0], np.cumsum(volumes)))
+
+    if window is None:
+        notional, volume = notional_sums[1:], volume_sums[1:]
+        result = np.full(len(volumes), np.nan)
+    else:
+        if window < 1:
+            raise ValueError(f"Window must be a positive integer, got {window}")
+        result = np.full(len(volumes), np.nan)
+        if len(volumes) < window:
+            return result
+        notional = notional_sums[window:] - notional_sums[:-window]
+        volume = volume_sums[window:] - volume_sums[:-window]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = np.where(volume > 0, notional / volume, np.nan)
+    result[len(result) - len(averages) :] = averages
+    return result
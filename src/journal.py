@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Union
+
+import msgpack
+
+from src.settings import (
+    APP_NAME,
+    JOURNAL_FLUSH_INTERVAL,
+    JOURNAL_SEGMENT_SIZE,
+)
+
+logger = logging.getLogger(APP_NAME)
+
+# Kinds of the journaled messages, as in the "T" key of the stream messages
+BAR = "b"
+QUOTE = "q"
+TRADE = "t"
+
+
+class Journal:
+    """
+    Append-only binary log of the raw stream messages, with the time they were received.
+
+    Records are msgpack arrays [received (nanoseconds since epoch), kind, message], the message being the dict
+    received from the stream as is (msgpack Timestamps included). They are appended to segment files named after the
+    receive time of their first record, a new segment is started once the current one reaches `segment_size` bytes,
+    so old segments can be archived or deleted while recording. Writes are buffered and flushed every
+    `flush_interval` seconds: a crash loses at most that much, and readers skip the truncated last record.
+
+    Layout: <path>/<received>.journal
+
+    Attributes:
+        path (Path): Directory of the segments.
+        segment_size (int): Size in bytes after which a new segment is started.
+        flush_interval (float): Seconds between two flushes.
+        records (int): Number of records written.
+
+    """
+
+    suffix = ".journal"
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        segment_size: int = JOURNAL_SEGMENT_SIZE,
+        flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+        clock=time.time_ns,
+    ):
+        self.path = Path(path)
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.records = 0
+        self.file = None
+        self.flushed_at = time.monotonic()
+        self.packer = msgpack.Packer()
+        self.lock = threading.Lock()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def segments(self) -> list[Path]:
+        return sorted(self.path.glob(f"*{self.suffix}"))
+
+    def append(self, kind: str, message: dict, received: int = None) -> None:
+        """
+        Appends a message to the journal
+        Args:
+            kind: The kind of message (BAR, QUOTE or TRADE)
+            message: The message, as received from the stream
+            received: Receive time in nanoseconds since epoch, now by default
+
+        Returns:
+            None
+        """
+        received = self.clock() if received is None else received
+        data = self.packer.pack([received, kind, message])
+        with self.lock:
+            if self.file is None:
+                # Zero padded so that the segments sort in time order
+                segment = self.path / f"{received:020d}{self.suffix}"
+                self.file = open(segment, "ab", buffering=1 << 20)
+                logger.debug(f"Journaling to {segment}")
+            self.file.write(data)
+            self.records += 1
+            if self.file.tell() >= self.segment_size:
+                self.file.close()
+                self.file = None
+            elif time.monotonic() - self.flushed_at >= self.flush_interval:
+                self.file.flush()
+                self.flushed_at = time.monotonic()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+            self.flushed_at = time.monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_journal(
+    path: Union[str, Path], start: int = None, end: int = None
+) -> Iterator[tuple[int, str, dict]]:
+    """
+    Reads the records of a journal in the order they were written
+    Args:
+        path: The directory of the segments, or a single segment
+        start: Skip the records received before (nanoseconds since epoch)
+        end: Stop at the first record received after (nanoseconds since epoch)
+
+    Returns:
+        The (received, kind, message) records
+    """
+    path = Path(path)
+    segments = sorted(path.glob(f"*{Journal.suffix}")) if path.is_dir() else [path]
+    for index, segment in enumerate(segments):
+        # Segments start at the receive time of their first record
+        if (
+            start is not None
+            and index + 1 < len(segments)
+            and int(segments[index + 1].stem) <= start
+        ):
+            continue
+        with open(segment, "rb") as file:
+            # A record truncated by a crash ends the iteration of the segment
+            for received, kind, message in msgpack.Unpacker(file, raw=False):
+                if start is not None and received < start:
+                    continue
+                if end is not None and received > end:
+                    return
+                yield received, kind, message
@@ -1,3 +1,5 @@
+from alpaca.entities import Bar
+
 trade_mapping = {
     "i": "id",
     "S": "symbol",
@@ -57,3 +59,26 @@ luld_mapping = {
 }
 
 mappings = {"bar": bar_mapping, "quote": quote_mapping, "trade": trade_mapping}
+
+
+def decode_bar(message: dict) -> Bar:
+    """
+    Creates a Bar straight from a raw stream message, without copying or rewriting it
+    Args:
+        message: The message, the exchange (x) is only sent for crypto
+
+    Returns:
+        The bar, KeyError is raised when a required key is missing
+    """
+    return Bar(
+        message["S"],
+        message["t"],
+        message["o"],
+        message["h"],
+        message["l"],
+        message["c"],
+        message["v"],
+        message["n"],
+        message["vw"],
+        message.get("x", ""),
+    )
@@ -0,0 +1,213 @@
+import math
+import time
+from typing import Callable, NamedTuple, Union
+
+from src.settings import QUOTE_MAX_AGE
+
+
+class ExchangeQuote(NamedTuple):
+    """
+    Latest quote of a symbol on one exchange, with the (monotonic) time it was received
+    """
+
+    bid_price: float
+    bid_size: float
+    ask_price: float
+    ask_size: float
+    timestamp: object
+    received: float
+
+
+class MarketSnapshot(NamedTuple):
+    """
+    Best quote across the exchanges and latest trade of a symbol, with running trade totals.
+
+    Snapshots are immutable: every update builds a new one, so a reader always sees a consistent quote and trade.
+    `volume`, `notional` and `trades` only grow, the VWAP of the trades between two snapshots is derived from their
+    difference (see `vwap_since`).
+    """
+
+    symbol: str
+    bid_price: float = math.nan
+    bid_size: float = 0.0
+    ask_price: float = math.nan
+    ask_size: float = 0.0
+    quote_timestamp: object = None
+    last_price: float = math.nan
+    last_size: float = 0.0
+    trade_timestamp: object = None
+    volume: float = 0.0
+    notional: float = 0.0
+    trades: int = 0
+
+    @property
+    def mid_price(self) -> float:
+        return (self.bid_price + self.ask_price) / 2
+
+    def vwap_since(self, previous: Union["MarketSnapshot", None]) -> float:
+        """
+        Volume weighted average price of the trades received after `previous`, NaN when there were none
+        """
+        volume = self.volume - (previous.volume if previous else 0.0)
+        if volume <= 0:
+            return math.nan
+        return (self.notional - (previous.notional if previous else 0.0)) / volume
+
+
+class ConflationBuffer:
+    """
+    Keeps only the latest quote of each symbol on each exchange and its latest trade, so that quotes and trades reach
+    the strategies without going through the market data queue.
+
+    The stream callbacks (a single thread, the event loop of the stream) replace the quotes and the snapshot of the
+    symbol with new immutable ones, readers get the current snapshot with a plain dict lookup: neither side takes a
+    lock and a burst of quotes costs a couple of dict assignments each, however many are received between two reads.
+    The bid and ask of a snapshot are the best ones among the quotes received less than `max_age` seconds ago, an
+    exchange that stopped quoting does not keep its last price in the snapshot (they are NaN when no quote is fresh).
+
+    Attributes:
+        exchanges (list): Exchanges whose quotes and trades are kept, None for all of them.
+        max_age (float): Seconds after which the quote of an exchange is ignored, 0 to keep it until the next one.
+
+    """
+
+    def __init__(
+        self,
+        exchanges: list = None,
+        max_age: float = QUOTE_MAX_AGE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.exchanges = set(exchanges) if exchanges else None
+        self.max_age = max_age
+        self.clock = clock
+        self.snapshots = {}
+        self.quotes = {}
+
+    def accepts(self, exchange: str) -> bool:
+        return self.exchanges is None or not exchange or exchange in self.exchanges
+
+    def update_quote(
+        self,
+        symbol: str,
+        bid_price: float,
+        bid_size: float,
+        ask_price: float,
+        ask_size: float,
+        timestamp=None,
+        exchange: str = "",
+    ) -> None:
+        if not self.accepts(exchange):
+            return
+        now = self.clock()
+        quote = ExchangeQuote(
+            float(bid_price),
+            float(bid_size),
+            float(ask_price),
+            float(ask_size),
+            timestamp,
+            now,
+        )
+        # Copied rather than updated in place, readers may be iterating over the previous quotes
+        quotes = {**self.quotes.get(symbol, {}), exchange: quote}
+        self.quotes[symbol] = quotes
+        snapshot = self.snapshots.get(symbol) or MarketSnapshot(symbol)
+        self.snapshots[symbol] = self.best_quote(snapshot, quotes.values(), now)
+
+    def update_trade(
+        self,
+        symbol: str,
+        price: float,
+        size: float,
+        timestamp=None,
+        exchange: str = "",
+    ) -> None:
+        if not self.accepts(exchange):
+            return
+        price, size = float(price), float(size)
+        snapshot = self.snapshots.get(symbol) or MarketSnapshot(symbol)
+        self.snapshots[symbol] = snapshot._replace(
+            last_price=price,
+            last_size=size,
+            trade_timestamp=timestamp,
+            volume=snapshot.volume + size,
+            notional=snapshot.notional + price * size,
+            trades=snapshot.trades + 1,
+        )
+
+    def fresh(self, quote: ExchangeQuote, now: float) -> bool:
+        return not self.max_age or now - quote.received <= self.max_age
+
+    def best_quote(
+        self, snapshot: MarketSnapshot, quotes, now: float
+    ) -> MarketSnapshot:
+        """
+        Returns the snapshot with the highest bid and lowest ask of the fresh quotes
+        Args:
+            snapshot: The snapshot to update
+            quotes: The latest quote of each exchange
+            now: The current time of the clock
+
+        Returns:
+            The updated snapshot, its bid and ask are NaN when none of the quotes is fresh
+        """
+        bid = ask = latest = None
+        for quote in quotes:
+            if not self.fresh(quote, now):
+                continue
+            if quote.bid_price > 0 and (bid is None or quote.bid_price > bid.bid_price):
+                bid = quote
+            if quote.ask_price > 0 and (ask is None or quote.ask_price < ask.ask_price):
+                ask = quote
+            if latest is None or quote.received > latest.received:
+                latest = quote
+        return snapshot._replace(
+            bid_price=bid.bid_price if bid else math.nan,
+            bid_size=bid.bid_size if bid else 0.0,
+            ask_price=ask.ask_price if ask else math.nan,
+            ask_size=ask.ask_size if ask else 0.0,
+            quote_timestamp=latest.timestamp if latest else None,
+        )
+
+    def get(self, symbol: str) -> Union[MarketSnapshot, None]:
+        """
+        Returns the latest snapshot of the symbol, None when nothing was received yet. Its bid and ask leave out the
+        quotes that went stale since it was built
+        """
+        snapshot = self.snapshots.get(symbol)
+        quotes = self.quotes.get(symbol)
+        if snapshot is None or not quotes or not self.max_age:
+            return snapshot
+        now = self.clock()
+        if all(self.fresh(quote, now) for quote in quotes.values()):
+            return snapshot
+        return self.best_quote(snapshot, quotes.values(), now)
+
+    def reader(self) -> "SnapshotReader":
+        return SnapshotReader(self)
+
+
+class SnapshotReader:
+    """
+    Reads the snapshots of a ConflationBuffer for one consumer, remembering what it read last so that it can tell the
+    VWAP of the trades received since its previous read.
+    """
+
+    def __init__(self, buffer: ConflationBuffer):
+        self.buffer = buffer
+        self.previous = {}
+
+    def read(self, symbol: str) -> tuple[Union[MarketSnapshot, None], float]:
+        """
+        Returns the latest snapshot of the symbol and the VWAP of the trades since the previous read
+        Args:
+            symbol: The symbol to read
+
+        Returns:
+            The snapshot (None when nothing was received yet) and the VWAP (NaN when there was no trade)
+        """
+        snapshot = self.buffer.get(symbol)
+        if snapshot is None:
+            return None, math.nan
+        vwap = snapshot.vwap_since(self.previous.get(symbol))
+        self.previous[symbol] = snapshot
+        return snapshot, vwap
@@ -0,0 +1,93 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.queues import MarketDataQueue
+from src.settings import APP_NAME, METRICS_LOG_INTERVAL, METRICS_PORT
+from src.tracing import Tracer, tracer as default_tracer
+
+logger = logging.getLogger(APP_NAME)
+
+
+class MetricsExporter:
+    """
+    Exports the latency histograms of a Tracer (and the counters of the market data queue): as JSON on
+    http://<host>:<port>/metrics and as a summary logged every `interval` seconds.
+
+    Attributes:
+        tracer (Tracer): The tracer to export.
+        queue (MarketDataQueue): The queue whose counters are exported, if any. With sharded dispatchers, the
+            SubscriberClient, whose snapshot covers the shards the dispatchers read from.
+
+    """
+
+    def __init__(
+        self,
+        tracer: Tracer = default_tracer,
+        queue: MarketDataQueue = None,
+        port: int = METRICS_PORT,
+        interval: float = METRICS_LOG_INTERVAL,
+        host: str = "127.0.0.1",
+    ):
+        self.tracer = tracer
+        self.queue = queue
+        self.port = port
+        self.interval = interval
+        self.host = host
+        self.server = None
+        self.stopped = threading.Event()
+
+    def snapshot(self) -> dict:
+        metrics = {"latency_ms": self.tracer.snapshot()}
+        if self.queue is not None:
+            metrics["queue"] = self.queue.snapshot()
+        return metrics
+
+    def summary(self) -> str:
+        lines = [
+            f"{name}: n={stats['count']} p50={stats['p50']:.3f}ms p99={stats['p99']:.3f}ms max={stats['max']:.3f}ms"
+            for name, stats in self.tracer.snapshot().items()
+        ]
+        if self.queue is not None:
+            lines.append(f"queue: {self.queue.snapshot()}")
+        return "\n".join(lines)
+
+    def start(self) -> None:
+        if self.port:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.rstrip("/") != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = json.dumps(exporter.snapshot()).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    logger.debug(format, *args)
+
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self.port = self.server.server_address[1]
+            threading.Thread(
+                name="Metrics", target=self.server.serve_forever, daemon=True
+            ).start()
+            logger.info(f"Metrics served on http://{self.host}:{self.port}/metrics")
+        if self.interval > 0:
+            threading.Thread(name="MetricsLog", target=self.report, daemon=True).start()
+
+    def report(self) -> None:
+        while not self.stopped.wait(self.interval):
+            if self.tracer.histograms:
+                logger.info(f"Latency summary:\n{self.summary()}")
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
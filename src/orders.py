@@ -0,0 +1,301 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Union
+
+import aiohttp
+
+from alpaca.clients import APIError, AsyncAlpacaAPI
+from alpaca.entities import Order
+from alpaca.timestamps import to_nanoseconds
+from src.settings import (
+    APP_NAME,
+    ORDER_MAX_ATTEMPTS,
+    ORDER_RECONCILE_AFTER,
+    ORDER_RETRY_BASE,
+    ORDER_RETRY_CAP,
+)
+from src.tracing import ORDER_ACK, ORDER_SUBMIT, tracer
+
+logger = logging.getLogger(APP_NAME)
+
+# Statuses of an order that may still be filled
+open_statuses = {
+    "pending",
+    "submitting",
+    "new",
+    "accepted",
+    "pending_new",
+    "accepted_for_bidding",
+    "partially_filled",
+    "pending_replace",
+    "pending_cancel",
+    "calculated",
+    "held",
+}
+
+
+def client_order_id(symbol: str, side: str, key, prefix: str = "farmer") -> str:
+    """
+    Deterministic client order id of the order a strategy places for a signal
+    Args:
+        symbol: The symbol of the order
+        side: The side of the order
+        key: What identifies the signal, e.g. the timestamp of the bar it was computed from
+        prefix: Identifies the strategy (instance), so that two strategies acting on the same bar do not collide
+
+    Returns:
+        The same id every time the same signal is seen (Alpaca accepts up to 128 characters)
+    """
+    if not isinstance(key, (str, int)):
+        key = to_nanoseconds(key)
+    digest = hashlib.sha1(f"{prefix}|{symbol}|{side}|{key}".encode()).hexdigest()
+    return f"{prefix}-{digest[:24]}"
+
+
+@dataclass
+class TrackedOrder:
+    """
+    An order submitted through the OrderGateway and its last known state.
+
+    Attributes:
+        client_order_id (str): The id sent with the order.
+        params (dict): The parameters of the order.
+        status (str): "submitting" until the API answered, then the Alpaca status of the order, or "failed" when
+            it could not be submitted.
+        order (Order): The order returned by the API.
+        attempts (int): Number of requests made.
+        error (str): Why the order failed.
+        updated_at (float): When the status last changed or was checked (time.monotonic).
+        future (Future): Resolved with the TrackedOrder once the submission is over.
+        trace (dict): The latency trace, continuing the trace of the bar the order comes from (see src.tracing).
+
+    """
+
+    client_order_id: str
+    params: dict
+    status: str = "submitting"
+    order: Order = None
+    attempts: int = 0
+    error: str = None
+    created_at: datetime.datetime = field(
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc)
+    )
+    updated_at: float = field(default_factory=time.monotonic, repr=False)
+    reconciling: bool = field(default=False, repr=False, compare=False)
+    future: Future = field(default_factory=Future, repr=False, compare=False)
+    trace: dict = field(default=None, repr=False, compare=False)
+
+    @property
+    def open(self) -> bool:
+        return self.status in open_statuses
+
+    @property
+    def symbol(self) -> str:
+        return self.params["symbol"]
+
+    @property
+    def side(self) -> str:
+        return self.params["side"]
+
+
+class OrderGateway:
+    """
+    Submits orders in the background and keeps track of them.
+
+    `submit` returns as soon as the order is scheduled on the loop of the AsyncAlpacaAPI, so the Dispatcher does not
+    wait for the REST round trip. Every order carries a deterministic client order id: submitting the same signal
+    twice (e.g. a bar redelivered after a reconnect) returns the order already tracked instead of placing a new one,
+    and retries are idempotent on the API side. Throttled (429) and failed (5xx) requests, as well as network errors,
+    are retried with exponential backoff and full jitter. The state of the orders is then updated by the trade
+    updates stream (see `on_trade_update`). An order still open `reconcile_after` seconds after its last update is
+    looked up in the background the next time the open orders are read, so a missed update cannot hold a side.
+
+    Attributes:
+        api (AsyncAlpacaAPI): The API the orders are sent to.
+        orders (dict): The tracked orders by client order id.
+
+    """
+
+    def __init__(
+        self,
+        api: AsyncAlpacaAPI,
+        max_attempts: int = ORDER_MAX_ATTEMPTS,
+        retry_base: float = ORDER_RETRY_BASE,
+        retry_cap: float = ORDER_RETRY_CAP,
+        reconcile_after: float = ORDER_RECONCILE_AFTER,
+        clock=time.monotonic,
+    ):
+        self.api = api
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.reconcile_after = reconcile_after
+        self.clock = clock
+        self.orders = {}
+        self.lock = threading.Lock()
+
+    def submit(
+        self, client_order_id: str, trace: dict = None, **params
+    ) -> TrackedOrder:
+        """
+        Schedules an order, unless an order with the same client order id was already submitted
+        Args:
+            client_order_id: The id of the order (see client_order_id)
+            trace: The latency trace of the bar that triggered the order
+            **params: The parameters of AsyncAlpacaAPI.place_order
+
+        Returns:
+            The tracked order, its `future` tells when the submission is over
+        """
+        with self.lock:
+            tracked = self.orders.get(client_order_id)
+            if tracked is not None and tracked.status != "failed":
+                logger.info(f"Order {client_order_id} already submitted")
+                return tracked
+            tracked = self.orders[client_order_id] = TrackedOrder(
+                client_order_id, params, updated_at=self.clock()
+            )
+
+        tracer.stamp(tracked, ORDER_SUBMIT, trace)
+        asyncio.run_coroutine_threadsafe(self._submit(tracked), self.api.loop)
+        return tracked
+
+    def backoff(self, attempt: int, retry_after: float = None) -> float:
+        delay = random.uniform(0, min(self.retry_cap, self.retry_base * 2**attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def _submit(self, tracked: TrackedOrder) -> None:
+        try:
+            await self._place(tracked)
+        except Exception as e:
+            logger.exception(e)
+            tracked.status, tracked.error = "failed", str(e)
+        finally:
+            if tracked.status != "failed":
+                tracer.stamp(tracked, ORDER_ACK)
+            logger.info(
+                f"Order {tracked.client_order_id} {tracked.status} after {tracked.attempts} attempt(s)"
+            )
+            tracked.future.set_result(tracked)
+
+    async def _place(self, tracked: TrackedOrder) -> None:
+        while True:
+            tracked.attempts += 1
+            retry_after = None
+            try:
+                order = await self.api.place_order(
+                    client_order_id=tracked.client_order_id, **tracked.params
+                )
+                self._update(tracked, order)
+                return
+            except APIError as e:
+                if e.status_code == 422:
+                    # The client order id may already be taken, by a previous attempt that reached the API before
+                    # failing or by an earlier submission of the same id: the order then exists
+                    order = await self.find(tracked.client_order_id)
+                    if order is not None:
+                        self._update(tracked, order)
+                    else:
+                        tracked.status, tracked.error = "failed", str(e)
+                    return
+                if not e.retryable:
+                    tracked.status, tracked.error = "failed", str(e)
+                    return
+                tracked.error, retry_after = str(e), e.retry_after
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                tracked.error = repr(e)
+
+            if tracked.attempts >= self.max_attempts:
+                tracked.status = "failed"
+                return
+            delay = self.backoff(tracked.attempts - 1, retry_after)
+            logger.warning(
+                f"Order {tracked.client_order_id} attempt {tracked.attempts} failed ({tracked.error}), "
+                f"retrying in {delay:.2f}s"
+            )
+            await asyncio.sleep(delay)
+
+    async def find(self, client_order_id: str) -> Union[Order, None]:
+        """
+        Returns the order placed with the client order id, None when there is none
+        """
+        try:
+            return await self.api.get_order_by_client_id(client_order_id)
+        except APIError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    def _update(self, tracked: TrackedOrder, order: Union[Order, None]) -> None:
+        tracked.order = order
+        tracked.status = getattr(order, "status", None) or "new"
+        tracked.error = None
+        tracked.updated_at = self.clock()
+
+    async def _reconcile(self, tracked: TrackedOrder) -> None:
+        try:
+            order = await self.find(tracked.client_order_id)
+            if order is not None:
+                self._update(tracked, order)
+                logger.info(
+                    f"Order {tracked.client_order_id} reconciled: {tracked.status}"
+                )
+            else:
+                logger.warning(f"Order {tracked.client_order_id} not found")
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            # Checked again after another `reconcile_after` at the earliest
+            tracked.updated_at = self.clock()
+            tracked.reconciling = False
+
+    def reconcile(self, tracked: TrackedOrder) -> None:
+        """
+        Looks the order up in the background when it is still open `reconcile_after` seconds after its last update,
+        e.g. because a trade update was missed
+        """
+        if (
+            tracked.open
+            and tracked.future.done()
+            and not tracked.reconciling
+            and self.clock() - tracked.updated_at > self.reconcile_after
+        ):
+            tracked.reconciling = True
+            asyncio.run_coroutine_threadsafe(self._reconcile(tracked), self.api.loop)
+
+    def on_trade_update(self, update: dict) -> None:
+        """
+        Updates the status of a tracked order from a trade update
+        Args:
+            update: The trade update
+
+        Returns:
+            None
+        """
+        data = update["order"]
+        tracked = self.orders.get(data.get("client_order_id"))
+        if tracked is not None:
+            tracked.status = data.get("status") or update["event"]
+            tracked.updated_at = self.clock()
+
+    def get(self, client_order_id: str) -> Union[TrackedOrder, None]:
+        return self.orders.get(client_order_id)
+
+    def open_orders(self, symbol: str = None, side: str = None) -> list[TrackedOrder]:
+        orders = [
+            tracked
+            for tracked in list(self.orders.values())
+            if tracked.open
+            and (symbol is None or tracked.symbol == symbol)
+            and (side is None or tracked.side == side)
+        ]
+        for tracked in orders:
+            self.reconcile(tracked)
+        return orders
@@ -0,0 +1,268 @@
+import dataclasses
+import logging
+import threading
+import time
+from typing import Callable, Union
+
+from alpaca.clients import AlpacaAPI
+from alpaca.entities import Account, EntityFactory, Order, Position
+from src.settings import APP_NAME, PORTFOLIO_TTL
+
+logger = logging.getLogger(APP_NAME)
+
+# Trade update events after which an order is no longer open
+closed_order_events = {
+    "fill",
+    "canceled",
+    "expired",
+    "rejected",
+    "done_for_day",
+    "replaced",
+}
+
+
+class PortfolioCache:
+    """
+    In-memory copy of the account, the positions and the open orders.
+
+    The state is loaded from the REST API once, then kept up to date by the trade updates (see `on_trade_update`):
+    fills adjust the cash and the positions, other events the open orders. Updates come from the Alpaca trade
+    updates stream (`trade_update_callback`) or from any other source calling `on_trade_update`. When nothing was
+    received for `ttl` seconds, the next read reloads the whole state from the REST API in case an update was missed.
+
+    A single reload runs at a time, the other stale readers wait for it. Every update is counted: a reload during
+    which an update was applied is discarded, as the REST state may have been read before that update.
+
+    The cache exposes the same `account` and `get_positions` as AlpacaAPI, so it can be passed to the helpers in
+    place of the API.
+
+    Attributes:
+        api (AlpacaAPI): The API used to load the state.
+        ttl (float): Seconds after which the state is reloaded when no update was received.
+
+    """
+
+    def __init__(
+        self,
+        api: AlpacaAPI,
+        ttl: float = PORTFOLIO_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.api = api
+        self.ttl = ttl
+        self.clock = clock
+
+        self._account = None
+        self.positions = {}
+        self.orders = {}
+        self.updated_at = None
+        self.updates = 0
+        self.lock = threading.RLock()
+        self.refresh_lock = threading.RLock()
+
+    @property
+    def stale(self) -> bool:
+        return self.updated_at is None or self.clock() - self.updated_at > self.ttl
+
+    def refresh(self) -> bool:
+        """
+        Reloads the account, the positions and the open orders from the REST API
+        Returns:
+            Whether the state was replaced, False when a trade update was applied while loading it
+        """
+        with self.refresh_lock:
+            with self.lock:
+                updates = self.updates
+            account = Account(**self.api.get_account())
+            positions = self.api.get_positions()
+            orders = self.api.get_orders()
+            with self.lock:
+                # Before the first load the updates only track the orders, there is no newer state to keep
+                if self.updates != updates and self._account is not None:
+                    logger.debug("Portfolio refresh discarded, a trade update arrived")
+                    return False
+                self._account = account
+                self.positions = {position.symbol: position for position in positions}
+                self.orders = {order.id: order for order in orders}
+                self.updated_at = self.clock()
+        logger.debug(
+            f"Portfolio refreshed: cash {account.cash}, {len(self.positions)} positions, {len(self.orders)} open orders"
+        )
+        return True
+
+    def prefetch(self) -> threading.Thread:
+        """
+        Loads the state in the background (e.g. while the stream connects), a read before it is loaded loads it
+        """
+
+        def load():
+            try:
+                self.ensure_fresh()
+            except Exception:
+                # Already logged, the first read retries
+                pass
+
+        thread = threading.Thread(name="Portfolio", target=load, daemon=True)
+        thread.start()
+        return thread
+
+    def ensure_fresh(self) -> None:
+        if not self.stale:
+            return
+        with self.refresh_lock:
+            # Another reader may have reloaded the state while this one waited
+            if not self.stale:
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the last known state, the next read retries
+                logger.exception(e)
+                if self._account is None:
+                    raise
+
+    @property
+    def account(self) -> Account:
+        self.ensure_fresh()
+        return self._account
+
+    @property
+    def cash(self) -> float:
+        return float(self.account.cash)
+
+    def get_positions(
+        self, symbol: str = None
+    ) -> Union[Position, list[Position], None]:
+        self.ensure_fresh()
+        if symbol:
+            return self.positions.get(symbol)
+        return list(self.positions.values())
+
+    def get_orders(self) -> list[Order]:
+        self.ensure_fresh()
+        return list(self.orders.values())
+
+    def mark(self, symbol: str, price: float) -> None:
+        """
+        Revalues the position of the symbol at the given price
+        Args:
+            symbol: The symbol of the position
+            price: The latest price
+
+        Returns:
+            None
+        """
+        with self.lock:
+            position = self.positions.get(symbol)
+            if position is None:
+                return
+            qty, cost_basis = float(position.qty), float(position.cost_basis)
+            market_value = qty * price
+            self.positions[symbol] = dataclasses.replace(
+                position,
+                current_price=price,
+                market_value=market_value,
+                unrealized_pl=market_value - cost_basis,
+                unrealized_plpc=(
+                    (market_value - cost_basis) / cost_basis if cost_basis else 0.0
+                ),
+            )
+
+    def on_trade_update(self, update: dict) -> None:
+        """
+        Applies a trade update (see https://alpaca.markets/docs/api-references/trading-api/streaming/)
+        Args:
+            update: The update, with the `event`, the `order` and for fills the `price`, `qty` and `position_qty`
+
+        Returns:
+            None
+        """
+        data, event = update["order"], update["event"]
+        logger.debug(f"Trade update: {event} {data['side']} {data['symbol']}")
+
+        with self.lock:
+            self.updates += 1
+            if event in closed_order_events:
+                self.orders.pop(data["id"], None)
+            else:
+                order = EntityFactory(dict(data)).create_entity("orders")
+                if order is not None:
+                    self.orders[order.id] = order
+
+            if self._account is None:
+                # Nothing loaded yet, the first read fetches the whole state
+                return
+            if event in ("fill", "partial_fill"):
+                self.fill(
+                    data,
+                    float(update["qty"]),
+                    float(update["price"]),
+                    float(update["position_qty"]),
+                )
+            self.updated_at = self.clock()
+
+    def fill(self, order: dict, qty: float, price: float, position_qty: float):
+        symbol = order["symbol"]
+        amount = qty * price
+        cash = float(self._account.cash)
+        self._account = dataclasses.replace(
+            self._account,
+            cash=cash - amount if order["side"] == "buy" else cash + amount,
+        )
+
+        position = self.positions.get(symbol)
+        if not position_qty:
+            self.positions.pop(symbol, None)
+            return
+
+        if position is None:
+            cost_basis = position_qty * price
+            position = Position(
+                asset_id=order.get("asset_id"),
+                symbol=symbol,
+                exchange="",
+                asset_class=order.get("asset_class"),
+                avg_entry_price=price,
+                qty=position_qty,
+                side="long" if position_qty > 0 else "short",
+                market_value=cost_basis,
+                cost_basis=cost_basis,
+                unrealized_pl=0.0,
+                unrealized_plpc=0.0,
+                unrealized_intraday_pl=0.0,
+                unrealized_intraday_plpc=0.0,
+                current_price=price,
+                lastday_price=price,
+                change_today=0.0,
+            )
+        else:
+            cost_basis = float(position.cost_basis)
+            if abs(position_qty) > abs(float(position.qty)):
+                # Adding to the position moves the average entry price
+                cost_basis += amount if position_qty > 0 else -amount
+            else:
+                cost_basis *= position_qty / float(position.qty)
+            position = dataclasses.replace(
+                position,
+                qty=position_qty,
+                cost_basis=cost_basis,
+                avg_entry_price=cost_basis / position_qty,
+            )
+        self.positions[symbol] = position
+        self.mark(symbol, price)
+
+    async def trade_update_callback(self, update: dict) -> None:
+        """
+        Callback for the stream.subscribe_trade_updates method
+        Args:
+            update: A dict object, containing the trade update
+
+        Returns:
+            None
+        """
+        try:
+            self.on_trade_update(update)
+        except Exception as e:
+            logger.exception(e)
+            # Reload everything on the next read rather than serving a wrong state
+            self.updated_at = None
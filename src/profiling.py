@@ -0,0 +1,128 @@
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Union
+
+from src.settings import APP_NAME
+
+logger = logging.getLogger(APP_NAME)
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of every thread of the process, light enough to run on a live session.
+
+    A background thread samples the stack of the other threads every `interval` seconds (sys._current_frames) instead
+    of hooking every call like cProfile, so the overhead does not depend on how many calls the pipeline makes and the
+    dispatcher threads are profiled as well. Each sample is weighted by the time elapsed since the previous one: the
+    self time of a function is the time it was running, its total time the time it was on the stack. Times are wall
+    clock times, a thread waiting on the queue shows up in `wait`.
+
+    Attributes:
+        interval (float): Seconds between two samples.
+        samples (int): Number of samples taken.
+        self_times (Counter): Seconds spent running each function, by (file, line, name).
+        total_times (Counter): Seconds spent with each function on the stack, by (file, line, name).
+        stacks (Counter): Seconds spent in each stack, by "thread;outer;...;inner" (folded stacks format).
+
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples = 0
+        self.self_times = Counter()
+        self.total_times = Counter()
+        self.stacks = Counter()
+        self.started = None
+        self.elapsed = 0.0
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        logger.info(f"Profiling every {self.interval * 1000:.1f}ms")
+        self.started = time.perf_counter()
+        self.stopped.clear()
+        self.thread = threading.Thread(name="Profiler", target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.started is not None:
+            self.elapsed += time.perf_counter() - self.started
+            self.started = None
+
+    def run(self) -> None:
+        previous = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            now = time.perf_counter()
+            self.sample(now - previous)
+            previous = now
+
+    def sample(self, weight: float) -> None:
+        """
+        Records the current stack of every other thread
+        Args:
+            weight: Seconds the sample stands for
+
+        Returns:
+            None
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        current = threading.get_ident()
+        with self.lock:
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == current:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                self.self_times[stack[0]] += weight
+                for function in set(stack):
+                    self.total_times[function] += weight
+                folded = ";".join(name for _, _, name in reversed(stack))
+                self.stacks[f"{names.get(ident, ident)};{folded}"] += weight
+
+    def report(self, limit: int = 30) -> str:
+        """
+        Returns the functions with the highest self time, with their self and total times
+        """
+        with self.lock:
+            rows = self.self_times.most_common(limit)
+            total_times = dict(self.total_times)
+        lines = [
+            f"{self.samples} samples over {self.elapsed:.1f}s (every {self.interval * 1000:.1f}ms)",
+            f"{'self (s)':>10}{'total (s)':>11}  function",
+        ]
+        for function, seconds in rows:
+            filename, line, name = function
+            lines.append(
+                f"{seconds:>10.3f}{total_times[function]:>11.3f}  {name} ({filename}:{line})"
+            )
+        return "\n".join(lines)
+
+    def dump(self, path: Union[str, Path]) -> None:
+        """
+        Writes the report to `path` and the folded stacks next to it (<path>.folded), e.g. for flamegraph.pl
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.report(limit=100) + "\n")
+        with self.lock:
+            stacks = sorted(self.stacks.items())
+        with open(path.with_suffix(".folded"), "w") as file:
+            for stack, seconds in stacks:
+                # Folded stacks take integer counts, in microseconds here
+                file.write(f"{stack} {round(seconds * 1e6)}\n")
+        logger.info(f"Profile written to {path}")
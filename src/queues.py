@@ -0,0 +1,157 @@
+import queue
+import time
+from collections import deque
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+CONFLATE = "conflate"
+policies = (BLOCK, DROP_OLDEST, CONFLATE)
+
+
+class QueueStats:
+    """
+    Counters of a MarketDataQueue, updated under the queue lock.
+
+    Attributes:
+        enqueued (int): Messages put in the queue.
+        dequeued (int): Messages taken from the queue.
+        dropped (int): Messages discarded to make room (drop_oldest, or conflate without an older message to replace).
+        conflated (int): Messages replaced by a newer one of the same symbol (conflate).
+        blocked (int): Puts that had to wait for room (block).
+        max_depth (int): Highest number of queued messages.
+        latency_last (float): Seconds the last dequeued message spent in the queue.
+        latency_max (float): Highest time spent in the queue.
+        latency_total (float): Sum of the times spent in the queue, to compute the average.
+
+    """
+
+    def __init__(self):
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.blocked = 0
+        self.max_depth = 0
+        self.latency_last = 0.0
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+
+    @property
+    def latency_avg(self) -> float:
+        return self.latency_total / self.dequeued if self.dequeued else 0.0
+
+
+class MarketDataQueue(queue.Queue):
+    """
+    Bounded queue between the stream and the dispatchers, with a policy for when it is full.
+
+    - block: the publisher waits for room, nothing is lost (the stream falls behind instead)
+    - drop_oldest: the oldest message is discarded
+    - conflate: the most recent queued message of the same symbol is replaced by the new one, so every symbol keeps
+      its latest state; the oldest message is discarded when the symbol has nothing queued
+
+    Every message is timestamped when queued, `stats` exposes the depth, the drops and the time spent in the queue.
+    A maxsize of 0 keeps the queue unbounded.
+
+    Attributes:
+        policy (str): The overflow policy.
+        stats (QueueStats): The counters.
+
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        policy: str = BLOCK,
+        clock=time.monotonic,
+    ):
+        if policy not in policies:
+            raise ValueError(f"Queue policy must be one of {policies}, got {policy}")
+        super().__init__(maxsize)
+        self.policy = policy
+        self.clock = clock
+        self.stats = QueueStats()
+
+    def _init(self, maxsize):
+        self.queue = deque()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        self.queue.append((self.clock(), item))
+        self.stats.enqueued += 1
+        self.stats.max_depth = max(self.stats.max_depth, len(self.queue))
+
+    def _get(self):
+        enqueued_at, item = self.queue.popleft()
+        latency = self.clock() - enqueued_at
+        self.stats.dequeued += 1
+        self.stats.latency_last = latency
+        self.stats.latency_max = max(self.stats.latency_max, latency)
+        self.stats.latency_total += latency
+        return item
+
+    def _discard(self, index: int) -> None:
+        del self.queue[index]
+        # The discarded message will never be marked as done
+        self.unfinished_tasks -= 1
+        if not self.unfinished_tasks:
+            self.all_tasks_done.notify_all()
+
+    def _make_room(self, item) -> None:
+        if self.policy == CONFLATE:
+            symbol = getattr(item, "symbol", None)
+            for index in range(len(self.queue) - 1, -1, -1):
+                queued = self.queue[index][1]
+                if type(queued) is type(item) and queued.symbol == symbol:
+                    self._discard(index)
+                    self.stats.conflated += 1
+                    return
+        self._discard(0)
+        self.stats.dropped += 1
+
+    def put(self, item, block=True, timeout=None):
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                if self.policy == BLOCK:
+                    if not block:
+                        raise queue.Full
+                    self.stats.blocked += 1
+                    deadline = None if timeout is None else self.clock() + timeout
+                    while self._qsize() >= self.maxsize:
+                        remaining = (
+                            None if deadline is None else deadline - self.clock()
+                        )
+                        if remaining is not None and remaining <= 0:
+                            raise queue.Full
+                        self.not_full.wait(remaining)
+                else:
+                    self._make_room(item)
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    @property
+    def depth(self) -> int:
+        return self.qsize()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the counters at once, e.g. to be logged or exported
+        """
+        with self.mutex:
+            return {
+                "depth": len(self.queue),
+                "maxsize": self.maxsize,
+                "policy": self.policy,
+                "enqueued": self.stats.enqueued,
+                "dequeued": self.stats.dequeued,
+                "dropped": self.stats.dropped,
+                "conflated": self.stats.conflated,
+                "blocked": self.stats.blocked,
+                "max_depth": self.stats.max_depth,
+                "latency_last": self.stats.latency_last,
+                "latency_avg": self.stats.latency_avg,
+                "latency_max": self.stats.latency_max,
+            }
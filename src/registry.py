@@ -0,0 +1,48 @@
+from typing import Callable
+
+from src.base import Strategy
+
+# Strategy classes by name, filled by the `register` decorator
+strategies = {}
+
+
+def register(name: str) -> Callable[[type], type]:
+    """
+    Class decorator adding a strategy to the registry, so that it can be created from the configuration
+    Args:
+        name: The name of the strategy in the configuration
+
+    Returns:
+        The decorator
+    """
+
+    def decorator(strategy_class: type) -> type:
+        if name in strategies and strategies[name] is not strategy_class:
+            raise ValueError(f"Strategy {name} is already registered")
+        strategies[name] = strategy_class
+        strategy_class.name = name
+        return strategy_class
+
+    return decorator
+
+
+def get_strategy_class(name: str) -> type:
+    try:
+        return strategies[name]
+    except KeyError:
+        raise ValueError(
+            f"Strategy {name} not registered (available: {', '.join(sorted(strategies))})"
+        ) from None
+
+
+def create_strategy(name: str, **params) -> Strategy:
+    """
+    Creates a registered strategy
+    Args:
+        name: The name of the strategy
+        **params: The parameters of the strategy
+
+    Returns:
+        The strategy
+    """
+    return get_strategy_class(name)(**params)
@@ -0,0 +1,386 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Union
+
+from alpaca.entities import Bar
+from alpaca.store import BarStore
+from alpaca.timestamps import to_nanoseconds
+from src.backtest import Fill, SimulatedAccount, simulated_position
+from src.base import Strategy
+from src.clients import PublisherClient, SubscriberClient
+from src.journal import BAR, QUOTE, TRADE, read_journal
+from src.queues import MarketDataQueue
+from src.runner import build_runners
+from src.settings import (
+    ALLOWED_CRYPTO_EXCHANGES,
+    APP_NAME,
+    CRYPTO,
+    DISPATCH_BATCH_SIZE,
+    DISPATCH_WORKERS,
+    QUEUE_MAXSIZE,
+    QUEUE_POLICY,
+    STRATEGIES,
+    SYMBOLS,
+)
+from src.tracing import EXCHANGE, tracer
+
+logger = logging.getLogger(APP_NAME)
+
+
+class ReplayStream:
+    """
+    Stand-in for alpaca_trade_api.Stream that plays a Journal back to the subscribed handlers.
+
+    Messages are delivered in the order they were recorded, to the handler subscribed for their kind and symbol,
+    on an event loop owned by `run` (shared with an AsyncAlpacaAPI like the loop of the Stream). At `speed` 1 the
+    original gaps between the receive times are reproduced, at N they are divided by N, at 0 messages are delivered
+    as fast as the handlers take them.
+
+    Attributes:
+        path (Path): The journal directory, or a single segment.
+        speed (float): Replay speed, relative to the recording (0 for as fast as possible).
+        replayed (int): Number of messages delivered.
+        elapsed (float): Seconds the last replay took.
+
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        speed: float = 1.0,
+        start: int = None,
+        end: int = None,
+    ):
+        self.path = Path(path)
+        self.speed = speed
+        self.start = start
+        self.end = end
+        self.handlers = {BAR: {}, QUOTE: {}, TRADE: {}}
+        self.replayed = 0
+        self.elapsed = 0.0
+        self.stopped = threading.Event()
+        self._loop = None
+
+    def _subscribe(self, kind: str, handler: Callable, symbols: tuple) -> None:
+        for symbol in symbols:
+            self.handlers[kind][symbol] = handler
+
+    def subscribe_bars(self, handler: Callable, *symbols) -> None:
+        self._subscribe(BAR, handler, symbols)
+
+    def subscribe_quotes(self, handler: Callable, *symbols) -> None:
+        self._subscribe(QUOTE, handler, symbols)
+
+    def subscribe_trades(self, handler: Callable, *symbols) -> None:
+        self._subscribe(TRADE, handler, symbols)
+
+    # Crypto and stock messages are recorded alike
+    subscribe_crypto_bars = subscribe_bars
+    subscribe_crypto_quotes = subscribe_quotes
+    subscribe_crypto_trades = subscribe_trades
+
+    def subscribe_trade_updates(self, handler: Callable) -> None:
+        # Trade updates are not journaled, there is nothing to replay
+        pass
+
+    def run(self) -> None:
+        """
+        Replays the journal, blocking until it is exhausted or `stop` is called
+        """
+        self.stopped.clear()
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._replay())
+        finally:
+            self._loop.close()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    async def _replay(self) -> None:
+        self.replayed = 0
+        origin = started = None
+        for received, kind, message in read_journal(self.path, self.start, self.end):
+            if self.stopped.is_set():
+                break
+            handler = self.handlers.get(kind, {}).get(message.get("S"))
+            if handler is None:
+                continue
+
+            if origin is None:
+                origin, started = received, time.monotonic()
+            if self.speed > 0:
+                delay = (received - origin) / 1e9 / self.speed - (
+                    time.monotonic() - started
+                )
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif self.replayed % 1000 == 0:
+                # Lets the other tasks of the loop (e.g. order submissions) run
+                await asyncio.sleep(0)
+            await handler(message)
+            self.replayed += 1
+
+        self.elapsed = time.monotonic() - started if started is not None else 0.0
+        logger.info(
+            f"Replayed {self.replayed} messages in {self.elapsed:.3f}s "
+            f"({self.replayed / max(self.elapsed, 1e-9):.0f} messages/s)"
+        )
+
+
+class ReplayRunner(Strategy):
+    """
+    Wraps the strategy of a symbol during a replay, storing every bar right before the strategy applies it.
+
+    The history a strategy reads from the ReplayAPI then ends at the bar it is processing, however far ahead of the
+    dispatchers the stream is replayed (the PublisherClient would store the bars as soon as they are received).
+
+    Attributes:
+        strategy (Strategy): The wrapped strategy.
+        store (BarStore): The store of the ReplayAPI.
+
+    """
+
+    def __init__(self, strategy: Strategy, store: BarStore, timeframe: str = "1Min"):
+        self.strategy = strategy
+        self.store = store
+        self.timeframe = timeframe
+
+    def warm_up(self) -> None:
+        self.strategy.warm_up()
+
+    def apply(self, entity):
+        self.apply_batch([entity])
+
+    def apply_batch(self, entities: list):
+        for entity in entities:
+            if isinstance(entity, Bar):
+                self.store.append(entity, self.timeframe)
+        self.strategy.apply_batch(entities)
+
+
+class ReplayAPI:
+    """
+    Offline stand-in for AlpacaAPI during a replay.
+
+    The history is read from the BarStore ReplayRunner fills with the dispatched bars, so strategies only see the
+    bars replayed so far. Orders are filled immediately at the close of the latest bar of their symbol, cash and
+    positions are kept in memory (long only).
+
+    Attributes:
+        store (BarStore): The store of the replayed bars.
+        fills (list[Fill]): The executed orders, in order.
+
+    """
+
+    def __init__(
+        self,
+        store: BarStore,
+        cash: float = 10000.0,
+        history: datetime.timedelta = datetime.timedelta(hours=2),
+        timeframe: str = "1Min",
+    ):
+        self.store = store
+        self.history = history
+        self.timeframe = timeframe
+        self.account = SimulatedAccount(cash=cash)
+        self.positions = {}
+        self.fills = []
+        self.lock = threading.Lock()
+
+    def latest(self, symbol: str, exchanges: list = None) -> Union[Bar, None]:
+        return self.store.latest(symbol, self.timeframe, exchanges)
+
+    def get_account(self) -> dict:
+        return {"cash": self.account.cash}
+
+    def get_bars(
+        self,
+        symbol: str,
+        timeframe: str = "1Min",
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+        exchanges: list = None,
+        crypto: bool = False,
+        **kwargs,
+    ) -> list[Bar]:
+        exchanges = exchanges if crypto else None
+        latest = self.store.latest(symbol, timeframe, exchanges)
+        if latest is None:
+            return []
+        end = to_nanoseconds(end if end is not None else latest.timestamp)
+        start = (
+            to_nanoseconds(start)
+            if start is not None
+            else end - self.history // datetime.timedelta(microseconds=1) * 1000
+        )
+        return self.store.query(symbol, timeframe, exchanges, start, end)
+
+    def get_positions(self, symbol: str = None):
+        with self.lock:
+            if symbol is None:
+                symbols = list(self.positions)
+            elif symbol in self.positions:
+                symbols = [symbol]
+            else:
+                return None
+            positions = [
+                simulated_position(name, *self.positions[name], self.latest(name).close)
+                for name in symbols
+            ]
+        return positions if symbol is None else positions[0]
+
+    def get_orders(self) -> list:
+        return []
+
+    def place_order(
+        self, symbol: str, qty: float = None, side: str = "buy", **kwargs
+    ) -> Union[Fill, None]:
+        latest = self.latest(symbol)
+        qty = float(qty or 0)
+        with self.lock:
+            held, entry_price = self.positions.get(symbol, (0.0, 0.0))
+            if latest is None or qty <= 0 or (side == "sell" and qty > held):
+                logger.debug(f"Rejected order: {symbol=}, {side=}, {qty=}")
+                return None
+
+            price = latest.close
+            if side == "buy":
+                self.account.cash -= qty * price
+                self.positions[symbol] = (
+                    held + qty,
+                    price if not held else entry_price,
+                )
+            else:
+                self.account.cash += qty * price
+                if qty == held:
+                    del self.positions[symbol]
+                else:
+                    self.positions[symbol] = (held - qty, entry_price)
+
+            # Replayed bars are not indexed, the fills are numbered instead
+            fill = Fill(
+                len(self.fills),
+                to_nanoseconds(latest.timestamp),
+                symbol,
+                side,
+                qty,
+                price,
+            )
+            self.fills.append(fill)
+        return fill
+
+
+def replay(
+    path: Union[str, Path],
+    speed: float = 1.0,
+    specs: list[dict] = None,
+    workers: int = DISPATCH_WORKERS,
+    cash: float = 10000.0,
+    batch_size: int = DISPATCH_BATCH_SIZE,
+) -> dict:
+    """
+    Replays a journal through the whole pipeline: ReplayStream -> PublisherClient -> SubscriberClient -> strategies,
+    trading against a ReplayAPI
+    Args:
+        path: The journal
+        speed: The replay speed (see ReplayStream)
+        specs: The strategies to run (see build_runners), the ones of the configuration by default
+        workers: Number of Dispatcher threads
+        cash: Initial cash of the simulated account
+        batch_size: Messages a dispatcher applies at once (see SubscriberClient), 1 evaluates every bar so that the
+            fills do not depend on how far behind the dispatchers are
+
+    Returns:
+        The number of messages, the time it took to process them, the fills and the final cash
+    """
+    store = BarStore()
+    api = ReplayAPI(store, cash=cash)
+    stream = ReplayStream(path, speed)
+    queue = MarketDataQueue(maxsize=QUEUE_MAXSIZE, policy=QUEUE_POLICY)
+    specs = (
+        specs
+        or STRATEGIES
+        or [
+            {"strategy": "cross_moving_average", "symbol": symbol} for symbol in SYMBOLS
+        ]
+    )
+    strategies = {
+        symbol: ReplayRunner(runner, store)
+        for symbol, runner in build_runners(
+            specs,
+            api=api,
+            crypto=CRYPTO,
+            allowed_crypto_exchanges=ALLOWED_CRYPTO_EXCHANGES,
+        ).items()
+    }
+    publisher = PublisherClient(stream=stream, symbols=list(strategies), queue=queue)
+    subscriber = SubscriberClient(
+        api=api,
+        strategies=strategies,
+        crypto=CRYPTO,
+        queue=queue,
+        workers=workers,
+        batch_size=batch_size,
+    )
+
+    start = time.monotonic()
+    subscriber.start()
+    publisher.start()
+    # Every replayed message has been handled once the queue and the shards are drained
+    queue.join()
+    for shard in subscriber.shards:
+        shard.join()
+    elapsed = time.monotonic() - start
+
+    return {
+        "messages": stream.replayed,
+        "elapsed": elapsed,
+        "rate": stream.replayed / max(elapsed, 1e-9),
+        "fills": api.fills,
+        "cash": api.account.cash,
+        "queue": subscriber.snapshot(),
+    }
+
+
+if __name__ == "__main__":
+    # python -m src.replay data/journal --speed 100
+    parser = argparse.ArgumentParser(
+        prog="python -m src.replay",
+        description="Replays a stream journal through the strategies, offline",
+    )
+    parser.add_argument("path", type=Path, help="The journal directory or segment")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay speed relative to the recording, 0 for as fast as possible",
+    )
+    parser.add_argument("--workers", type=int, default=DISPATCH_WORKERS)
+    parser.add_argument("--cash", type=float, default=10000.0)
+    parser.add_argument("--batch-size", type=int, default=DISPATCH_BATCH_SIZE)
+    args = parser.parse_args()
+
+    result = replay(
+        args.path,
+        args.speed,
+        workers=args.workers,
+        cash=args.cash,
+        batch_size=args.batch_size,
+    )
+    logger.info(
+        f"Processed {result['messages']} messages in {result['elapsed']:.3f}s "
+        f"({result['rate']:.0f} messages/s), {len(result['fills'])} fills, cash {result['cash']:.2f}"
+    )
+    logger.info(f"Queue: {result['queue']}")
+    # Exchange timestamps are those of the recording, only the latencies between stages are meaningful
+    for name, stats in tracer.snapshot().items():
+        if not name.startswith(EXCHANGE):
+            logger.info(
+                f"{name}: n={stats['count']} p50={stats['p50']:.3f}ms p99={stats['p99']:.3f}ms max={stats['max']:.3f}ms"
+            )
@@ -0,0 +1,87 @@
+import logging
+
+import src.strategies  # noqa: F401 (registers the built-in strategies)
+from src.base import Strategy
+from src.indicators import IndicatorSet
+from src.registry import create_strategy
+from src.settings import APP_NAME
+
+logger = logging.getLogger(APP_NAME)
+
+
+class StrategyRunner(Strategy):
+    """
+    Hosts every strategy of one symbol behind a single SubscriberClient entry.
+
+    The strategies share an IndicatorSet, so each bar updates the common indicators once. The runners of different
+    symbols are spread over the dispatcher threads of the SubscriberClient, the strategies of a runner are applied
+    in order by the thread of their symbol. A failing strategy does not prevent the others from running.
+
+    Attributes:
+        symbol (str): The symbol of the strategies.
+        strategies (list[Strategy]): The hosted strategies.
+        indicators (IndicatorSet): The indicators shared by the strategies.
+
+    """
+
+    def __init__(self, symbol: str, indicators: IndicatorSet = None):
+        self.symbol = symbol
+        self.strategies = []
+        self.indicators = indicators if indicators is not None else IndicatorSet()
+
+    def __len__(self):
+        return len(self.strategies)
+
+    def add(self, strategy: Strategy) -> Strategy:
+        self.strategies.append(strategy)
+        return strategy
+
+    def warm_up(self) -> None:
+        # The strategies share the indicators: the first warm-up synchronizes them, the others find them synced
+        for strategy in self.strategies:
+            try:
+                strategy.warm_up()
+            except Exception as e:
+                logger.exception(e)
+
+    def apply(self, entity):
+        self.apply_batch([entity])
+
+    def apply_batch(self, entities: list):
+        for strategy in self.strategies:
+            try:
+                strategy.apply_batch(entities)
+            except Exception as e:
+                logger.exception(e)
+
+
+def build_runners(specs: list[dict], **context) -> dict[str, StrategyRunner]:
+    """
+    Creates the strategies described by the configuration, grouped by symbol
+    Args:
+        specs: One dict per strategy, with the registered name of the strategy (`strategy`), its `symbol` and its
+            parameters, e.g. {"strategy": "cross_moving_average", "symbol": "BTCUSD", "short_window": 5}
+        **context: Parameters given to every strategy (e.g. the api), overridden by the ones of the spec
+
+    Returns:
+        The runners by symbol
+    """
+    runners = {}
+    for spec in specs:
+        params = dict(spec)
+        name = params.pop("strategy")
+        runner = runners.get(params["symbol"])
+        if runner is None:
+            runner = runners[params["symbol"]] = StrategyRunner(params["symbol"])
+        runner.add(
+            create_strategy(
+                name, **{**context, **params, "indicators": runner.indicators}
+            )
+        )
+        logger.info(f"Created {name} for {params['symbol']}: {params}")
+
+    for symbol, runner in runners.items():
+        logger.info(
+            f"{symbol}: {len(runner)} strategies sharing {len(runner.indicators)} indicators"
+        )
+    return runners
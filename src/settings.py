@@ -1,9 +1,11 @@
+import json
 import logging
-import queue
 from pathlib import Path
 
 from decouple import config
 
+from src.queues import MarketDataQueue
+
 # Generic configuration
 APP_NAME = config("APP_NAME", default="Farmer")
 BASE_DIR = config("BASE_DIR", default=Path(__file__).resolve().parent.parent)
@@ -14,13 +16,30 @@ APCA_API_SECRET_KEY = config("APCA_API_SECRET_KEY")
 APCA_API_BASE_URL = config(
     "APCA_API_BASE_URL", default="https://paper-api.alpaca.markets"
 )
+# Market data API, e.g. http://localhost:8000 to query the mock server (backend.py)
+APCA_API_DATA_URL = config("APCA_API_DATA_URL", default="https://data.alpaca.markets")
 DATA_FEED = config(
     "DATA_FEED", default="iex"
 )  # <- replace to SIP if you have PRO subscription
+# Client side request budget (requests per minute), largest burst and requests kept for orders
+API_RATE_LIMIT = config("API_RATE_LIMIT", default=200, cast=int)
+API_RATE_BURST = config("API_RATE_BURST", default=50, cast=int)
+API_RATE_RESERVE = config("API_RATE_RESERVE", default=10, cast=int)
+# Bars and positions requests memoized for API_CACHE_TTL seconds, API_CACHE_SIZE results at most
+API_CACHE_SIZE = config("API_CACHE_SIZE", default=256, cast=int)
+API_CACHE_TTL = config("API_CACHE_TTL", default=5.0, cast=float)
 
 # App configuration
 SYMBOL = config("SYMBOL", default="BTCUSD")
+SYMBOLS = config(
+    "SYMBOLS", default=SYMBOL, cast=lambda x: x.replace(" ", "").split(",")
+)
 BAR_SIZE = config("BAR_SIZE", default="minute")
+# JSON list of the strategies to run, e.g. [{"strategy": "cross_moving_average", "symbol": "BTCUSD", "short_window": 5}]
+# When empty, a cross_moving_average with the default parameters runs on each of the SYMBOLS
+STRATEGIES = config(
+    "STRATEGIES", default="", cast=lambda x: json.loads(x) if x.strip() else []
+)
 
 CRYPTO = config("CRYPTO", default=False, cast=bool)
 ALLOWED_CRYPTO_EXCHANGES = config(
@@ -32,6 +51,51 @@ CRYPTO_SYMBOLS = config(
     cast=lambda x: x.split(","),
 )
 
+# Local bar store, set BAR_STORE_PATH to an empty value to keep the bars in memory only
+BAR_STORE_PATH = config(
+    "BAR_STORE_PATH", default=str(Path(BASE_DIR) / "data" / "store")
+)
+
+# Number of Dispatcher threads, messages are sharded among them by symbol
+DISPATCH_WORKERS = config("DISPATCH_WORKERS", default=4, cast=int)
+# Dispatchers drain up to DISPATCH_BATCH_SIZE queued messages (waiting at most DISPATCH_BATCH_WAIT seconds for more)
+# and hand them to the strategies at once, set DISPATCH_BATCH_SIZE to 1 to process messages one by one
+DISPATCH_BATCH_SIZE = config("DISPATCH_BATCH_SIZE", default=100, cast=int)
+DISPATCH_BATCH_WAIT = config("DISPATCH_BATCH_WAIT", default=0.0, cast=float)
+
+# Seconds after which the cached account and positions are reloaded from the REST API when no trade update arrived
+PORTFOLIO_TTL = config("PORTFOLIO_TTL", default=60.0, cast=float)
+
+# Order submission: attempts per order and exponential backoff (seconds, with full jitter) on 429/5xx responses
+ORDER_MAX_ATTEMPTS = config("ORDER_MAX_ATTEMPTS", default=5, cast=int)
+ORDER_RETRY_BASE = config("ORDER_RETRY_BASE", default=0.25, cast=float)
+ORDER_RETRY_CAP = config("ORDER_RETRY_CAP", default=8.0, cast=float)
+
+# Seconds after which the quote of an exchange no longer counts in the best bid and ask (0 keeps it until the next one)
+QUOTE_MAX_AGE = config("QUOTE_MAX_AGE", default=10.0, cast=float)
+
+# Seconds after which an order still open without a trade update is looked up from the REST API
+ORDER_RECONCILE_AFTER = config("ORDER_RECONCILE_AFTER", default=60.0, cast=float)
+
+# Latency tracing of the pipeline, exported as JSON on http://localhost:METRICS_PORT/metrics (0 disables the
+# endpoint) and logged every METRICS_LOG_INTERVAL seconds (0 disables the summary)
+TRACING = config("TRACING", default=True, cast=bool)
+METRICS_PORT = config("METRICS_PORT", default=9100, cast=int)
+METRICS_LOG_INTERVAL = config("METRICS_LOG_INTERVAL", default=60.0, cast=float)
+# Journal of the raw stream messages, appended to JOURNAL_PATH (empty disables it) in segments of JOURNAL_SEGMENT_SIZE
+# bytes, flushed every JOURNAL_FLUSH_INTERVAL seconds. Replay it with python -m src.replay
+JOURNAL_PATH = config("JOURNAL_PATH", default="")
+JOURNAL_SEGMENT_SIZE = config("JOURNAL_SEGMENT_SIZE", default=64 * 2**20, cast=int)
+JOURNAL_FLUSH_INTERVAL = config("JOURNAL_FLUSH_INTERVAL", default=1.0, cast=float)
+
+# Sampling profiler of the live session (every PROFILE_INTERVAL seconds), per-function timings are written to
+# PROFILE_PATH and the folded stacks next to it when the session stops
+PROFILE = config("PROFILE", default=False, cast=bool)
+PROFILE_INTERVAL = config("PROFILE_INTERVAL", default=0.005, cast=float)
+PROFILE_PATH = config(
+    "PROFILE_PATH", default=str(Path(BASE_DIR) / "data" / "profile.txt")
+)
+
 # Logging configuration
 logger = logging.getLogger(APP_NAME)
 handler = logging.StreamHandler()
@@ -43,5 +107,9 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 logger.setLevel(config("LOG_LEVEL", default="INFO").upper())
 
-# Queue
-q = queue.Queue()
+# Queue between the stream and the dispatchers. When QUEUE_MAXSIZE messages are pending, QUEUE_POLICY decides:
+# "block" the stream, "drop_oldest" message or "conflate" the pending messages of the same symbol (0 is unbounded).
+# Nothing is lost by default, the two other policies discard bars the strategies would otherwise see
+QUEUE_MAXSIZE = config("QUEUE_MAXSIZE", default=10000, cast=int)
+QUEUE_POLICY = config("QUEUE_POLICY", default="block")
+q = MarketDataQueue(maxsize=QUEUE_MAXSIZE, policy=QUEUE_POLICY)
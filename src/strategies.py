@@ -1,15 +1,48 @@
+import datetime
 import logging
 
-from alpaca.clients import AlpacaAPI
-from alpaca.entities import Bar
+import numpy as np
+
+from alpaca.clients import AlpacaAPI, AsyncAlpacaAPI
+from alpaca.entities import Bar, BarBatch
+from alpaca.timestamps import to_nanoseconds
 from src.base import Strategy
-from src.helpers import get_historical_data, get_position, get_target_position
+from src.helpers import (
+    get_historical_data,
+    get_position,
+    get_position_async,
+    get_target_position,
+    to_datetime,
+)
+from src.indicators import IndicatorSet, SimpleMovingAverage, sma
+from src.market import ConflationBuffer
+from src.orders import OrderGateway, client_order_id
+from src.portfolio import PortfolioCache
+from src.registry import register
 from src.settings import APP_NAME
+from src.tracing import tracer
 
 logger = logging.getLogger(APP_NAME)
 
 
+@register("cross_moving_average")
 class CrossMovingAverage(Strategy):
+    """
+    Buys when the short moving average crosses above the long one and sells when it crosses back.
+
+    The moving averages are warmed up once from the historical bars and then updated incrementally with every
+    streamed bar. History is fetched again only when a gap between two bars of the same exchange is detected
+    (e.g. after a reconnect) or when `resync` is called explicitly.
+
+    When an AsyncAlpacaAPI is given, the position and the history needed by a bar are fetched concurrently. When a
+    PortfolioCache is given, the cash and the position are read from it instead of the REST API. When a
+    ConflationBuffer is given, orders are sized with the best fresh ask price rather than the high of the bar. When an
+    OrderGateway is given, orders are submitted in the background with an id derived from the bar that triggered them.
+
+    The moving averages live in an IndicatorSet, which can be shared with the other strategies of the same symbol
+    (see StrategyRunner): each bar then updates them once and a single history fetch warms all of them up.
+    """
+
     def __init__(
         self,
         api: AlpacaAPI,
@@ -18,8 +51,19 @@ class CrossMovingAverage(Strategy):
         long_window: int = 50,
         crypto: bool = False,
         allowed_crypto_exchanges: list = None,
+        bar_interval: datetime.timedelta = datetime.timedelta(minutes=1),
+        async_api: AsyncAlpacaAPI = None,
+        portfolio: PortfolioCache = None,
+        market: ConflationBuffer = None,
+        indicators: IndicatorSet = None,
+        orders: OrderGateway = None,
     ):
         self.api = api
+        self.async_api = async_api
+        self.portfolio = portfolio
+        self.market = market
+        self.orders = orders
+        self.order_prefix = f"cma-{short_window}-{long_window}"
         self.symbol = symbol
         self.short_window = short_window
         self.long_window = long_window
@@ -31,45 +75,215 @@ class CrossMovingAverage(Strategy):
         self.stop_loss = -8
         self.take_profit = 8
 
+        self.bar_interval = bar_interval
+        self.indicators = indicators if indicators is not None else IndicatorSet()
+        self.short_ma = self.indicators.get(SimpleMovingAverage, short_window)
+        self.long_ma = self.indicators.get(SimpleMovingAverage, long_window)
+
     @property
-    def historical_data(self):
-        df = get_historical_data(
-            api=self.api,
-            symbol=self.symbol,
-            crypto=self.crypto,
-            df=True,
-            exchanges=self.allowed_crypto_exchanges,
-        )
-        df["short_ma"] = df["close"].rolling(self.short_window).mean()
-        df["long_ma"] = df["close"].rolling(self.long_window).mean()
-        return df
+    def synced(self) -> bool:
+        return self.indicators.synced
+
+    @property
+    def last_timestamps(self) -> dict:
+        return self.indicators.last_timestamps
+
+    def resync(self, bars: list[Bar] = None) -> None:
+        """
+        Rebuilds the moving averages from the historical bars
+        Args:
+            bars: The historical bars, fetched from the API when not given
+
+        Returns:
+            None
+        """
+        logger.info(f"Synchronizing moving averages for {self.symbol}")
+        self.indicators.reset()
+
+        if bars is None:
+            with tracer.span("historical_data"):
+                bars = get_historical_data(
+                    api=self.api,
+                    symbol=self.symbol,
+                    crypto=self.crypto,
+                    exchanges=self.allowed_crypto_exchanges,
+                )
+        for bar in bars:
+            self.update_indicators(bar)
+        self.indicators.synced = True
+
+    def warm_up(self) -> None:
+        """
+        Synchronizes the moving averages before the first bar, which then only has to fetch the position
+        """
+        if not self.synced:
+            self.resync()
+
+    def update_indicators(self, bar: Bar) -> bool:
+        """
+        Pushes the bar close into the moving averages, skipping bars that were already seen
+        Args:
+            bar: The bar to add
+
+        Returns:
+            Whether the bar was added
+        """
+        return self.indicators.update_bar(bar)
+
+    def is_gap(self, bar: Bar) -> bool:
+        return self.has_gap([bar])
 
     @property
     def position(self):
-        return get_position(self.api, self.symbol)
+        return get_position(self.portfolio or self.api, self.symbol)
+
+    def fetch_position(self, resync: bool = False):
+        """
+        Retrieves the position and, when needed, resynchronizes the moving averages
+        Args:
+            resync: Whether the moving averages have to be rebuilt from the history
+
+        Returns:
+            The current position
+        """
+        if self.async_api is None or self.portfolio is not None:
+            # A cached position is read from memory, there is nothing to fetch concurrently
+            if resync:
+                self.resync()
+            return self.position
+
+        coroutines = [get_position_async(self.async_api, self.symbol)]
+        if resync:
+            coroutines.append(
+                self.async_api.get_bars(
+                    symbol=self.symbol,
+                    crypto=self.crypto,
+                    exchanges=self.allowed_crypto_exchanges,
+                )
+            )
+        position, *history = self.async_api.gather(*coroutines)
+        if resync:
+            self.resync(history[0])
+        return position
+
+    def entry_price(self, bar: Bar) -> float:
+        """
+        Price used to size a buy order: the best fresh ask across the exchanges, the close of the bar when no quote is
+        fresh, the high of the bar without a ConflationBuffer
+        """
+        if self.market is None:
+            return bar.high
+        snapshot = self.market.get(self.symbol)
+        if snapshot is not None and snapshot.ask_price > 0:
+            return snapshot.ask_price
+        return bar.close
 
     def target_position(self, actual_price: float):
-        return get_target_position(self.api, actual_price)
+        return get_target_position(self.portfolio or self.api, actual_price)
 
-    def place_order(self, symbol: str, side: str, qty: int, type: str):
+    def place_order(
+        self, symbol: str, side: str, qty: int, type: str, key=None, trace=None
+    ):
         if not self.inhibit_trading:
+            if self.orders is not None:
+                return self.submit_order(symbol, side, qty, type, key, trace)
             logger.info(f"Placing order: {symbol=}, {side=}, {qty=}, {type=}")
-            order = self.api.place_order(symbol=symbol, side=side, type=type, qty=qty)
+            with tracer.span("place_order"):
+                order = self.api.place_order(
+                    symbol=symbol, side=side, type=type, qty=qty
+                )
             logger.info(f"Placed order: {order}")
             return order
         else:
             logger.info("Inhibit trading is enabled")
 
+    def submit_order(
+        self, symbol: str, side: str, qty: int, type: str, key, trace: dict = None
+    ):
+        """
+        Hands the order to the OrderGateway without waiting for the API
+        Args:
+            symbol: The symbol of the order
+            side: The side of the order
+            qty: The quantity of the order
+            type: The type of the order
+            key: The timestamp of the bar that triggered the order, a redelivered bar yields the same order id
+            trace: The latency trace of that bar
+
+        Returns:
+            The tracked order, None when an order of the same side is still open
+        """
+        if self.orders.open_orders(symbol, side):
+            logger.info(f"A {side} order for {symbol} is still open")
+            return None
+        order_id = client_order_id(symbol, side, key, prefix=self.order_prefix)
+        logger.info(f"Submitting order {order_id}: {symbol=}, {side=}, {qty=}, {type=}")
+        return self.orders.submit(
+            order_id, trace=trace, symbol=symbol, side=side, type=type, qty=qty
+        )
+
+    def signals(self, batch: BarBatch) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized crossover signals, used by the backtester: enter when the short average (rounded like in apply)
+        is above the long one, exit when it is below or equal. Both are False while the windows are not full.
+        """
+        short_sma = np.round(sma(batch.close, self.short_window), 2)
+        long_sma = np.round(sma(batch.close, self.long_window), 2)
+        with np.errstate(invalid="ignore"):
+            return short_sma > long_sma, short_sma <= long_sma
+
     def apply(self, bar: Bar):
-        if self.crypto and bar.exchange not in self.allowed_crypto_exchanges:
+        self.apply_batch([bar])
+
+    def apply_batch(self, bars: list[Bar]):
+        """
+        Pushes every bar into the moving averages, then evaluates the crossover once with the latest state
+        Args:
+            bars: The bars received since the last call
+
+        Returns:
+            None
+        """
+        if self.crypto:
+            bars = [
+                bar for bar in bars if bar.exchange in self.allowed_crypto_exchanges
+            ]
+        if not bars:
             return
 
-        position = self.position
+        latest = max(bars, key=lambda bar: to_datetime(bar.timestamp))
+        if self.portfolio is not None:
+            # The cached position is revalued with the latest price, as the REST API would
+            self.portfolio.mark(self.symbol, latest.close)
+        with tracer.span("fetch_position"):
+            position = self.fetch_position(resync=not self.synced or self.has_gap(bars))
+        for bar in bars:
+            self.update_indicators(bar)
+        self.evaluate(latest, position)
 
-        historical_df = self.historical_data
+    def has_gap(self, bars: list[Bar]) -> bool:
+        """
+        Whether a bar is missing before or between the bars (see is_gap)
+        """
+        interval = self.bar_interval // datetime.timedelta(microseconds=1) * 1000
+        last_timestamps = dict(self.last_timestamps)
+        for timestamp, bar in sorted(
+            ((to_nanoseconds(bar.timestamp), bar) for bar in bars),
+            key=lambda entry: entry[0],
+        ):
+            last_timestamp = last_timestamps.get(bar.exchange)
+            if last_timestamp is not None and timestamp - last_timestamp > interval:
+                return True
+            # An exchange without bars in the history starts with this one, it has not missed any
+            last_timestamps[bar.exchange] = max(timestamp, last_timestamp or timestamp)
+        return False
 
-        short_sma = round(historical_df.short_ma.iloc[-1], 2)
-        long_sma = round(historical_df.long_ma.iloc[-1], 2)
+    def evaluate(self, bar: Bar, position):
+        """
+        Places the orders dictated by the current moving averages, `bar` being the latest one
+        """
+        short_sma = round(self.short_ma.value, 2)
+        long_sma = round(self.long_ma.value, 2)
 
         logger.info(f"Short SMA: {short_sma}")
         logger.info(f"Long SMA: {long_sma}")
@@ -81,8 +295,10 @@ class CrossMovingAverage(Strategy):
                 self.place_order(
                     symbol=self.symbol,
                     side="buy",
-                    qty=self.target_position(bar.high),
+                    qty=self.target_position(self.entry_price(bar)),
                     type="market",
+                    key=bar.timestamp,
+                    trace=getattr(bar, "trace", None),
                 )
             else:
                 self.inhibit_trading = False
@@ -93,14 +309,23 @@ class CrossMovingAverage(Strategy):
             if short_sma <= long_sma:
                 # We crossed the MA, so we have to sell asap
                 self.place_order(
-                    symbol=bar.symbol, qty=position.qty, side="sell", type="market"
+                    symbol=bar.symbol,
+                    qty=position.qty,
+                    side="sell",
+                    type="market",
+                    key=bar.timestamp,
+                    trace=getattr(bar, "trace", None),
                 )
             else:
                 if profit_loss <= self.stop_loss or profit_loss >= self.take_profit:
                     self.place_order(
-                        symbol=bar.symbol, qty=position.qty, side="sell", type="market"
+                        symbol=bar.symbol,
+                        qty=position.qty,
+                        side="sell",
+                        type="market",
+                        key=bar.timestamp,
+                        trace=getattr(bar, "trace", None),
                     )
                     self.inhibit_trading = True
                 else:
                     logger.info(f"Actual Position: {position.unrealized_pl}$")
-
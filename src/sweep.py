@@ -0,0 +1,170 @@
+import itertools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from alpaca.entities import BarBatch
+from src.backtest import BacktestResult, equity_curve, load_bars_json, simulate
+from src.indicators import prefix_sums, sma_from_prefix_sums
+from src.settings import APP_NAME
+
+logger = logging.getLogger(APP_NAME)
+
+# Arrays of the bars being swept, attached once per worker process
+_shared = {}
+
+
+@dataclass(frozen=True)
+class SweepResult:
+    short_window: int
+    long_window: int
+    stop_loss: float
+    take_profit: float
+    pnl: float
+    max_drawdown: float
+    trades: int
+
+
+def _views(buffer, size: int) -> dict:
+    """
+    Layout of the shared block: close, high, prefix sums of the close (size + 1) and timestamps (int64)
+    """
+    data = np.ndarray((4 * size + 1,), dtype=np.float64, buffer=buffer)
+    return {
+        "close": data[:size],
+        "high": data[size : 2 * size],
+        "sums": data[2 * size : 3 * size + 1],
+        "timestamp": data[3 * size + 1 :].view(np.int64),
+    }
+
+
+def _attach(name: str, size: int, symbol: str, offset: float) -> None:
+    # Workers share the resource tracker of the parent process, which unlinks the block once the sweep is over
+    memory = SharedMemory(name=name)
+
+    views = _views(memory.buf, size)
+    _shared.update(views, memory=memory, offset=offset)
+    zeros = np.zeros(size, dtype=np.int64)
+    _shared["bars"] = BarBatch(
+        symbol,
+        views["timestamp"],
+        views["close"],
+        views["high"],
+        views["close"],
+        views["close"],
+        zeros,
+        zeros,
+        views["close"],
+        np.full(size, ""),
+    )
+
+
+def _evaluate(task: tuple) -> list[SweepResult]:
+    short_window, long_window, limits, cash = task
+    bars, sums, offset = _shared["bars"], _shared["sums"], _shared["offset"]
+
+    # Same signals as CrossMovingAverage.signals, each window costs O(n) thanks to the shared prefix sums
+    short_sma = np.round(sma_from_prefix_sums(sums, offset, short_window), 2)
+    long_sma = np.round(sma_from_prefix_sums(sums, offset, long_window), 2)
+    with np.errstate(invalid="ignore"):
+        entries, exits = short_sma > long_sma, short_sma <= long_sma
+
+    results = []
+    for stop_loss, take_profit in limits:
+        fills = simulate(bars, entries, exits, cash, stop_loss, take_profit)
+        result = BacktestResult(fills, equity_curve(bars.close, fills, cash), cash)
+        results.append(
+            SweepResult(
+                short_window,
+                long_window,
+                stop_loss,
+                take_profit,
+                result.pnl,
+                result.max_drawdown,
+                result.trades,
+            )
+        )
+    return results
+
+
+def sweep(
+    bars: BarBatch,
+    short_windows: list[int],
+    long_windows: list[int],
+    stop_losses: list[float] = (-8,),
+    take_profits: list[float] = (8,),
+    cash: float = 10000.0,
+    workers: int = None,
+) -> list[SweepResult]:
+    """
+    Backtests every combination of CrossMovingAverage parameters over the same bars (vectorized mode).
+
+    The prices and their prefix sums are written once to a shared memory block that the worker processes attach to,
+    instead of being pickled with every task. Each task evaluates one (short, long) window pair with every
+    stop loss and take profit.
+    Args:
+        bars: The bars to backtest, of a single symbol and exchange
+        short_windows: The short windows to try
+        long_windows: The long windows to try (combinations with short >= long are skipped)
+        stop_losses: The stop losses to try (None disables it)
+        take_profits: The take profits to try (None disables it)
+        cash: Initial cash
+        workers: Number of processes, defaults to the number of CPUs
+
+    Returns:
+        The results, ranked by P/L (best first)
+    """
+    size = len(bars)
+    sums, offset = prefix_sums(bars.close)
+    limits = list(itertools.product(stop_losses, take_profits))
+    tasks = [
+        (short_window, long_window, limits, cash)
+        for short_window, long_window in itertools.product(short_windows, long_windows)
+        if short_window < long_window
+    ]
+
+    memory = SharedMemory(create=True, size=max(1, (4 * size + 1) * 8))
+    try:
+        views = _views(memory.buf, size)
+        views["close"][:] = bars.close
+        views["high"][:] = bars.high
+        views["sums"][:] = sums
+        views["timestamp"][:] = bars.timestamp
+        del views
+
+        workers = workers or os.cpu_count()
+        logger.info(
+            f"Sweeping {len(tasks) * len(limits)} combinations over {size} bars ({workers} workers)"
+        )
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_attach,
+            initargs=(memory.name, size, bars.symbol, offset),
+        ) as executor:
+            chunksize = max(1, len(tasks) // (workers * 4))
+            results = list(
+                itertools.chain.from_iterable(
+                    executor.map(_evaluate, tasks, chunksize=chunksize)
+                )
+            )
+    finally:
+        memory.close()
+        memory.unlink()
+
+    return sorted(results, key=lambda result: result.pnl, reverse=True)
+
+
+if __name__ == "__main__":
+    results = sweep(
+        load_bars_json(exchange="CBSE"),
+        short_windows=list(range(2, 30)),
+        long_windows=list(range(10, 80, 2)),
+        stop_losses=[-4, -8, -16, None],
+        take_profits=[4, 8, 16, None],
+    )
+    for result in results[:20]:
+        print(result)
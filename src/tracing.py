@@ -0,0 +1,196 @@
+import contextlib
+import threading
+import time
+from typing import Callable
+
+from alpaca.timestamps import to_nanoseconds
+from src.settings import TRACING
+
+# Stages an entity goes through, in order
+RECEIVE = "receive"
+ENQUEUE = "enqueue"
+DEQUEUE = "dequeue"
+STRATEGY_START = "strategy_start"
+STRATEGY_END = "strategy_end"
+ORDER_SUBMIT = "order_submit"
+ORDER_ACK = "order_ack"
+# The exchange timestamp of the entity, the origin of every trace
+EXCHANGE = "exchange"
+
+
+class LatencyHistogram:
+    """
+    Latency histogram with HDR-style log-linear buckets: every power of two is split in `sub_buckets / 2` buckets,
+    so that values are recorded with a relative error below 1 / sub_buckets whatever their magnitude, in constant
+    memory and time.
+
+    Values are recorded in nanoseconds, with a resolution of `unit` nanoseconds.
+
+    Attributes:
+        unit (int): Nanoseconds per histogram unit.
+        count (int): Number of recorded values.
+        min (int): Lowest recorded value.
+        max (int): Highest recorded value.
+        total (int): Sum of the recorded values.
+
+    """
+
+    def __init__(self, unit: int = 1000, sub_buckets: int = 256):
+        self.unit = unit
+        self.sub_bucket_bits = (sub_buckets - 1).bit_length()
+        self.sub_bucket_half = 1 << (self.sub_bucket_bits - 1)
+        self.counts = [0] * (2 * self.sub_bucket_half)
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def bucket(self, value: int) -> int:
+        shift = max(0, value.bit_length() - self.sub_bucket_bits)
+        return shift * self.sub_bucket_half + (value >> shift)
+
+    def bucket_value(self, index: int) -> int:
+        """
+        Highest value (in units) of a bucket
+        """
+        shift = max(0, index // self.sub_bucket_half - 1)
+        return ((index - shift * self.sub_bucket_half + 1) << shift) - 1
+
+    def record(self, nanoseconds: int) -> None:
+        nanoseconds = max(0, int(nanoseconds))
+        index = self.bucket(nanoseconds // self.unit)
+        with self.lock:
+            if index >= len(self.counts):
+                self.counts.extend([0] * (index + 1 - len(self.counts)))
+            self.counts[index] += 1
+            self.count += 1
+            self.total += nanoseconds
+            self.min = nanoseconds if self.min is None else min(self.min, nanoseconds)
+            self.max = nanoseconds if self.max is None else max(self.max, nanoseconds)
+
+    def percentile(self, percentile: float) -> int:
+        """
+        Value below which the given percentage of the recorded values fall, in nanoseconds
+        """
+        with self.lock:
+            if not self.count:
+                return 0
+            rank = max(1, round(self.count * percentile / 100))
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank:
+                    value = (self.bucket_value(index) + 1) * self.unit - 1
+                    return min(value, self.max)
+            return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def snapshot(self) -> dict:
+        """
+        Returns the count and the main percentiles in milliseconds
+        """
+        return {
+            "count": self.count,
+            "min": (self.min or 0) / 1e6,
+            "mean": self.mean / 1e6,
+            "p50": self.percentile(50) / 1e6,
+            "p90": self.percentile(90) / 1e6,
+            "p99": self.percentile(99) / 1e6,
+            "p99.9": self.percentile(99.9) / 1e6,
+            "max": (self.max or 0) / 1e6,
+        }
+
+
+class Tracer:
+    """
+    Records how long entities spend between the stages of the pipeline.
+
+    `stamp` records the wall clock time a stage is reached in the `trace` of the entity (a dict, created on the first
+    stamp from the exchange timestamp of the entity). Each stamp feeds two histograms: the time since the previous
+    stage ("dequeue->strategy_start") and the time since the exchange timestamp ("exchange->strategy_start"). Bars
+    are timestamped at their start, so exchange latencies of bars include the bar duration. `span` times a block of
+    code, e.g. a REST call made by a strategy.
+
+    Attributes:
+        enabled (bool): Whether anything is recorded.
+        histograms (dict): The histograms by name.
+
+    """
+
+    def __init__(self, enabled: bool = True, clock: Callable[[], int] = time.time_ns):
+        self.enabled = enabled
+        self.clock = clock
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def record(self, name: str, nanoseconds: int) -> None:
+        if self.enabled:
+            self.histogram(name).record(nanoseconds)
+
+    def stamp(self, entity, stage: str, trace: dict = None) -> None:
+        """
+        Records that the entity reached a stage
+        Args:
+            entity: An entity with a `trace` attribute (see BaseEntity), or a TrackedOrder
+            stage: The stage reached
+            trace: The trace to continue when the entity has none yet, e.g. the trace of the bar an order comes from
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        now = self.clock()
+        current = getattr(entity, "trace", None)
+        if current is None:
+            current = dict(trace) if trace else {}
+            if EXCHANGE not in current and getattr(entity, "timestamp", None):
+                current[EXCHANGE] = to_nanoseconds(entity.timestamp)
+            entity.trace = current
+
+        previous = current.get("last")
+        if previous is not None:
+            self.record(f"{previous}->{stage}", now - current[previous])
+        if EXCHANGE in current:
+            self.record(f"{EXCHANGE}->{stage}", now - current[EXCHANGE])
+        current[stage] = now
+        current["last"] = stage
+
+    def stamp_all(self, entities, stage: str) -> None:
+        if self.enabled:
+            for entity in entities:
+                self.stamp(entity, stage)
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        """
+        Times the enclosed block
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter_ns() - start)
+
+    def snapshot(self) -> dict:
+        return {
+            name: histogram.snapshot()
+            for name, histogram in sorted(list(self.histograms.items()))
+        }
+
+
+tracer = Tracer(enabled=TRACING)
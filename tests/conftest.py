@@ -0,0 +1,20 @@
+import logging
+import os
+
+import pytest
+
+# src.settings requires the Alpaca credentials to be defined
+os.environ.setdefault("APCA_API_KEY_ID", "test")
+os.environ.setdefault("APCA_API_SECRET_KEY", "test")
+
+
+@pytest.fixture
+def quiet_strategy_logs():
+    # Strategies log every bar, which slows down the tests running thousands of them
+    from src.settings import APP_NAME
+
+    logger = logging.getLogger(APP_NAME)
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    yield
+    logger.setLevel(level)
@@ -0,0 +1,97 @@
+import datetime
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from alpaca.entities import Bar, BarBatch
+
+START = datetime.datetime(2021, 12, 8, 10, 0, tzinfo=datetime.timezone.utc)
+
+
+class Clock:
+    """
+    Clock of the components taking a `clock`, moved by setting `now`
+    """
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def minutes(value: int) -> datetime.datetime:
+    return START + datetime.timedelta(minutes=value)
+
+
+def make_bar(
+    symbol: str = "BTCUSD", close: float = 100.0, minute: int = None, exchange=""
+) -> Bar:
+    """
+    Bar of the given minute after START, the close (as an integer) by default
+    """
+    minute = int(close) if minute is None else minute
+    return Bar(
+        symbol, minutes(minute), close, close, close, close, 1, 1, close, exchange
+    )
+
+
+def random_walk(size: int, seed: int = 7) -> BarBatch:
+    generator = np.random.default_rng(seed)
+    close = 100 + np.cumsum(generator.normal(0, 0.4, size))
+    high = close + generator.uniform(0, 0.3, size)
+    start = np.datetime64("2021-12-08T10:00:00", "ns").astype(np.int64)
+    return BarBatch(
+        symbol="AAPL",
+        timestamp=start + np.arange(size) * 60 * 10**9,
+        open=close,
+        high=high,
+        low=close - 0.3,
+        close=close,
+        volume=np.ones(size),
+        num_trades=np.ones(size),
+        vwap=close,
+    )
+
+
+def load_bars(exchange="CBSE"):
+    bars = []
+    for entry in json.load(open("data/bars.json")):
+        if entry["exchange"] != exchange:
+            continue
+        bars.append(
+            Bar(
+                symbol=entry["symbol"],
+                t=pd.Timestamp(entry["timestamp"]).to_pydatetime(),
+                o=entry["open"],
+                h=entry["high"],
+                l=entry["low"],
+                c=entry["close"],
+                v=entry["volume"],
+                n=entry["num_trades"],
+                vw=entry["vwap"],
+                x=entry["exchange"],
+            )
+        )
+    return bars
+
+
+class FakeAPI:
+    def __init__(self, bars):
+        self.bars = bars
+        self.visible = 0
+        self.history_calls = 0
+        self.orders = []
+        self.account = SimpleNamespace(cash="10000")
+
+    def get_bars(self, symbol, timeframe="1Min", exchanges=None, crypto=False, **_):
+        self.history_calls += 1
+        return self.bars[: self.visible]
+
+    def get_positions(self, symbol=None):
+        return None
+
+    def place_order(self, **kwargs):
+        self.orders.append(kwargs)
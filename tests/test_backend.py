@@ -0,0 +1,49 @@
+import numpy as np
+
+from backend import BarIndex, bar_records, ndjson
+from src.backtest import load_bars_json
+
+START = "2021-12-08T10:40:00Z"
+
+
+def test_pages_follow_the_tokens():
+    index = BarIndex([load_bars_json()])
+    symbol = next(iter(index.series))
+    total = len(index.query(symbol)[0])
+
+    timestamps, token = [], None
+    while True:
+        batch, token = index.query(symbol, limit=100, page_token=token)
+        timestamps.extend(batch.timestamp)
+        if token is None:
+            break
+    assert len(timestamps) == total
+    assert timestamps == sorted(timestamps)
+
+
+def test_query_by_time_range_and_exchange():
+    bars = load_bars_json(exchange="CBSE")
+    index = BarIndex([load_bars_json()])
+
+    batch, token = index.query(
+        bars.symbol, START, "2021-12-08T10:49:00Z", exchanges=["CBSE"]
+    )
+    expected = bars.timestamp[bars.timestamp <= bars.timestamp[0] + 9 * 60 * 10**9]
+    assert token is None
+    assert np.array_equal(batch.timestamp, expected)
+    assert set(batch.exchange) == {"CBSE"}
+
+    batch, token = index.query(bars.symbol, exchanges=["CBSE", "FTX"], limit=3)
+    assert list(batch.exchange) == ["CBSE", "FTX", "CBSE"]
+    assert len(index.query("ETHUSD")[0]) == 0
+
+
+def test_records_match_the_data_api():
+    index = BarIndex([load_bars_json(exchange="CBSE")])
+    batch, _ = index.query("BTCUSD", limit=2)
+    records = list(bar_records(batch))
+    assert records[0]["t"] == START
+    assert set(records[0]) == {"t", "o", "h", "l", "c", "v", "n", "vw", "x"}
+
+    lines = "".join(ndjson(iter(records), chunk_size=1)).splitlines()
+    assert len(lines) == 2
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from src.backtest import Backtester, load_bars_json
+from src.strategies import CrossMovingAverage
+from tests.helpers import random_walk
+
+pytestmark = pytest.mark.usefixtures("quiet_strategy_logs")
+
+
+def assert_same_results(backtester: Backtester):
+    events = backtester.run()
+    vectorized = backtester.run_vectorized()
+
+    assert events.fills == vectorized.fills
+    assert np.array_equal(events.equity, vectorized.equity)
+    return vectorized
+
+
+def test_event_driven_and_vectorized_modes_match_on_recorded_bars():
+    bars = load_bars_json(exchange="CBSE")
+    backtester = Backtester(
+        lambda api: CrossMovingAverage(
+            api, bars.symbol, short_window=5, long_window=20
+        ),
+        bars,
+    )
+    result = assert_same_results(backtester)
+    assert result.trades > 0
+
+
+def test_event_driven_and_vectorized_modes_match_with_stop_loss_and_take_profit():
+    bars = random_walk(3000)
+
+    def factory(api):
+        strategy = CrossMovingAverage(api, "AAPL", short_window=10, long_window=30)
+        strategy.stop_loss, strategy.take_profit = -40, 60
+        return strategy
+
+    result = assert_same_results(Backtester(factory, bars))
+    assert result.trades > 5
+    assert result.max_drawdown >= 0
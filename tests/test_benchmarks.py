@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from benchmarks.cases import cases
+from benchmarks.runner import (
+    baseline,
+    compare,
+    environment,
+    load_history,
+    measure,
+    save,
+)
+
+
+@pytest.mark.parametrize("name", list(cases))
+def test_benchmark_cases_run(name):
+    run, operations = cases[name]()
+    result = measure(run, operations, repeat=1, min_time=0)
+
+    assert operations > 0
+    assert result["median_ns"] > 0
+
+
+def test_regressions_are_detected_against_the_tracked_results(tmp_path):
+    path = tmp_path / "results.jsonl"
+    for median in (100, 110, 1000, 90, 105):
+        save({"case": {"median_ns": median, "min_ns": median, "operations": 1}}, path)
+    history = load_history(path)
+
+    # A single outlier does not move the reference
+    assert baseline(history) == {"case": 105}
+    changes, regressed = compare(
+        {"case": {"median_ns": 150}, "new": {"median_ns": 1}}, baseline(history), 0.5
+    )
+    assert not regressed
+    assert changes["new"] is None
+    _, regressed = compare({"case": {"median_ns": 170}}, baseline(history), 0.5)
+    assert regressed
+
+
+def test_only_results_of_the_same_environment_are_compared(tmp_path):
+    path = tmp_path / "results.jsonl"
+    save({"case": {"median_ns": 100, "min_ns": 100, "operations": 1}}, path)
+    history = load_history(path)
+    history.append(
+        {**history[0], "machine": "Other", "results": {"case": {"median_ns": 1}}}
+    )
+
+    assert baseline(history, environment=environment()) == {"case": 100}
+    assert baseline(history, environment={**environment(), "python": "2.7"}) == {}
+    changes, regressed = compare({"case": {"median_ns": 1000}}, {}, 0.5)
+    assert changes == {"case": None}
+    assert not regressed
+
+
+def test_sampling_profiler_times_other_threads(tmp_path):
+    import threading
+
+    from src.profiling import SamplingProfiler
+
+    def busy(stop):
+        while not stop.is_set():
+            sum(range(1000))
+
+    stop = threading.Event()
+    thread = threading.Thread(name="Busy", target=busy, args=(stop,))
+    thread.start()
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    time.sleep(0.2)
+    profiler.stop()
+    stop.set()
+    thread.join()
+
+    assert profiler.samples > 0
+    assert any(name == "busy" for _, _, name in profiler.total_times)
+    profiler.dump(tmp_path / "profile.txt")
+    assert "busy" in (tmp_path / "profile.txt").read_text()
+    assert any(line.startswith("Busy;") for line in open(tmp_path / "profile.folded"))
@@ -0,0 +1,24 @@
+from alpaca.cache import MISSING, TTLCache
+from tests.helpers import Clock
+
+
+def test_entries_expire_and_least_recently_used_are_evicted():
+    clock = Clock()
+    cache = TTLCache(maxsize=2, ttl=5, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", None)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    # "b" was the least recently used
+    assert cache.get("b") is MISSING
+    assert cache.get("c") == 3
+
+    clock.now = 5.0
+    assert cache.get("a") is MISSING
+    assert len(cache) == 1
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    cache.set("d", 4)
+    cache.invalidate(lambda key: key == "d")
+    assert cache.get("d") is MISSING
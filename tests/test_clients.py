@@ -0,0 +1,237 @@
+import dataclasses
+import datetime
+import subprocess
+import sys
+from unittest import mock
+
+import pandas as pd
+
+from alpaca.cache import MISSING
+from alpaca.clients import AlpacaAPI, align_time_range, split_time_range
+from alpaca.entities import Account, Order
+
+START = datetime.datetime(2021, 12, 8, tzinfo=datetime.timezone.utc)
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    """
+    Serves one bar per minute between the requested start and end, `limit` bars per page
+    """
+
+    def __init__(self):
+        self.headers = {}
+        self.requests = []
+
+    def mount(self, *args, **kwargs):
+        pass
+
+    def get(self, url, params=None):
+        if url.endswith("/account"):
+            return FakeResponse(
+                {field.name: None for field in dataclasses.fields(Account)}
+            )
+
+        self.requests.append(params)
+        start, end = pd.Timestamp(params["start"]), pd.Timestamp(params["end"])
+        timestamps = pd.date_range(start.ceil("1min"), end, freq="1min")
+        offset = int(params.get("page_token") or 0)
+        page = timestamps[offset : offset + params["limit"]]
+        bars = [
+            {
+                "t": timestamp.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "o": 1.0,
+                "h": 1.0,
+                "l": 1.0,
+                "c": 1.0,
+                "v": 1,
+                "n": 1,
+                "vw": 1.0,
+            }
+            for timestamp in page
+        ]
+        next_page_token = (
+            str(offset + params["limit"])
+            if offset + params["limit"] < len(timestamps)
+            else None
+        )
+        return FakeResponse({"bars": bars, "next_page_token": next_page_token})
+
+
+def make_api() -> AlpacaAPI:
+    with mock.patch("alpaca.clients.requests.Session", FakeSession):
+        return AlpacaAPI(key_id="test", secret_key="test")
+
+
+def test_account_is_fetched_on_first_use():
+    account = {field.name: None for field in dataclasses.fields(Account)}
+    with mock.patch.object(AlpacaAPI, "get_account", return_value=account) as fetch:
+        api = make_api()
+        fetch.assert_not_called()
+        future = api.prefetch_account()
+
+        assert api.account is future.result()
+        assert api.account is api.account
+        assert fetch.call_count == 1
+
+
+def test_alpaca_package_does_not_import_pandas():
+    script = (
+        "import sys, alpaca.clients, alpaca.columnar; "
+        "print(sorted({'pandas', 'aiohttp', 'pytz'} & set(sys.modules)))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    assert output.stdout.strip() == "[]"
+
+
+def test_get_bars_follows_page_tokens():
+    api = make_api()
+    bars = api.get_bars(
+        "AAPL", start=START, end=START + datetime.timedelta(minutes=2499), limit=1000
+    )
+
+    assert len(bars) == 2500
+    assert len(api.session.requests) == 3
+    assert pd.Timestamp(bars[-1].timestamp) == START + datetime.timedelta(minutes=2499)
+
+
+def test_get_bars_fetches_chunks_concurrently_in_order():
+    api = make_api()
+    bars = api.get_bars(
+        "AAPL",
+        start=START,
+        end=START + datetime.timedelta(days=3),
+        limit=1000,
+        chunk_size=datetime.timedelta(days=1),
+    )
+
+    timestamps = [pd.Timestamp(bar.timestamp) for bar in bars]
+    assert len(timestamps) == 3 * 24 * 60 + 1
+    assert timestamps == sorted(set(timestamps))
+
+
+def test_repeated_get_bars_are_served_from_the_cache():
+    api = make_api()
+    end = START + datetime.timedelta(minutes=59, seconds=30)
+    first = api.get_bars("AAPL", start=START, end=end)
+    # The window moved by a few seconds, but it covers the same bars
+    second = api.get_bars(
+        "AAPL",
+        start=START - datetime.timedelta(seconds=10),
+        end=end + datetime.timedelta(seconds=10),
+    )
+
+    assert len(api.session.requests) == 1
+    assert [bar.timestamp for bar in first] == [bar.timestamp for bar in second]
+    assert first is not second
+    assert api.cache.hits == 1
+
+    api.invalidate_cache("bars")
+    api.get_bars("AAPL", start=START, end=end)
+    assert len(api.session.requests) == 2
+
+
+def test_async_orders_invalidate_the_memoized_positions():
+    from alpaca.clients import AsyncAlpacaAPI
+
+    api = make_api()
+    async_api = AsyncAlpacaAPI(key_id="test", secret_key="test", cache=api.cache)
+    api.cache.set(("positions", None, "v2"), [])
+    order = {field.name: None for field in dataclasses.fields(Order)}
+
+    with mock.patch.object(async_api, "_request", mock.AsyncMock(return_value=order)):
+        async_api.run(async_api.place_order("AAPL", qty=1, client_order_id="id"))
+    assert api.cache.get(("positions", None, "v2")) is MISSING
+
+
+def test_align_time_range():
+    start, end = align_time_range(
+        START + datetime.timedelta(seconds=1),
+        START + datetime.timedelta(minutes=10, seconds=59),
+        "5Min",
+    )
+    assert start == START + datetime.timedelta(minutes=5)
+    assert end == START + datetime.timedelta(minutes=10)
+    # Daily bars are not aligned on UTC days
+    assert align_time_range(start, end, "1Day") == (start, end)
+
+
+def test_split_time_range():
+    chunks = list(
+        split_time_range(
+            START, START + datetime.timedelta(hours=5), datetime.timedelta(hours=2)
+        )
+    )
+    assert len(chunks) == 3
+    assert chunks[0][0] == START
+    assert chunks[-1][1] == START + datetime.timedelta(hours=5)
+    assert chunks[1][0] - chunks[0][1] == datetime.timedelta(microseconds=1)
+
+
+def test_async_client_gathers_requests():
+    from aiohttp import web
+
+    from alpaca.clients import AsyncAlpacaAPI
+
+    async def missing_position(request):
+        return web.json_response({"message": "position does not exist"}, status=404)
+
+    async def bars(request):
+        if request.query.get("page_token"):
+            return web.json_response({"bars": [BAR], "next_page_token": None})
+        return web.json_response({"bars": [BAR, BAR], "next_page_token": "next"})
+
+    BAR = {
+        "t": "2021-12-08T10:40:00Z",
+        "o": 1.0,
+        "h": 1.0,
+        "l": 1.0,
+        "c": 1.0,
+        "v": 1,
+        "n": 1,
+        "vw": 1.0,
+    }
+
+    api = AsyncAlpacaAPI(key_id="test", secret_key="test")
+
+    async def start_server():
+        app = web.Application()
+        app.router.add_get("/v2/positions/{symbol}", missing_position)
+        app.router.add_get("/v2/stocks/{symbol}/bars", bars)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        return runner, site._server.sockets[0].getsockname()[1]
+
+    runner, port = api.run(start_server())
+    api.base_url = api.data_url = f"http://127.0.0.1:{port}"
+    try:
+        position, history = api.gather(api.get_positions("AAPL"), api.get_bars("AAPL"))
+        assert position is None
+        assert len(history) == 3
+    finally:
+        api.run(api.close())
+        api.run(runner.cleanup())
+
+
+def test_get_bar_batch_parses_pages_into_columns():
+    api = make_api()
+    batch = api.get_bar_batch(
+        "AAPL", start=START, end=START + datetime.timedelta(minutes=1499), limit=1000
+    )
+
+    assert len(batch) == 1500
+    assert (
+        batch.timestamp[-1]
+        == pd.Timestamp(START + datetime.timedelta(minutes=1499)).value
+    )
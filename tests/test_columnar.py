@@ -0,0 +1,71 @@
+import datetime
+import json
+
+import numpy as np
+
+from alpaca.columnar import BarArchive, convert_json
+from alpaca.entities import BarBatch
+
+START = datetime.datetime(2021, 12, 8, 23, 58, tzinfo=datetime.timezone.utc)
+
+
+def make_batch(minutes: range, close: float = 1.0, exchange: str = "CBSE"):
+    timestamps = [
+        int((START + datetime.timedelta(minutes=minute)).timestamp()) * 10**9
+        for minute in minutes
+    ]
+    n = len(timestamps)
+    return BarBatch(
+        "BTC/USD",
+        timestamps,
+        *([close] * n for _ in range(5)),
+        [1] * n,
+        [close] * n,
+        exchange=[exchange] * n,
+    )
+
+
+def test_bars_are_partitioned_by_day_and_read_back(tmp_path):
+    archive = BarArchive(tmp_path)
+    assert archive.write(make_batch(range(4))) == 2
+
+    assert archive.symbols() == ["BTC-USD"]
+    assert [day.day for day in archive.days("BTC/USD")] == [8, 9]
+
+    batch = archive.read("BTC/USD")
+    assert len(batch) == 4
+    assert list(batch.exchange) == ["CBSE"] * 4
+    assert np.all(np.diff(batch.timestamp) > 0)
+
+    # Both bounds are inclusive
+    batch = archive.read(
+        "BTC/USD",
+        START + datetime.timedelta(minutes=1),
+        START + datetime.timedelta(minutes=2),
+    )
+    assert len(batch) == 2
+    assert batch[0].timestamp == START + datetime.timedelta(minutes=1)
+
+
+def test_writes_are_merged_and_replace_the_same_bars(tmp_path):
+    archive = BarArchive(tmp_path)
+    archive.write(make_batch(range(2)))
+    archive.write(make_batch(range(1), close=2.0))
+    archive.write(make_batch(range(1), exchange="FTX"))
+
+    batch = archive.read("BTC/USD")
+    assert list(batch.close) == [2.0, 1.0, 1.0]
+    assert list(batch.exchange) == ["CBSE", "FTX", "CBSE"]
+    assert len(archive.read("BTC/USD", exchange="FTX")) == 1
+    assert len(archive.read("ETH/USD")) == 0
+
+
+def test_convert_json(tmp_path):
+    path = tmp_path / "bars.json"
+    batch = make_batch(range(3))
+    json.dump([bar.to_dict() for bar in batch], open(path, "w"), default=str)
+
+    assert convert_json(path, BarArchive(tmp_path / "bars")) == 3
+    converted = BarArchive(tmp_path / "bars").read("BTC/USD")
+    assert np.array_equal(converted.timestamp, batch.timestamp)
+    assert np.array_equal(converted.close, batch.close)
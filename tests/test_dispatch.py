@@ -0,0 +1,162 @@
+import threading
+import time
+from queue import Queue
+
+from src.base import Strategy
+from src.clients import SubscriberClient
+from src.queues import MarketDataQueue
+from tests.helpers import make_bar
+
+
+class BatchRecordingStrategy(Strategy):
+    def __init__(self):
+        self.batches = []
+
+    def apply(self, bar):
+        raise AssertionError("Bars must be applied in batches")
+
+    def apply_batch(self, bars):
+        self.batches.append([bar.close for bar in bars])
+
+
+class RecordingStrategy(Strategy):
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.closes = []
+        self.threads = set()
+
+    def apply(self, bar):
+        time.sleep(self.delay)
+        self.closes.append(bar.close)
+        self.threads.add(threading.current_thread().name)
+
+
+def test_messages_are_sharded_by_symbol_and_kept_in_order():
+    queue = Queue()
+    strategies = {symbol: RecordingStrategy() for symbol in ("AAPL", "MSFT", "TSLA")}
+    subscriber = SubscriberClient(
+        api=None, strategies=strategies, queue=queue, workers=3
+    )
+    subscriber.start()
+
+    for close in range(100):
+        for symbol in strategies:
+            queue.put(make_bar(symbol, close))
+    queue.join()
+    for shard in subscriber.shards:
+        shard.join()
+
+    for strategy in strategies.values():
+        assert strategy.closes == list(range(100))
+        assert len(strategy.threads) == 1
+
+
+def test_slow_symbol_does_not_stall_the_others():
+    queue = Queue()
+    slow, fast = RecordingStrategy(delay=0.5), RecordingStrategy()
+    subscriber = SubscriberClient(
+        api=None, strategies={"SLOW": slow, "FAST": fast}, queue=queue, workers=2
+    )
+    # Make sure the two symbols land on different shards
+    assert subscriber.shard("SLOW") is not subscriber.shard("FAST")
+    subscriber.start()
+
+    queue.put(make_bar("SLOW", 1))
+    for close in range(10):
+        queue.put(make_bar("FAST", close))
+
+    deadline = time.time() + 0.4
+    while len(fast.closes) < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    assert fast.closes == list(range(10))
+    assert slow.closes == []
+
+
+def test_shards_apply_the_queue_policy():
+    queue = MarketDataQueue(maxsize=2, policy="drop_oldest")
+    slow, fast = RecordingStrategy(delay=0.02), RecordingStrategy()
+    subscriber = SubscriberClient(
+        api=None, strategies={"SLOW": slow, "FAST": fast}, queue=queue, workers=2
+    )
+    assert all(shard.maxsize == 2 for shard in subscriber.shards)
+    subscriber.start()
+    # Waits for the Router, messages would otherwise be dropped by the queue itself
+    queue.put(make_bar("FAST", 0))
+    queue.join()
+
+    for close in range(20):
+        queue.put(make_bar("SLOW", close))
+        # Lets the Router keep up, so that the slow shard is the one overflowing
+        time.sleep(0.001)
+    queue.join()
+    for shard in subscriber.shards:
+        shard.join()
+
+    snapshot = subscriber.snapshot()
+    assert snapshot["dropped"] > 0
+    assert snapshot["dropped"] == sum(shard["dropped"] for shard in snapshot["shards"])
+    assert len(slow.closes) == 20 - snapshot["dropped"]
+    assert slow.closes[-1] == 19
+
+
+def test_backlog_is_collapsed_and_applied_in_one_batch():
+    queue = Queue()
+    strategies = {"AAPL": BatchRecordingStrategy(), "MSFT": BatchRecordingStrategy()}
+    subscriber = SubscriberClient(
+        api=None, strategies=strategies, queue=queue, workers=1, batch_size=100
+    )
+
+    for minute in range(10):
+        for symbol in strategies:
+            queue.put(make_bar(symbol, minute, minute))
+    # Updated versions of minutes 8 and 9 supersede the ones already queued
+    queue.put(make_bar("AAPL", 18, 8))
+    queue.put(make_bar("AAPL", 19, 9))
+    subscriber.start()
+    queue.join()
+
+    assert strategies["AAPL"].batches == [[0, 1, 2, 3, 4, 5, 6, 7, 18, 19]]
+    assert strategies["MSFT"].batches == [list(range(10))]
+
+
+def test_batch_size_limits_the_batches():
+    queue = Queue()
+    strategy = BatchRecordingStrategy()
+    subscriber = SubscriberClient(
+        api=None, strategies={"AAPL": strategy}, queue=queue, workers=1, batch_size=4
+    )
+    for minute in range(10):
+        queue.put(make_bar("AAPL", minute))
+    subscriber.start()
+    queue.join()
+
+    assert strategy.batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_strategies_are_warmed_up_concurrently_before_dispatching():
+    class WarmingStrategy(RecordingStrategy):
+        def warm_up(self):
+            time.sleep(0.2)
+            self.warm = True
+
+        def apply(self, bar):
+            assert self.warm
+            super().apply(bar)
+
+    queue = Queue()
+    strategies = {symbol: WarmingStrategy() for symbol in ("AAPL", "MSFT")}
+    subscriber = SubscriberClient(
+        api=None, strategies=strategies, queue=queue, workers=2
+    )
+    start = time.monotonic()
+    subscriber.start()
+    # Bars received while warming up wait in the queue
+    for symbol in strategies:
+        queue.put(make_bar(symbol, 1))
+    queue.join()
+    for shard in subscriber.shards:
+        shard.join()
+
+    assert time.monotonic() - start < 0.35
+    for strategy in strategies.values():
+        assert strategy.closes == [1]
@@ -0,0 +1,75 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from alpaca.entities import Bar, BarBatch
+
+RECORDS = [
+    {
+        "t": f"2021-12-08T10:{minute:02d}:00Z",
+        "o": 100.0 + minute,
+        "h": 101.0 + minute,
+        "l": 99.0 + minute,
+        "c": 100.5 + minute,
+        "v": 2.5,
+        "n": 10 + minute,
+        "vw": 100.2 + minute,
+        "x": "CBSE",
+    }
+    for minute in range(5)
+]
+
+
+def test_bar_has_no_instance_dict():
+    bar = Bar("BTCUSD", "2021-12-08T10:40:00Z", 1, 2, 0.5, 1.5, 3, 4, 1.2, "CBSE")
+
+    assert not hasattr(bar, "__dict__")
+    assert bar.to_dict() == {
+        "type": "bar",
+        "symbol": "BTCUSD",
+        "timestamp": "2021-12-08T10:40:00Z",
+        "open": 1,
+        "high": 2,
+        "low": 0.5,
+        "close": 1.5,
+        "volume": 3,
+        "num_trades": 4,
+        "vwap": 1.2,
+        "exchange": "CBSE",
+    }
+    with pytest.raises(AttributeError):
+        bar.unknown = 1
+
+
+def test_bar_batch_from_records():
+    batch = BarBatch.from_records(RECORDS, "BTCUSD")
+
+    assert len(batch) == 5
+    assert batch.timestamp.dtype == np.int64
+    assert batch.timestamp[1] - batch.timestamp[0] == 60 * 10**9
+    assert batch.close.tolist() == [record["c"] for record in RECORDS]
+
+    bar = batch[2]
+    assert bar.timestamp == datetime.datetime(
+        2021, 12, 8, 10, 2, tzinfo=datetime.timezone.utc
+    )
+    assert bar.exchange == "CBSE"
+    assert len(batch[1:3]) == 2
+
+
+def test_bar_batch_to_df_does_not_copy():
+    batch = BarBatch.from_records(RECORDS, "BTCUSD")
+    df = Bar.to_df(batch)
+
+    assert np.shares_memory(df["close"].to_numpy(), batch.close)
+    assert df["timestamp"].iloc[0].minute == 0
+    assert df["vwap"].tolist() == batch.vwap.tolist()
+
+
+def test_bar_batch_round_trip_with_bars():
+    batch = BarBatch.from_records(RECORDS, "BTCUSD")
+    rebuilt = BarBatch.from_bars(list(batch))
+
+    assert rebuilt.timestamp.tolist() == batch.timestamp.tolist()
+    assert BarBatch.concat([batch, rebuilt]).close.size == 10
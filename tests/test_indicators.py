@@ -0,0 +1,152 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.indicators import (
+    AverageTrueRange,
+    BollingerBands,
+    ExponentialMovingAverage,
+    RelativeStrengthIndex,
+    RollingStandardDeviation,
+    SimpleMovingAverage,
+    VolumeWeightedAveragePrice,
+    atr,
+    bollinger_bands,
+    ema,
+    rolling_std,
+    rsi,
+    sma,
+    vwap,
+)
+
+
+def test_simple_moving_average_matches_pandas():
+    closes = [100 + (i % 7) * 0.37 - (i % 3) * 1.1 for i in range(300)]
+    expected = pd.Series(closes).rolling(15).mean()
+
+    sma = SimpleMovingAverage(15)
+    for close, value in zip(closes, expected):
+        result = sma.update(close)
+        if math.isnan(value):
+            assert math.isnan(result)
+        else:
+            assert result == pytest.approx(value, abs=1e-9)
+
+
+def test_simple_moving_average_reset():
+    sma = SimpleMovingAverage(2)
+    sma.update(1)
+    sma.update(3)
+    assert sma.value == 2
+    sma.reset()
+    assert not sma.ready
+    assert math.isnan(sma.value)
+
+
+def test_simple_moving_average_invalid_window():
+    with pytest.raises(ValueError):
+        SimpleMovingAverage(0)
+
+
+def test_sma_matches_incremental_updates():
+    closes = [50000 + (i % 11) * 3.3 - (i % 5) * 7.1 for i in range(500)]
+    incremental = SimpleMovingAverage(50)
+    expected = [incremental.update(close) for close in closes]
+
+    result = sma(closes, 50)
+    assert math.isnan(result[48])
+    assert result[49:].tolist() == pytest.approx(expected[49:], abs=1e-9)
+
+
+def bars(size: int = 400, seed: int = 3):
+    generator = np.random.default_rng(seed)
+    close = 50000 + np.cumsum(generator.normal(0, 25, size))
+    high = close + generator.uniform(0, 20, size)
+    low = close - generator.uniform(0, 20, size)
+    volume = generator.uniform(0, 5, size)
+    volume[::17] = 0
+    return close, high, low, volume
+
+
+def streamed(indicator, *columns):
+    return np.array([indicator.update(*values) for values in zip(*columns)])
+
+
+def assert_same_series(result, expected):
+    assert np.array_equal(np.isnan(result), np.isnan(expected))
+    mask = ~np.isnan(expected)
+    assert result[mask] == pytest.approx(expected[mask], rel=1e-9)
+
+
+def test_ema_matches_pandas_after_the_seed():
+    close, *_ = bars()
+    result = ema(close, 20)
+    assert np.array_equal(
+        result, streamed(ExponentialMovingAverage(20), close), equal_nan=True
+    )
+
+    # Seeded with the simple average of the first window, then the usual recursion
+    seeded = np.concatenate(([close[:20].mean()], close[20:]))
+    expected = pd.Series(seeded).ewm(span=20, adjust=False).mean().to_numpy()
+    assert np.isnan(result[:19]).all()
+    assert result[19:] == pytest.approx(expected, rel=1e-12)
+
+
+def test_rolling_std_and_bollinger_bands_match_pandas():
+    close, *_ = bars()
+    expected = pd.Series(close).rolling(30).std().to_numpy()
+    assert_same_series(rolling_std(close, 30), expected)
+    assert_same_series(streamed(RollingStandardDeviation(30), close), expected)
+
+    middle, upper, lower = bollinger_bands(close, 30, k=2)
+    bands = BollingerBands(30, k=2)
+    for value in close:
+        bands.update(value)
+    deviation = pd.Series(close).rolling(30).std(ddof=0).iloc[-1]
+    assert (bands.value, bands.upper, bands.lower) == pytest.approx(
+        (middle[-1], upper[-1], lower[-1]), rel=1e-12
+    )
+    assert upper[-1] - middle[-1] == pytest.approx(2 * deviation, rel=1e-9)
+
+
+def test_rsi_batch_and_streaming_match():
+    close, *_ = bars()
+    result = rsi(close, 14)
+    assert np.array_equal(
+        result, streamed(RelativeStrengthIndex(14), close), equal_nan=True
+    )
+    assert np.isnan(result[:14]).all()
+    assert ((result[14:] >= 0) & (result[14:] <= 100)).all()
+
+    rising = RelativeStrengthIndex(3)
+    for value in (1, 2, 3, 4):
+        rising.update(value)
+    assert rising.value == 100
+
+
+def test_atr_batch_and_streaming_match():
+    close, high, low, _ = bars()
+    result = atr(high, low, close, 14)
+    assert np.array_equal(
+        result, streamed(AverageTrueRange(14), high, low, close), equal_nan=True
+    )
+
+    previous = np.concatenate(([np.nan], close[:-1]))
+    true_range = np.nanmax(
+        [high - low, np.abs(high - previous), np.abs(low - previous)], axis=0
+    )
+    assert result[13] == pytest.approx(true_range[:14].mean(), rel=1e-12)
+
+
+def test_vwap_batch_and_streaming_match():
+    close, _, _, volume = bars()
+    assert_same_series(
+        vwap(close, volume), streamed(VolumeWeightedAveragePrice(), close, volume)
+    )
+    rolling = vwap(close, volume, window=10)
+    assert_same_series(rolling, streamed(VolumeWeightedAveragePrice(10), close, volume))
+    assert rolling[-1] == pytest.approx(
+        (close[-10:] * volume[-10:]).sum() / volume[-10:].sum(), rel=1e-9
+    )
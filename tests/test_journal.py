@@ -0,0 +1,134 @@
+import asyncio
+import json
+import time
+
+import msgpack
+import pandas as pd
+
+from src.clients import PublisherClient
+from src.journal import BAR, QUOTE, Journal, read_journal
+from src.replay import ReplayStream, replay
+
+
+def stream_messages() -> list[dict]:
+    messages = []
+    for record in json.load(open("data/bars.json")):
+        messages.append(
+            {
+                "T": "b",
+                "S": record["symbol"],
+                "o": record["open"],
+                "h": record["high"],
+                "l": record["low"],
+                "c": record["close"],
+                "v": record["volume"],
+                "t": msgpack.Timestamp.from_unix_nano(
+                    pd.Timestamp(record["timestamp"]).value
+                ),
+                "n": record["num_trades"],
+                "vw": record["vwap"],
+                "x": record["exchange"],
+            }
+        )
+    return messages
+
+
+def test_journal_rotates_segments_and_reads_them_back_in_order(tmp_path):
+    messages = stream_messages()
+    journal = Journal(tmp_path, segment_size=4096)
+    for index, message in enumerate(messages):
+        journal.append(BAR, message, received=index)
+    journal.close()
+
+    assert len(journal.segments()) > 1
+    records = list(read_journal(tmp_path))
+    assert [received for received, _, _ in records] == list(range(len(messages)))
+    assert [message for _, _, message in records] == messages
+    assert [received for received, _, _ in read_journal(tmp_path, start=200)] == list(
+        range(200, len(messages))
+    )
+
+
+def test_truncated_record_is_skipped(tmp_path):
+    journal = Journal(tmp_path)
+    for index in range(3):
+        journal.append(QUOTE, {"S": "AAPL", "bp": float(index)}, received=index)
+    journal.close()
+    segment = journal.segments()[0]
+    segment.write_bytes(segment.read_bytes()[:-3])
+
+    assert [received for received, _, _ in read_journal(tmp_path)] == [0, 1]
+
+
+def test_publisher_journals_what_it_receives(tmp_path):
+    journal = Journal(tmp_path)
+    publisher = PublisherClient(stream=None, journal=journal)
+    messages = stream_messages()[:10]
+
+    async def receive():
+        for message in messages:
+            await publisher.bar_callback(message)
+
+    asyncio.run(receive())
+    publisher.on_frame(
+        [
+            {"T": "subscription"},
+            {"T": "q", "S": "BTCUSD", "bp": 1.0, "bs": 1, "ap": 2.0, "as": 1},
+        ]
+    )
+    journal.close()
+
+    records = list(read_journal(tmp_path))
+    assert [message for _, _, message in records[:10]] == messages
+    assert [kind for _, kind, _ in records[10:]] == [QUOTE]
+    assert publisher.queue.qsize() == 10
+
+
+def test_replay_stream_reproduces_the_gaps_at_the_given_speed(tmp_path):
+    journal = Journal(tmp_path)
+    for index in range(5):
+        journal.append(QUOTE, {"S": "AAPL", "bp": float(index)}, received=index * 10**8)
+    journal.append(QUOTE, {"S": "MSFT", "bp": 0.0}, received=5 * 10**8)
+    journal.close()
+
+    received = []
+
+    async def handler(message):
+        received.append((time.monotonic(), message["bp"]))
+
+    stream = ReplayStream(tmp_path, speed=10)
+    stream.subscribe_quotes(handler, "AAPL")
+    stream.run()
+
+    assert [price for _, price in received] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    # 400ms of recording at 10x
+    assert 0.035 < received[-1][0] - received[0][0] < 0.2
+    assert stream.replayed == 5
+
+
+def test_replay_runs_the_pipeline_offline(tmp_path):
+    journal = Journal(tmp_path)
+    messages = stream_messages()
+    for index, message in enumerate(messages):
+        journal.append(BAR, message, received=index * 60 * 10**9)
+    journal.close()
+
+    result = replay(
+        tmp_path,
+        speed=0,
+        specs=[
+            {
+                "strategy": "cross_moving_average",
+                "symbol": "BTCUSD",
+                "short_window": 2,
+                "long_window": 5,
+            }
+        ],
+        workers=1,
+        batch_size=1,
+    )
+
+    assert result["messages"] == len(messages)
+    assert result["queue"]["enqueued"] == len(messages)
+    assert result["fills"]
+    assert all(fill.symbol == "BTCUSD" for fill in result["fills"])
@@ -0,0 +1,40 @@
+import msgpack
+import pytest
+
+from src.mappings import decode_bar
+
+TIMESTAMP = msgpack.Timestamp(1638960000, 0)
+BAR = {
+    "T": "b",
+    "S": "AAPL",
+    "o": 1.0,
+    "h": 2.0,
+    "l": 0.5,
+    "c": 1.5,
+    "v": 100,
+    "t": TIMESTAMP,
+    "n": 10,
+    "vw": 1.2,
+}
+
+
+def test_messages_are_decoded_without_being_modified():
+    message = dict(BAR)
+    bar = decode_bar(message)
+
+    assert message == BAR
+    assert (bar.symbol, bar.close, bar.num_trades, bar.exchange) == (
+        "AAPL",
+        1.5,
+        10,
+        "",
+    )
+    assert bar.timestamp == TIMESTAMP
+    assert decode_bar({**BAR, "x": "CBSE"}).exchange == "CBSE"
+
+
+def test_missing_required_keys_raise():
+    message = dict(BAR)
+    del message["c"]
+    with pytest.raises(KeyError):
+        decode_bar(message)
@@ -0,0 +1,106 @@
+import asyncio
+import math
+from queue import Queue
+
+from src.clients import PublisherClient
+from src.market import ConflationBuffer
+from tests.helpers import Clock
+
+
+def test_only_the_latest_quote_is_kept():
+    market = ConflationBuffer()
+    for price in range(100):
+        market.update_quote("AAPL", price, 1, price + 1, 2)
+
+    snapshot = market.get("AAPL")
+    assert (snapshot.bid_price, snapshot.ask_price) == (99, 100)
+    assert snapshot.mid_price == 99.5
+    assert market.get("MSFT") is None
+
+
+def test_best_bid_and_ask_across_the_exchanges():
+    market = ConflationBuffer()
+    market.update_quote("BTCUSD", 100, 1, 103, 1, exchange="CBSE")
+    market.update_quote("BTCUSD", 101, 2, 104, 2, exchange="FTXU")
+    market.update_quote("BTCUSD", 99, 3, 102, 3, exchange="ERSX")
+
+    snapshot = market.get("BTCUSD")
+    assert (snapshot.bid_price, snapshot.bid_size) == (101, 2)
+    assert (snapshot.ask_price, snapshot.ask_size) == (102, 3)
+
+    # The next quote of an exchange replaces its previous one
+    market.update_quote("BTCUSD", 99, 3, 105, 3, exchange="ERSX")
+    assert market.get("BTCUSD").ask_price == 103
+
+
+def test_stale_quotes_are_left_out():
+    clock = Clock()
+    market = ConflationBuffer(max_age=5, clock=clock)
+    market.update_quote("BTCUSD", 101, 1, 102, 1, timestamp=1, exchange="CBSE")
+    clock.now = 3
+    market.update_quote("BTCUSD", 100, 1, 103, 1, timestamp=2, exchange="FTXU")
+    assert market.get("BTCUSD").ask_price == 102
+
+    clock.now = 6
+    snapshot = market.get("BTCUSD")
+    assert (snapshot.bid_price, snapshot.ask_price) == (100, 103)
+    assert snapshot.quote_timestamp == 2
+
+    clock.now = 9
+    snapshot = market.get("BTCUSD")
+    assert math.isnan(snapshot.bid_price) and math.isnan(snapshot.ask_price)
+    assert snapshot.quote_timestamp is None
+
+
+def test_reader_gets_the_vwap_of_the_trades_since_its_last_read():
+    market = ConflationBuffer()
+    reader = market.reader()
+    assert reader.read("AAPL")[0] is None
+
+    market.update_trade("AAPL", 100, 1)
+    market.update_trade("AAPL", 110, 3)
+    snapshot, vwap = reader.read("AAPL")
+    assert snapshot.last_price == 110
+    assert vwap == (100 + 110 * 3) / 4
+
+    # Nothing traded since the previous read
+    assert math.isnan(reader.read("AAPL")[1])
+
+    market.update_trade("AAPL", 90, 2)
+    assert reader.read("AAPL")[1] == 90
+    # Readers are independent
+    assert market.reader().read("AAPL")[1] == (100 + 330 + 180) / 6
+
+
+def test_publisher_feeds_the_buffer_instead_of_the_queue():
+    queue, market = Queue(), ConflationBuffer(exchanges=["CBSE"])
+    publisher = PublisherClient(stream=None, queue=queue, market=market)
+
+    quote = {"T": "q", "S": "BTCUSD", "bp": 10, "bs": 1, "ap": 11, "as": 2, "x": "CBSE"}
+    asyncio.run(publisher.quote_callback(quote))
+    asyncio.run(publisher.quote_callback({**quote, "ap": 50, "x": "FTXU"}))
+    trade = {"T": "t", "S": "BTCUSD", "p": 10.5, "s": 1, "x": "CBSE"}
+    asyncio.run(publisher.trade_callback(trade))
+
+    snapshot = market.get("BTCUSD")
+    assert snapshot.ask_price == 11
+    assert snapshot.last_price == 10.5
+    assert queue.empty()
+
+
+def test_publisher_handles_a_whole_frame():
+    queue, market = Queue(), ConflationBuffer()
+    publisher = PublisherClient(stream=None, queue=queue, market=market)
+    bar = {"T": "b", "S": "AAPL", "o": 1, "h": 1, "l": 1, "c": 1, "v": 1, "t": 0}
+    publisher.on_frame(
+        [
+            {"T": "q", "S": "AAPL", "bp": 10, "bs": 1, "ap": 11, "as": 2},
+            {"T": "t", "S": "AAPL", "p": 10.5, "s": 1},
+            {**bar, "n": 1, "vw": 1},
+            {"T": "subscription"},
+        ]
+    )
+
+    assert market.get("AAPL").last_price == 10.5
+    assert queue.get_nowait().symbol == "AAPL"
+    assert queue.empty()
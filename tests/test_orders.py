@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+from alpaca.clients import APIError
+from src.clients import PublisherClient
+from src.orders import OrderGateway, client_order_id
+from tests.helpers import Clock
+
+
+class FakeAsyncAPI:
+    def __init__(self, responses, delay=0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = []
+        self.statuses = {}
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    async def place_order(self, **params):
+        self.requests.append(params)
+        await asyncio.sleep(self.delay)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return SimpleNamespace(status=response, **params)
+
+    async def get_order_by_client_id(self, client_order_id):
+        if client_order_id in self.statuses:
+            return SimpleNamespace(
+                status=self.statuses[client_order_id], client_order_id=client_order_id
+            )
+        if not any(
+            request["client_order_id"] == client_order_id
+            for request in self.requests[:-1]
+        ):
+            raise APIError(404, "order not found")
+        return SimpleNamespace(status="filled", client_order_id=client_order_id)
+
+
+def make_gateway(responses, clock=time.monotonic, **kwargs):
+    api = FakeAsyncAPI(responses, **kwargs)
+    gateway = OrderGateway(
+        api, max_attempts=3, retry_base=0.001, retry_cap=0.01, clock=clock
+    )
+    return api, gateway
+
+
+def receive(gateway, event, status) -> None:
+    # As received by the handler of the stream with raw_data
+    update = {
+        "stream": "trade_updates",
+        "data": {
+            "event": event,
+            "order": {"client_order_id": "id-1", "status": status},
+        },
+    }
+    publisher = PublisherClient(stream=None, orders=gateway)
+    asyncio.run(publisher.trade_update_callback(update))
+
+
+def test_client_order_id_is_deterministic():
+    first = client_order_id("AAPL", "buy", "2021-12-08T10:40:00Z", prefix="cma")
+    assert first == client_order_id("AAPL", "buy", "2021-12-08T10:40:00Z", "cma")
+    assert first != client_order_id("AAPL", "sell", "2021-12-08T10:40:00Z", "cma")
+    assert first != client_order_id("AAPL", "buy", "2021-12-08T10:41:00Z", "cma")
+    assert len(first) <= 128
+
+
+def test_submit_returns_immediately_and_deduplicates():
+    api, gateway = make_gateway(["accepted"], delay=0.2)
+
+    started = time.monotonic()
+    tracked = gateway.submit("id-1", symbol="AAPL", side="buy", qty=1, type="market")
+    again = gateway.submit("id-1", symbol="AAPL", side="buy", qty=1, type="market")
+    assert time.monotonic() - started < 0.1
+    assert again is tracked
+    assert gateway.open_orders("AAPL", "buy") == [tracked]
+
+    assert tracked.future.result(timeout=2).status == "accepted"
+    assert len(api.requests) == 1
+    assert api.requests[0]["client_order_id"] == "id-1"
+
+    receive(gateway, "fill", "filled")
+    assert tracked.status == "filled"
+    assert gateway.open_orders() == []
+
+
+def test_orders_left_open_are_reconciled():
+    clock = Clock()
+    api, gateway = make_gateway(["accepted"], clock=clock)
+    gateway.reconcile_after = 60
+    tracked = gateway.submit("id-1", symbol="AAPL", side="buy", qty=1, type="market")
+    tracked.future.result(timeout=2)
+
+    # The fill was missed: the order is looked up once it stayed open too long
+    api.statuses["id-1"] = "filled"
+    clock.now = 30
+    assert gateway.open_orders("AAPL", "buy") == [tracked]
+    clock.now = 61
+    assert gateway.open_orders("AAPL", "buy") == [tracked]
+    deadline = time.monotonic() + 2
+    while gateway.open_orders("AAPL", "buy") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert tracked.status == "filled"
+    assert gateway.open_orders() == []
+
+
+def test_concurrent_submits_of_the_same_id_share_the_order():
+    api, gateway = make_gateway(["accepted"], delay=0.05)
+    barrier, submitted = threading.Barrier(8), []
+
+    def submit():
+        barrier.wait()
+        submitted.append(
+            gateway.submit("id-6", symbol="AAPL", side="buy", qty=1, type="market")
+        )
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(tracked is submitted[0] for tracked in submitted)
+    assert all(
+        tracked.future.result(timeout=2).status == "accepted" for tracked in submitted
+    )
+    assert len(api.requests) == 1
+
+
+def test_throttled_and_failed_requests_are_retried():
+    api, gateway = make_gateway(
+        [APIError(429, "rate limit"), APIError(503, "unavailable"), "new"]
+    )
+    tracked = gateway.submit("id-2", symbol="AAPL", side="buy", qty=1, type="market")
+    assert tracked.future.result(timeout=2).status == "new"
+    assert tracked.attempts == 3
+    assert {request["client_order_id"] for request in api.requests} == {"id-2"}
+
+
+def test_rejected_orders_are_not_retried():
+    api, gateway = make_gateway([APIError(403, "insufficient buying power")])
+    tracked = gateway.submit("id-3", symbol="AAPL", side="buy", qty=1, type="market")
+    assert tracked.future.result(timeout=2).status == "failed"
+    assert "insufficient" in tracked.error
+    assert len(api.requests) == 1
+
+
+def test_duplicate_after_a_network_error_resolves_the_existing_order():
+    api, gateway = make_gateway(
+        [aiohttp.ClientConnectionError("reset"), APIError(422, "duplicate")]
+    )
+    tracked = gateway.submit("id-4", symbol="AAPL", side="buy", qty=1, type="market")
+    assert tracked.future.result(timeout=2).status == "filled"
+    assert tracked.attempts == 2
+
+
+def test_resubmitted_order_resolves_the_existing_order():
+    api, gateway = make_gateway(
+        [APIError(500, "error")] * 3 + [APIError(422, "duplicate")]
+    )
+    failed = gateway.submit("id-7", symbol="AAPL", side="buy", qty=1, type="market")
+    assert failed.future.result(timeout=2).status == "failed"
+
+    # The last attempt reached the broker after all, resubmitting finds the order
+    tracked = gateway.submit("id-7", symbol="AAPL", side="buy", qty=1, type="market")
+    assert tracked is not failed
+    assert tracked.future.result(timeout=2).status == "filled"
+    assert tracked.attempts == 1
+
+
+def test_invalid_orders_fail_on_422():
+    api, gateway = make_gateway([APIError(422, "qty must be > 0")])
+    tracked = gateway.submit("id-8", symbol="AAPL", side="buy", qty=0, type="market")
+    assert tracked.future.result(timeout=2).status == "failed"
+    assert "qty" in tracked.error
+    assert len(api.requests) == 1
+
+
+@pytest.mark.parametrize("attempts", [1, 3])
+def test_orders_fail_after_the_last_attempt(attempts):
+    api = FakeAsyncAPI([APIError(500, "error")] * attempts)
+    gateway = OrderGateway(api, max_attempts=attempts, retry_base=0.001)
+    tracked = gateway.submit("id-5", symbol="AAPL", side="buy", qty=1, type="market")
+    assert tracked.future.result(timeout=2).status == "failed"
+    assert len(api.requests) == attempts
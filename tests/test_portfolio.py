@@ -0,0 +1,138 @@
+import asyncio
+import dataclasses
+import threading
+import time
+
+import pytest
+from alpaca_trade_api.entity import Entity
+
+from alpaca.entities import Account, Order
+from src.helpers import get_position, get_target_position
+from src.clients import PublisherClient
+from src.portfolio import PortfolioCache
+from tests.helpers import Clock
+
+
+def record(entity_class, **values) -> dict:
+    data = {field.name: None for field in dataclasses.fields(entity_class)}
+    data.update(values)
+    return data
+
+
+class FakeAPI:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.on_positions = None
+
+    def get_account(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return record(Account, cash="10000")
+
+    def get_positions(self, symbol=None):
+        if self.on_positions is not None:
+            self.on_positions()
+        return []
+
+    def get_orders(self):
+        return []
+
+
+def trade_update(event, side, qty=None, price=None, position_qty=None) -> dict:
+    update = {
+        "event": event,
+        "order": record(Order, id="1", symbol="AAPL", side=side, status=event),
+    }
+    if qty is not None:
+        update.update(qty=str(qty), price=str(price), position_qty=str(position_qty))
+    # As received by the handler of the stream with raw_data
+    return {"stream": "trade_updates", "data": update}
+
+
+def receive(portfolio, update) -> None:
+    publisher = PublisherClient(stream=None, portfolio=portfolio)
+    asyncio.run(publisher.trade_update_callback(update))
+
+
+def test_fills_update_cash_and_positions_without_polling():
+    api, clock = FakeAPI(), Clock()
+    portfolio = PortfolioCache(api, ttl=60, clock=clock)
+    assert get_position(portfolio, "AAPL") is None
+    assert api.calls == 1
+
+    receive(portfolio, trade_update("new", "buy"))
+    assert [order.id for order in portfolio.get_orders()] == ["1"]
+
+    receive(portfolio, trade_update("partial_fill", "buy", 5, 100, 5))
+    receive(portfolio, trade_update("fill", "buy", 5, 110, 10))
+    position = get_position(portfolio, "AAPL")
+    assert position.qty == 10
+    assert position.avg_entry_price == pytest.approx(105)
+    assert portfolio.cash == pytest.approx(10000 - 1050)
+    assert get_target_position(portfolio, 100) == round(8950 / 100 * 0.8, 2)
+    assert portfolio.get_orders() == []
+
+    portfolio.mark("AAPL", 100)
+    assert get_position(portfolio, "AAPL").unrealized_pl == pytest.approx(-50)
+
+    receive(portfolio, trade_update("fill", "sell", 10, 120, 0))
+    assert get_position(portfolio, "AAPL") is None
+    assert portfolio.cash == pytest.approx(10150)
+    assert api.calls == 1
+
+
+def test_state_is_reloaded_when_no_update_arrives_before_the_ttl():
+    api, clock = FakeAPI(), Clock()
+    portfolio = PortfolioCache(api, ttl=60, clock=clock)
+    portfolio.account
+    clock.now = 30
+    receive(portfolio, trade_update("fill", "buy", 1, 100, 1))
+
+    clock.now = 80
+    assert portfolio.cash == pytest.approx(9900)
+    assert api.calls == 1
+
+    clock.now = 91
+    assert portfolio.cash == pytest.approx(10000)
+    assert api.calls == 2
+
+
+def test_concurrent_stale_reads_share_a_single_refresh():
+    api = FakeAPI(delay=0.05)
+    portfolio = PortfolioCache(api, ttl=60)
+    portfolio.prefetch()
+    readers = [threading.Thread(target=lambda: portfolio.cash) for _ in range(5)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+
+    assert api.calls == 1
+
+
+def test_refresh_is_discarded_when_an_update_arrives_meanwhile():
+    api, clock = FakeAPI(), Clock()
+    portfolio = PortfolioCache(api, ttl=60, clock=clock)
+    portfolio.account
+
+    clock.now = 61
+    # The fill is applied after the REST API returned the account, which does not include it
+    api.on_positions = lambda: receive(
+        portfolio, trade_update("fill", "buy", 1, 100, 1)
+    )
+    assert portfolio.cash == pytest.approx(9900)
+    assert get_position(portfolio, "AAPL").qty == 1
+    assert api.calls == 2
+
+
+def test_entity_trade_updates_are_applied():
+    api, clock = FakeAPI(), Clock()
+    portfolio = PortfolioCache(api, ttl=60, clock=clock)
+    portfolio.account
+
+    # Without raw_data, the stream hands an Entity of the data
+    receive(portfolio, Entity(trade_update("fill", "buy", 2, 100, 2)["data"]))
+    assert get_position(portfolio, "AAPL").qty == 2
+    assert portfolio.cash == pytest.approx(9800)
+    assert portfolio.updated_at is not None
@@ -0,0 +1,78 @@
+import queue
+import threading
+
+import pytest
+
+from src.queues import MarketDataQueue
+from tests.helpers import Clock, make_bar
+
+
+def drain(q: MarketDataQueue) -> list:
+    items = []
+    while not q.empty():
+        items.append(q.get_nowait())
+        q.task_done()
+    return items
+
+
+def test_drop_oldest_keeps_the_latest_messages():
+    q = MarketDataQueue(maxsize=3, policy="drop_oldest")
+    for close in range(5):
+        q.put(make_bar("AAPL", close))
+
+    assert q.depth == 3
+    assert [bar.close for bar in drain(q)] == [2, 3, 4]
+    assert q.stats.dropped == 2
+    # Dropped messages do not hold join() forever
+    q.join()
+
+
+def test_conflate_replaces_the_pending_message_of_the_same_symbol():
+    q = MarketDataQueue(maxsize=3, policy="conflate")
+    q.put(make_bar("AAPL", 1))
+    q.put(make_bar("MSFT", 1))
+    q.put(make_bar("AAPL", 2))
+    q.put(make_bar("AAPL", 3))
+    q.put(make_bar("TSLA", 1))
+
+    # AAPL 2 is replaced by AAPL 3, TSLA has nothing to replace so the oldest message is dropped
+    assert [(bar.symbol, bar.close) for bar in drain(q)] == [
+        ("MSFT", 1),
+        ("AAPL", 3),
+        ("TSLA", 1),
+    ]
+    assert q.stats.conflated == 1
+    assert q.stats.dropped == 1
+
+
+def test_block_waits_for_room():
+    q = MarketDataQueue(maxsize=1, policy="block")
+    q.put(make_bar("AAPL", 1))
+    with pytest.raises(queue.Full):
+        q.put(make_bar("AAPL", 2), timeout=0.01)
+
+    consumer = threading.Timer(0.05, q.get)
+    consumer.start()
+    q.put(make_bar("AAPL", 3))
+    consumer.join()
+    assert q.get().close == 3
+    assert q.stats.blocked == 2
+    assert q.stats.dropped == 0
+
+
+def test_latency_between_enqueue_and_dequeue_is_measured():
+    clock = Clock()
+    q = MarketDataQueue(maxsize=10, clock=clock)
+    q.put(make_bar("AAPL", 1))
+    q.put(make_bar("AAPL", 2))
+    clock.now = 0.5
+    q.get()
+    clock.now = 1.5
+    q.get()
+
+    snapshot = q.snapshot()
+    assert snapshot["latency_last"] == 1.5
+    assert snapshot["latency_max"] == 1.5
+    assert snapshot["latency_avg"] == 1.0
+    assert snapshot["max_depth"] == 2
+    assert snapshot["depth"] == 0
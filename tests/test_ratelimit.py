@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from alpaca.ratelimit import (
+    ACCOUNT,
+    DATA,
+    ORDERS,
+    AsyncRequestCoalescer,
+    RateLimiter,
+    RequestCoalescer,
+    request_priority,
+)
+from tests.helpers import Clock
+
+
+def test_request_priority():
+    data_url = "https://data.alpaca.markets/"
+    base_url = "https://paper-api.alpaca.markets"
+    assert request_priority("POST", f"{base_url}/v2/orders", data_url) == ORDERS
+    assert request_priority("GET", f"{base_url}/v2/orders", data_url) == ACCOUNT
+    assert request_priority("GET", f"{base_url}/v2/account", data_url) == ACCOUNT
+    assert request_priority("GET", f"{data_url}/v2/stocks/bars", data_url) == DATA
+
+
+def test_lower_priorities_leave_the_reserve_to_orders():
+    clock = Clock()
+    limiter = RateLimiter(rate=1, capacity=5, reserve=2, clock=clock)
+
+    for _ in range(3):
+        assert limiter.try_acquire(DATA) == 0
+    # Two tokens left, kept for orders and (one of them) for account queries
+    assert limiter.try_acquire(DATA) == pytest.approx(1.0)
+    assert limiter.try_acquire(ACCOUNT) == 0
+    assert limiter.try_acquire(ACCOUNT) > 0
+    assert limiter.try_acquire(ORDERS) == 0
+    assert limiter.remaining == 0
+    assert limiter.waits == 2
+
+    clock.now = 10.0
+    assert limiter.remaining == 5
+
+
+def test_headers_lower_the_bucket():
+    limiter = RateLimiter(rate=1, capacity=50, clock=Clock())
+    limiter.update({"X-RateLimit-Remaining": "3"})
+    assert limiter.remaining == 3
+    limiter.update({})
+    limiter.update(None)
+    assert limiter.remaining == 3
+
+
+def test_acquire_times_out():
+    limiter = RateLimiter(rate=1000, capacity=1)
+    assert limiter.acquire(DATA)
+    assert limiter.acquire(DATA, timeout=1.0)
+    limiter = RateLimiter(rate=0.01, capacity=1)
+    limiter.acquire()
+    assert not limiter.acquire(DATA, timeout=0.01)
+
+
+def test_concurrent_requests_are_coalesced():
+    coalescer = RequestCoalescer()
+    calls = []
+    started = threading.Event()
+
+    def fetch(symbol):
+        calls.append(symbol)
+        started.set()
+        time.sleep(0.1)
+        return {"symbol": symbol, "bars": [1, 2]}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(coalescer.run("k", fetch, "A")))
+        for _ in range(4)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["A"]
+    assert coalescer.coalesced == 3
+    assert all(result == {"symbol": "A", "bars": [1, 2]} for result in results)
+    # Every caller gets its own copy
+    assert len({id(result) for result in results}) == 4
+    assert coalescer.pending == {}
+
+
+def test_errors_reach_every_caller():
+    coalescer = RequestCoalescer()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        coalescer.run("k", fail)
+    assert coalescer.pending == {}
+
+
+def test_async_requests_are_coalesced():
+    coalescer = AsyncRequestCoalescer()
+    calls = []
+
+    async def fetch(symbol):
+        calls.append(symbol)
+        await asyncio.sleep(0.01)
+        return [symbol]
+
+    async def main():
+        return await asyncio.gather(
+            coalescer.run("a", fetch, "A"),
+            coalescer.run("a", fetch, "A"),
+            coalescer.run("b", fetch, "B"),
+        )
+
+    assert asyncio.run(main()) == [["A"], ["A"], ["B"]]
+    assert calls == ["A", "B"]
+    assert coalescer.coalesced == 1
+    assert coalescer.pending == {}
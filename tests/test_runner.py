@@ -0,0 +1,63 @@
+import pytest
+
+from src.base import Strategy
+from src.indicators import SimpleMovingAverage
+from src.registry import create_strategy, register
+from src.runner import build_runners
+from src.strategies import CrossMovingAverage
+from tests.helpers import FakeAPI, load_bars
+
+
+@register("failing")
+class FailingStrategy(Strategy):
+    def __init__(self, symbol, **_):
+        self.symbol = symbol
+
+    def apply(self, bar):
+        raise RuntimeError("Boom")
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError, match="cross_moving_average"):
+        create_strategy("unknown", symbol="BTCUSD")
+
+
+def test_strategies_of_a_symbol_share_indicators_and_history():
+    bars = load_bars()
+    api = FakeAPI(bars)
+    api.visible = 60
+    runners = build_runners(
+        [
+            {"strategy": "cross_moving_average", "symbol": "BTCUSD"},
+            {
+                "strategy": "cross_moving_average",
+                "symbol": "BTCUSD",
+                "short_window": 5,
+                "long_window": 15,
+            },
+            {"strategy": "failing", "symbol": "BTCUSD"},
+            {"strategy": "cross_moving_average", "symbol": "ETHUSD"},
+        ],
+        api=api,
+        crypto=True,
+        allowed_crypto_exchanges=["CBSE"],
+    )
+    assert set(runners) == {"BTCUSD", "ETHUSD"}
+
+    runner = runners["BTCUSD"]
+    default, fast, _ = runner.strategies
+    assert isinstance(default, CrossMovingAverage)
+    # SMA 5, 15 and 50: the 15 periods average is shared by both strategies
+    assert len(runner.indicators) == 3
+    assert default.short_ma is fast.long_ma
+
+    for index in range(59, 80):
+        api.visible = index + 1
+        runner.apply(bars[index])
+
+    # One warm-up for the whole symbol and each bar pushed once
+    assert api.history_calls == 1
+    expected = SimpleMovingAverage(15)
+    for bar in bars[:80]:
+        expected.update(bar.close)
+    assert default.short_ma.value == pytest.approx(expected.value)
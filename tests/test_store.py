@@ -0,0 +1,120 @@
+import datetime
+
+from alpaca.store import BarStore, parse_timeframe
+from tests.helpers import make_bar, minutes
+
+
+def test_parse_timeframe():
+    assert parse_timeframe("1Min") == datetime.timedelta(minutes=1)
+    assert parse_timeframe("15Min") == datetime.timedelta(minutes=15)
+    assert parse_timeframe("1Day") == datetime.timedelta(days=1)
+
+
+def test_missing_ranges_are_only_the_gaps():
+    store = BarStore()
+    assert store.missing("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(60)) == [
+        (minutes(0), minutes(60))
+    ]
+
+    store.extend(
+        [make_bar(minute=minute, exchange="CBSE") for minute in range(0, 30)], "1Min"
+    )
+    store.add_coverage("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(29))
+
+    assert store.missing("BTCUSD", "1Min", ["CBSE"], minutes(10), minutes(20)) == []
+    assert store.missing("BTCUSD", "1Min", ["CBSE"], minutes(10), minutes(60)) == [
+        (minutes(29), minutes(60))
+    ]
+    # Another exchange was never fetched
+    assert store.missing(
+        "BTCUSD", "1Min", ["CBSE", "FTX"], minutes(10), minutes(20)
+    ) == [(minutes(10), minutes(20))]
+
+
+def test_streamed_bars_extend_coverage():
+    store = BarStore()
+    store.add_coverage("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(29))
+    store.append(make_bar(minute=30, exchange="CBSE"), "1Min")
+    store.append(make_bar(minute=31, exchange="CBSE"), "1Min")
+
+    assert store.missing("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(31)) == []
+
+
+def test_query_filters_exchanges_and_sorts():
+    store = BarStore()
+    store.extend(
+        [
+            make_bar(minute=1, exchange="FTX"),
+            make_bar(minute=0, exchange="CBSE"),
+            make_bar(minute=2, exchange="CBSE"),
+        ],
+        "1Min",
+    )
+    store.extend([make_bar(minute=2, exchange="CBSE", close=101.0)], "1Min")
+
+    bars = store.query("BTCUSD", "1Min", None, minutes(0), minutes(2))
+    assert [bar.exchange for bar in bars] == ["CBSE", "FTX", "CBSE"]
+    assert bars[-1].close == 101.0
+
+    bars = store.query("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(1))
+    assert len(bars) == 1
+
+
+def test_store_is_persisted(tmp_path):
+    store = BarStore(tmp_path)
+    store.extend(
+        [make_bar(minute=minute, exchange="CBSE") for minute in range(10)], "1Min"
+    )
+    store.add_coverage("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(9))
+    store.close()
+
+    store = BarStore(tmp_path)
+    bars = store.query("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(9))
+    assert len(bars) == 10
+    assert bars[3].timestamp == minutes(3)
+    assert store.missing("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(9)) == []
+
+
+def test_streamed_bar_of_one_exchange_does_not_cover_the_others():
+    store = BarStore()
+    store.add_coverage("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(29))
+    store.add_coverage("BTCUSD", "1Min", None, minutes(0), minutes(29))
+    store.append(make_bar(minute=30, exchange="CBSE"), "1Min")
+
+    assert store.missing("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(30)) == []
+    assert store.missing("BTCUSD", "1Min", None, minutes(0), minutes(30)) == [
+        (minutes(29), minutes(30))
+    ]
+    # Consolidated bars (stocks) have no exchange, they complete the minute
+    store.append(make_bar(minute=30, exchange=""), "1Min")
+    assert store.missing("BTCUSD", "1Min", None, minutes(0), minutes(30)) == []
+
+
+def test_log_is_compacted_when_loaded(tmp_path):
+    store = BarStore(tmp_path)
+    store.extend(
+        [make_bar(minute=minute, exchange="CBSE") for minute in range(10)], "1Min"
+    )
+    store.extend(
+        [make_bar(minute=minute, exchange="CBSE", close=101.0) for minute in range(10)],
+        "1Min",
+    )
+    store.add_coverage("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(9))
+    for minute in range(10, 20):
+        store.append(make_bar(minute=minute, exchange="CBSE"), "1Min")
+    store.close()
+    path = store.log_path("BTCUSD", "1Min")
+    size = path.stat().st_size
+
+    store = BarStore(tmp_path)
+    bars = store.query("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(19))
+    assert len(bars) == 20
+    assert bars[0].close == 101.0
+    assert path.stat().st_size < size
+
+    # The compacted log loads the same state, and is appended to
+    store.append(make_bar(minute=20, exchange="CBSE"), "1Min")
+    store.close()
+    store = BarStore(tmp_path)
+    assert len(store.query("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(20))) == 21
+    assert store.missing("BTCUSD", "1Min", ["CBSE"], minutes(0), minutes(20)) == []
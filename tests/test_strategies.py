@@ -0,0 +1,103 @@
+import pandas as pd
+import pytest
+
+from src.market import ConflationBuffer
+from src.strategies import CrossMovingAverage
+from tests.helpers import Clock, FakeAPI, load_bars
+
+
+def test_cross_moving_average_matches_pandas_rolling_means():
+    bars = load_bars()
+    api = FakeAPI(bars)
+    api.visible = 60
+    strategy = CrossMovingAverage(
+        api, "BTCUSD", crypto=True, allowed_crypto_exchanges=["CBSE"]
+    )
+
+    for index in range(60, len(bars)):
+        api.visible = index + 1
+        strategy.apply(bars[index])
+
+        closes = pd.Series([bar.close for bar in bars[: index + 1]])
+        assert round(strategy.short_ma.value, 6) == round(
+            closes.rolling(15).mean().iloc[-1], 6
+        )
+        assert round(strategy.long_ma.value, 6) == round(
+            closes.rolling(50).mean().iloc[-1], 6
+        )
+
+    # History is only fetched once, every following bar is contiguous
+    assert api.history_calls == 1
+
+
+def test_cross_moving_average_resyncs_on_gap():
+    bars = load_bars()
+    api = FakeAPI(bars)
+    api.visible = 60
+    strategy = CrossMovingAverage(
+        api, "BTCUSD", crypto=True, allowed_crypto_exchanges=["CBSE"]
+    )
+    strategy.apply(bars[59])
+    assert api.history_calls == 1
+
+    api.visible = 70
+    strategy.apply(bars[69])
+    assert api.history_calls == 2
+    assert strategy.long_ma.value == pytest.approx(
+        sum(bar.close for bar in bars[20:70]) / 50
+    )
+
+
+def test_cross_moving_average_evaluates_a_backlog_once():
+    bars = load_bars()
+    api = FakeAPI(bars)
+    api.visible = 60
+    strategy = CrossMovingAverage(
+        api, "BTCUSD", crypto=True, allowed_crypto_exchanges=["CBSE"]
+    )
+    strategy.apply(bars[59])
+    evaluations = []
+    strategy.evaluate = lambda bar, position: evaluations.append(bar)
+
+    api.visible = 80
+    strategy.apply_batch(bars[60:80])
+
+    # The contiguous backlog does not trigger a resync and is evaluated with the latest bar only
+    assert api.history_calls == 1
+    assert evaluations == [bars[79]]
+    assert strategy.long_ma.value == pytest.approx(
+        sum(bar.close for bar in bars[30:80]) / 50
+    )
+
+
+def test_cross_moving_average_sizes_orders_with_the_best_fresh_ask():
+    bars = load_bars()
+    clock = Clock()
+    market = ConflationBuffer(max_age=10, clock=clock)
+    assert CrossMovingAverage(FakeAPI(bars), "BTCUSD").entry_price(bars[0]) == (
+        bars[0].high
+    )
+    strategy = CrossMovingAverage(FakeAPI(bars), "BTCUSD", market=market)
+    assert strategy.entry_price(bars[0]) == bars[0].close
+
+    market.update_quote("BTCUSD", 100, 1, 101, 1)
+    assert strategy.entry_price(bars[0]) == 101
+
+    clock.now = 11
+    assert strategy.entry_price(bars[0]) == bars[0].close
+
+
+def test_exchange_missing_from_the_history_is_not_a_gap():
+    bars = load_bars()
+    api = FakeAPI(bars)
+    api.visible = 60
+    strategy = CrossMovingAverage(
+        api, "BTCUSD", crypto=True, allowed_crypto_exchanges=["CBSE", "FTX"]
+    )
+    strategy.apply(bars[59])
+    assert api.history_calls == 1
+
+    # The history only has CBSE bars, the first FTX bar starts that exchange
+    strategy.apply(load_bars("FTX")[0])
+    assert api.history_calls == 1
+    assert not strategy.is_gap(bars[60])
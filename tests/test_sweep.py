@@ -0,0 +1,46 @@
+import pytest
+
+from src.backtest import Backtester
+from src.strategies import CrossMovingAverage
+from src.sweep import sweep
+from tests.helpers import random_walk
+
+pytestmark = pytest.mark.usefixtures("quiet_strategy_logs")
+
+
+def test_sweep_matches_the_backtester_for_every_combination():
+    bars = random_walk(3000)
+    results = sweep(
+        bars,
+        short_windows=[3, 8],
+        long_windows=[8, 21],
+        stop_losses=[-2, None],
+        take_profits=[3],
+        workers=2,
+    )
+
+    # (8, 8) is skipped
+    assert len(results) == 6
+    assert [result.pnl for result in results] == sorted(
+        (result.pnl for result in results), reverse=True
+    )
+
+    for result in results:
+
+        def factory(api):
+            strategy = CrossMovingAverage(
+                api,
+                bars.symbol,
+                short_window=result.short_window,
+                long_window=result.long_window,
+            )
+            strategy.stop_loss, strategy.take_profit = (
+                result.stop_loss,
+                result.take_profit,
+            )
+            return strategy
+
+        expected = Backtester(factory, bars).run_vectorized()
+        assert result.pnl == expected.pnl
+        assert result.max_drawdown == expected.max_drawdown
+        assert result.trades == expected.trades
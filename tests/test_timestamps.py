@@ -0,0 +1,81 @@
+import datetime
+
+import msgpack
+import pandas as pd
+import pytest
+
+from alpaca.entities import EntityFactory
+from alpaca.timestamps import (
+    from_nanoseconds,
+    parse_rfc3339,
+    parse_rfc3339_array,
+    parse_rfc3339_ns,
+    to_nanoseconds,
+)
+
+UTC = datetime.timezone.utc
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "2021-12-08T10:40:00Z",
+        "2021-12-08T10:40:00.5Z",
+        "2021-12-08T10:40:00.123456Z",
+        "2021-12-08T10:40:00.123456789Z",
+        "2021-12-08T12:40:00.123+02:00",
+    ],
+)
+def test_parse_rfc3339_matches_pandas(value):
+    expected = pd.Timestamp(value)
+
+    assert parse_rfc3339_ns(value) == expected.value
+    assert parse_rfc3339(value) == expected.floor("us").to_pydatetime()
+    assert parse_rfc3339(value).tzinfo is not None
+
+
+def test_parse_rfc3339_array():
+    values = ["2021-12-08T10:40:00Z", "2021-12-08T10:41:00.000000001Z"]
+    assert parse_rfc3339_array(values).tolist() == [
+        parse_rfc3339_ns(value) for value in values
+    ]
+
+    mixed = values + ["2021-12-08T12:42:00+02:00"]
+    assert parse_rfc3339_array(mixed).tolist()[-1] == pd.Timestamp(mixed[-1]).value
+
+
+def test_to_nanoseconds():
+    moment = datetime.datetime(2021, 12, 8, 10, 40, 0, 123456, tzinfo=UTC)
+    expected = pd.Timestamp(moment).value
+
+    assert to_nanoseconds(moment) == expected
+    assert to_nanoseconds(pd.Timestamp(moment)) == expected
+    assert to_nanoseconds(msgpack.ext.Timestamp.from_unix_nano(expected)) == expected
+    assert from_nanoseconds(expected) == moment
+
+
+def test_entity_factory_only_parses_declared_fields():
+    order = {
+        "id": "1",
+        "status": "2021-12-08T10:40:00Z",
+        "created_at": "2021-12-08T10:40:00.123456789Z",
+    }
+    data = EntityFactory.cast_attributes(order, "orders")
+
+    assert data["status"] == "2021-12-08T10:40:00Z"
+    assert data["created_at"] == datetime.datetime(
+        2021, 12, 8, 10, 40, 0, 123456, tzinfo=UTC
+    )
+
+
+def test_create_entities_parses_timestamps_in_bulk():
+    records = [
+        dict(symbol="AAPL", t=f"2021-12-08T10:4{minute}:00Z", o=1, h=1, l=1, c=1)
+        for minute in range(3)
+    ]
+    for record in records:
+        record.update(v=1, n=1, vw=1)
+    bars = EntityFactory.create_entities(records, "bars")
+
+    assert [bar.timestamp.minute for bar in bars] == [40, 41, 42]
+    assert bars[0].timestamp.tzinfo is not None
@@ -0,0 +1,79 @@
+import json
+import socket
+import urllib.request
+
+from alpaca.entities import Bar
+from src.metrics import MetricsExporter
+from src.queues import MarketDataQueue
+from src.tracing import LatencyHistogram, Tracer
+from tests.helpers import Clock
+
+MS = 1_000_000
+
+
+def test_histogram_percentiles_are_within_the_bucket_precision():
+    histogram = LatencyHistogram()
+    for millisecond in range(1, 1001):
+        histogram.record(millisecond * MS)
+
+    assert histogram.count == 1000
+    for percentile in (50, 90, 99):
+        expected = percentile * 10 * MS
+        assert abs(histogram.percentile(percentile) - expected) / expected < 0.01
+    assert histogram.percentile(100) == 1000 * MS
+    # Clock skew does not break the histogram
+    histogram.record(-5)
+    assert histogram.min == 0
+
+
+def test_stamps_feed_stage_and_exchange_histograms():
+    bar = Bar("AAPL", "1970-01-01T00:00:01Z", 1, 1, 1, 1, 1, 1, 1)
+    clock = Clock(1_000 * MS)
+    tracer = Tracer(clock=clock)
+
+    tracer.stamp(bar, "receive")
+    clock.now += 2 * MS
+    tracer.stamp(bar, "enqueue")
+    assert bar.trace["receive"] == 1_000 * MS
+
+    snapshot = tracer.snapshot()
+    assert snapshot["receive->enqueue"]["max"] == 2
+    assert snapshot["exchange->enqueue"]["max"] == 2
+    assert snapshot["exchange->receive"]["count"] == 1
+
+    # A trace is continued on another entity, e.g. an order
+    order = type("Order", (), {"trace": None})()
+    clock.now += 3 * MS
+    tracer.stamp(order, "order_submit", bar.trace)
+    assert tracer.snapshot()["enqueue->order_submit"]["max"] == 3
+    assert "order_submit" not in bar.trace
+
+
+def test_disabled_tracer_records_nothing():
+    bar = Bar("AAPL", "1970-01-01T00:00:01Z", 1, 1, 1, 1, 1, 1, 1)
+    tracer = Tracer(enabled=False)
+    tracer.stamp(bar, "receive")
+    with tracer.span("fetch_position"):
+        pass
+    assert tracer.histograms == {}
+    assert not hasattr(bar, "trace")
+
+
+def test_metrics_endpoint():
+    tracer = Tracer()
+    tracer.record("receive->enqueue", MS)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    exporter = MetricsExporter(tracer, MarketDataQueue(), port=port, interval=0)
+    exporter.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            metrics = json.load(response)
+    finally:
+        exporter.stop()
+
+    assert metrics["latency_ms"]["receive->enqueue"]["count"] == 1
+    assert metrics["queue"]["depth"] == 0
+    assert "receive->enqueue: n=1" in exporter.summary()